@@ -0,0 +1,120 @@
+"""
+Throughput benchmark of the S3 feed downloads.
+
+Objects of several sizes are downloaded from the local S3 stand-in (see local_stand_ins.py), which adds
+a latency to every request and limits every connection to a bandwidth, like a single S3 connection.
+Every object is downloaded with one get_object stream (1 worker) and with parallel ranged requests
+(see s3_download.py) for every number of workers. The report gives, per size and number of workers,
+the best time over the repeats, MB/s, the number of requests and whether the object was reassembled intact.
+
+Usage (from the repository root):
+    python Benchmarks/download_benchmark.py --sizes-mb 16 64 128 --workers 1 4 8 16
+    python Benchmarks/download_benchmark.py --latency 0.05 --bandwidth-mb 25 --part-mb 8 --to-file
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import datetime
+import platform
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local_stand_ins as stand_ins
+import synthetic_data
+
+REPO_ROOT = synthetic_data.REPO_ROOT
+RESULTS_DIR = os.path.join(REPO_ROOT, 'Benchmarks', 'results')
+BUCKET_NAME = 'benchmark-bucket'
+
+#s3_download.py is identical in S3_file_extractor and RS_price_extraction
+sys.path.insert(0, os.path.join(REPO_ROOT, 'S3_file_extractor'))
+from s3_download import download_object
+
+
+def synthetic_object(size_mb: float, seed: int) -> bytes:
+    """
+    Builds an object of the given size by repeating a synthetic feed file.
+    """
+    feed = synthetic_data.feed_bytes(synthetic_data.synthetic_frame(20000, seed))
+    size = int(size_mb * 1024 * 1024)
+    return (feed * (size // len(feed) + 1))[:size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks single stream and parallel ranged S3 downloads.')
+    parser.add_argument('--sizes-mb', type=float, nargs='*', default=[16, 64, 128], help='sizes of the downloaded objects in MB')
+    parser.add_argument('--workers', type=int, nargs='*', default=[1, 4, 8, 16], help='ranges fetched at the same time, 1 for one get_object stream')
+    parser.add_argument('--part-mb', type=float, default=8, help='size of a range in MB')
+    parser.add_argument('--latency', type=float, default=0.03, help='seconds added to every stand-in request')
+    parser.add_argument('--bandwidth-mb', type=float, default=50, help='throughput of one stand-in connection in MB/s')
+    parser.add_argument('--repeat', type=int, default=2, help='timed downloads per size and number of workers')
+    parser.add_argument('--to-file', action='store_true', help='reassemble the objects in a temp file instead of memory')
+    parser.add_argument('--seed', type=int, default=42, help='random seed of the synthetic data')
+    parser.add_argument('--output', help='result file, defaults to Benchmarks/results/download_benchmark_<timestamp>.json')
+    args = parser.parse_args()
+
+    results = []
+    for size_mb in args.sizes_mb:
+        data = synthetic_object(size_mb, args.seed)
+        digest = hashlib.md5(data).hexdigest()
+        print(f"{size_mb:g} MB object", flush=True)
+
+        for workers in args.workers:
+            timings = []
+            for _ in range(args.repeat):
+                client = stand_ins.FakeS3Client({BUCKET_NAME: {'feed.csv': data}}, latency=args.latency, bandwidth_mb=args.bandwidth_mb)
+                path = os.path.join(tempfile.gettempdir(), 'benchmark_download.csv') if args.to_file else None
+                stats = {}
+                start = time.perf_counter()
+                #Threshold 0: every object is downloaded in ranges, unless a single worker is used
+                content, _ = download_object(client, BUCKET_NAME, 'feed.csv', path=path, threshold_mb=0,
+                                             part_mb=args.part_mb, workers=workers, stats=stats)
+                timings.append(time.perf_counter() - start)
+                if path is not None:
+                    with open(path, 'rb') as f:
+                        content = f.read()
+                    os.remove(path)
+                intact = hashlib.md5(content).hexdigest() == digest
+
+            seconds = min(timings)
+            result = {
+                'size_mb': size_mb,
+                'workers': workers,
+                'ranged': stats['ranged'],
+                'requests': client.request_count,
+                'seconds_best': round(seconds, 4),
+                'mb_per_s': round(size_mb / seconds, 1),
+                'intact': intact,
+            }
+            results.append(result)
+            print(f"  {workers} workers: {seconds:.3f}s, {result['mb_per_s']} MB/s, {result['requests']} requests, intact: {intact}")
+
+    report = {
+        'run': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'latency_s': args.latency,
+            'bandwidth_mb_per_connection': args.bandwidth_mb,
+            'part_mb': args.part_mb,
+            'to_file': args.to_file,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"download_benchmark_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Import-time profile of the Cloud Function entry points.
+
+A cold start imports the main module of the function before the first request is served. Every entry point
+is imported in a fresh interpreter with python -X importtime, with lazy imports (default) and with every
+client imported eagerly (LAZY_IMPORTS=0, see lazy_imports.py). The report gives, per entry point and mode,
+the median import time over the repeats and the packages taking the most time.
+
+Usage (from the repository root):
+    python Benchmarks/import_profile.py --repeat 5
+    python Benchmarks/import_profile.py --entry-points screener_loader s3_extractor --top 15
+"""
+import os
+import sys
+import json
+import argparse
+import datetime
+import platform
+import statistics
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, 'Benchmarks', 'results')
+
+#Entry points: folder deployed as a function and module imported on a cold start
+ENTRY_POINTS = {
+    's3_extractor': ('S3_file_extractor', 'main'),
+    'rs_price_extraction': ('Data validation automation/RS_price_extraction', 'main'),
+    'screener_loader': ('Screener_loader', 'screen_loader'),
+    'screener_inventory': ('Screener inventory', 'screen_loader'),
+    'data_validation': ('Data validation automation/Data_validation_google_sheet', 'main'),
+    'gcp_testing': ('Utilities', 'GCP_testing'),
+}
+
+#Heavy libraries reported separately, to show which of them a cold start still imports
+HEAVY_MODULES = ['pandas', 'numpy', 'pyarrow', 'google.cloud.bigquery', 'google.oauth2.service_account',
+                 'googleapiclient.discovery', 'boto3', 'botocore', 'requests', 'functions_framework', 'duckdb']
+
+_CHILD_CODE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def _package(name: str) -> str:
+    #google.* and googleapiclient.* are namespace packages of several libraries, they are grouped by library
+    parts = name.split('.')
+    if parts[0] == 'google' and len(parts) > 2 and parts[1] in ('cloud', 'api_core', 'auth', 'oauth2', 'protobuf'):
+        return '.'.join(parts[:3] if parts[1] == 'cloud' else parts[:2])
+    return parts[0]
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    Sums the self time of the -X importtime lines per package.
+
+    :return: dict of package -> seconds
+    """
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, _, name = line[len('import time:'):].split('|')
+            package = _package(name.strip())
+            packages[package] = packages.get(package, 0) + int(self_us) / 1e6
+        except ValueError:
+            continue
+    return packages
+
+
+def profile_entry_point(folder: str, module: str, lazy: bool, repeat: int) -> dict:
+    """
+    Imports the module repeat times, each time in a new interpreter started in its folder (as on Cloud Functions).
+    """
+    env = dict(os.environ, LAZY_IMPORTS='1' if lazy else '0')
+    seconds = []
+    packages = {}
+    loaded = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', _CHILD_CODE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=os.path.join(REPO_ROOT, folder), env=env, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            return {'error': completed.stderr.strip().splitlines()[-1]}
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        seconds.append(result['seconds'])
+        loaded = result['loaded']
+        for package, package_seconds in parse_importtime(completed.stderr).items():
+            packages.setdefault(package, []).append(package_seconds)
+
+    return {
+        'seconds_median': round(statistics.median(seconds), 4),
+        'seconds_min': round(min(seconds), 4),
+        'heavy_modules_loaded': loaded,
+        'packages': {package: round(statistics.median(values), 4) for package, values in packages.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profiles the import time of the function entry points, with and without lazy imports.')
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per entry point and mode')
+    parser.add_argument('--top', type=int, default=8, help='packages listed per entry point')
+    parser.add_argument('--entry-points', nargs='*', choices=sorted(ENTRY_POINTS), help='only profile these entry points')
+    parser.add_argument('--output', help='result file, defaults to Benchmarks/results/import_profile_<timestamp>.json')
+    args = parser.parse_args()
+
+    results = []
+    for name in args.entry_points or ENTRY_POINTS:
+        folder, module = ENTRY_POINTS[name]
+        print(f"Profiling {name} ...", flush=True)
+        eager = profile_entry_point(folder, module, lazy=False, repeat=args.repeat)
+        lazy = profile_entry_point(folder, module, lazy=True, repeat=args.repeat)
+        result = {'entry_point': name, 'folder': folder, 'module': module, 'eager': eager, 'lazy': lazy}
+        if 'error' in eager or 'error' in lazy:
+            print(f"  failed: {eager.get('error') or lazy.get('error')}")
+            results.append(result)
+            continue
+
+        result['saved_s'] = round(eager['seconds_median'] - lazy['seconds_median'], 4)
+        result['saved_pct'] = round(100 * result['saved_s'] / eager['seconds_median'], 1) if eager['seconds_median'] else None
+        results.append(result)
+
+        print(f"  eager {eager['seconds_median']:.3f}s, lazy {lazy['seconds_median']:.3f}s, saved {result['saved_s']:.3f}s ({result['saved_pct']}%)")
+        print(f"  still imported on cold start: {', '.join(lazy['heavy_modules_loaded']) or '-'}")
+        deferred = [module_name for module_name in eager['heavy_modules_loaded'] if module_name not in lazy['heavy_modules_loaded']]
+        print(f"  deferred to first use: {', '.join(deferred) or '-'}")
+        top_packages = sorted(lazy['packages'].items(), key=lambda item: item[1], reverse=True)[:args.top]
+        print('  top packages (lazy): ' + ', '.join(f"{package} {package_seconds:.3f}s" for package, package_seconds in top_packages))
+
+    report = {
+        'run': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"import_profile_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+"""
+Local stand-ins for the external services used by the pipelines (S3, BigQuery, Google Sheets).
+They implement only the calls made by the repository code, keep all data in memory,
+and can inject a fixed latency per request to imitate network round-trips.
+"""
+import io
+import time
+import uuid
+import hashlib
+import datetime
+import threading
+import concurrent.futures
+
+import pyarrow as pa
+
+
+class FakeStreamingBody:
+    """
+    Minimal replacement of botocore's StreamingBody.
+    """
+    def __init__(self, data: bytes):
+        self._stream = io.BytesIO(data)
+
+    def read(self, amt=None):
+        return self._stream.read() if amt is None else self._stream.read(amt)
+
+    def iter_chunks(self, chunk_size=1024 * 1024):
+        while True:
+            chunk = self._stream.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self._stream.close()
+
+
+class FakeS3Client:
+    """
+    In-memory S3 client supporting list_objects_v2 (with pagination and StartAfter), head_object and get_object
+    (with Range and IfMatch). Thread safe, concurrent requests are served in parallel like separate connections.
+
+    :param objects: dict of bucket name -> {key: bytes}
+    :param latency: seconds added to every request
+    :param page_size: number of keys returned per list_objects_v2 page
+    :param bandwidth_mb: optional throughput of one connection in MB/s, get_object takes the transfer time of its body
+    """
+    def __init__(self, objects: dict, latency: float = 0.0, page_size: int = 1000, bandwidth_mb: float = None):
+        self.objects = objects
+        self.latency = latency
+        self.page_size = page_size
+        self.bandwidth_mb = bandwidth_mb
+        self.request_count = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._etags = {}
+
+    def _etag_of(self, Bucket, Key, data):
+        # Objects are not modified, the ETag of an object is computed once
+        if (Bucket, Key) not in self._etags:
+            self._etags[(Bucket, Key)] = _etag(data)
+        return self._etags[(Bucket, Key)]
+
+    def _request(self):
+        with self._lock:
+            self.request_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _object(self, Bucket, Key):
+        try:
+            return self.objects[Bucket][Key]
+        except KeyError:
+            raise KeyError(f"NoSuchKey: {Bucket}/{Key}")
+
+    def list_objects_v2(self, Bucket, Prefix='', ContinuationToken=None, StartAfter='', **kwargs):
+        self._request()
+        keys = sorted(key for key in self.objects.get(Bucket, {}) if key.startswith(Prefix) and key > StartAfter)
+        start = int(ContinuationToken) if ContinuationToken else 0
+        page = keys[start:start + self.page_size]
+
+        response = {'KeyCount': len(page), 'IsTruncated': start + self.page_size < len(keys)}
+        if page:
+            response['Contents'] = [
+                {'Key': key, 'Size': len(self.objects[Bucket][key]), 'ETag': _etag(self.objects[Bucket][key])}
+                for key in page
+            ]
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = str(start + self.page_size)
+        return response
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._request()
+        data = self._object(Bucket, Key)
+        return {'ContentLength': len(data), 'ETag': self._etag_of(Bucket, Key, data)}
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, **kwargs):
+        self._request()
+        data = self._object(Bucket, Key)
+        if IfMatch is not None and IfMatch != self._etag_of(Bucket, Key, data):
+            raise RuntimeError(f"PreconditionFailed: {Bucket}/{Key} does not match {IfMatch}")
+        total = len(data)
+        if Range:
+            # Only the 'bytes=start-end' form is used by the repository code
+            start, end = Range.replace('bytes=', '').split('-')
+            start = int(start)
+            end = min(int(end) if end else total - 1, total - 1)
+            body = data[start:end + 1]
+            content_range = f"bytes {start}-{end}/{total}"
+        else:
+            body = data
+            content_range = None
+
+        with self._lock:
+            self.bytes_sent += len(body)
+        if self.bandwidth_mb:
+            time.sleep(len(body) / (self.bandwidth_mb * 1024 * 1024))
+        response = {'Body': FakeStreamingBody(body), 'ContentLength': len(body), 'ETag': self._etag_of(Bucket, Key, data)}
+        if content_range:
+            response['ContentRange'] = content_range
+        return response
+
+
+class _FakeObjectSummary:
+    def __init__(self, key):
+        self.key = key
+
+
+class _FakeObjectCollection:
+    def __init__(self, client, bucket_name):
+        self._client = client
+        self._bucket_name = bucket_name
+
+    def filter(self, Prefix=''):
+        token = None
+        while True:
+            response = self._client.list_objects_v2(Bucket=self._bucket_name, Prefix=Prefix, ContinuationToken=token)
+            for obj in response.get('Contents', []):
+                yield _FakeObjectSummary(obj['Key'])
+            if not response['IsTruncated']:
+                break
+            token = response['NextContinuationToken']
+
+
+class _FakeBucket:
+    def __init__(self, client, bucket_name):
+        self.objects = _FakeObjectCollection(client, bucket_name)
+
+
+class FakeS3Resource:
+    """
+    Minimal replacement of boto3's S3 ServiceResource, backed by a FakeS3Client.
+    """
+    def __init__(self, client):
+        self.meta = type('Meta', (), {'client': client})()
+        self._client = client
+
+    def Bucket(self, bucket_name):
+        return _FakeBucket(self._client, bucket_name)
+
+
+class FakeSession:
+    def __init__(self, client):
+        self._client = client
+
+    def client(self, service_name, **kwargs):
+        return self._client
+
+    def resource(self, service_name, **kwargs):
+        return FakeS3Resource(self._client)
+
+
+class FakeBoto3:
+    """
+    Replacement of the boto3 module: boto3.Session(...) returns a session bound to the given FakeS3Client.
+    Assign it to the 'boto3' attribute of a loaded module to route its S3 calls to memory.
+    """
+    def __init__(self, client):
+        self._client = client
+
+    def Session(self, **kwargs):
+        return FakeSession(self._client)
+
+    def client(self, service_name, **kwargs):
+        return self._client
+
+
+def _etag(data: bytes) -> str:
+    return '"' + hashlib.md5(data).hexdigest() + '"'
+
+
+class FakeSchemaField:
+    def __init__(self, name, field_type):
+        self.name = name
+        self.field_type = field_type
+
+
+class FakeTable:
+    def __init__(self, schema):
+        self.schema = schema
+
+
+class FakeTableReference:
+    def __init__(self, dataset_id, table_id):
+        self.dataset_id = dataset_id
+        self.table_id = table_id
+
+
+class FakeDatasetReference:
+    def __init__(self, dataset_id):
+        self.dataset_id = dataset_id
+
+    def table(self, table_id):
+        return FakeTableReference(self.dataset_id, table_id)
+
+
+class FakeRowIterator:
+    """
+    Query result returning its Arrow table in pages of page_size rows. Every page is a new buffer, as a page
+    read from the network, not a view of the stored table, so the memory of a reader is measured.
+    """
+    def __init__(self, arrow_table, page_size, latency):
+        self._arrow_table = arrow_table
+        self._page_size = page_size
+        self._latency = latency
+        self.total_rows = arrow_table.num_rows
+
+    def to_arrow_iterable(self, **kwargs):
+        for batch in self._arrow_table.to_batches(max_chunksize=self._page_size):
+            if self._latency:
+                time.sleep(self._latency)
+            yield pa.ipc.read_record_batch(batch.serialize(), batch.schema)
+
+
+class FakeQueryJob:
+    def __init__(self, arrow_table, latency):
+        self._arrow_table = arrow_table
+        self._latency = latency
+
+    def result(self, page_size=None, **kwargs):
+        return FakeRowIterator(self._arrow_table, page_size or self._arrow_table.num_rows or 1, self._latency)
+
+
+class FakeLoadJob:
+    """
+    Load job that runs on the "server" for a fixed time after submission, like a BigQuery load job.
+    """
+    def __init__(self, rows: int, duration: float):
+        self.job_id = uuid.uuid4().hex
+        self.created = datetime.datetime.now(datetime.timezone.utc)
+        self.started = self.created
+        self._duration = duration
+        self._done_at = time.perf_counter() + duration
+        self._rows = rows
+
+    def done(self):
+        return time.perf_counter() >= self._done_at
+
+    def result(self, timeout=None):
+        remaining = self._done_at - time.perf_counter()
+        if timeout is not None and remaining > timeout:
+            time.sleep(timeout)
+            raise concurrent.futures.TimeoutError()
+        if remaining > 0:
+            time.sleep(remaining)
+        return self
+
+    @property
+    def state(self):
+        return 'DONE' if self.done() else 'RUNNING'
+
+    @property
+    def ended(self):
+        return self.started + datetime.timedelta(seconds=self._duration) if self.done() else None
+
+    @property
+    def output_rows(self):
+        return self._rows if self.done() else None
+
+    @property
+    def output_bytes(self):
+        return self._rows * 100 if self.done() else None
+
+
+class FakeBigQueryClient:
+    """
+    In-memory BigQuery client.
+
+    :param schemas: dict of table id -> {column name: BigQuery type}, returned by get_table
+    :param query_result: Arrow table returned by every query, paged by result(page_size)
+    :param latency: seconds added to every result page
+    :param load_duration: seconds every load job runs after its submission
+    """
+    def __init__(self, schemas: dict = None, query_result=None, latency: float = 0.0, load_duration: float = 0.0, **kwargs):
+        self.schemas = schemas or {}
+        self.query_result = query_result
+        self.latency = latency
+        self.load_duration = load_duration
+        self.queries = []
+        self.load_jobs = []
+
+    def dataset(self, dataset_id):
+        return FakeDatasetReference(dataset_id)
+
+    def get_table(self, table_ref):
+        schema = self.schemas.get(table_ref.table_id, {})
+        return FakeTable([FakeSchemaField(name, field_type) for name, field_type in schema.items()])
+
+    def query(self, query, job_config=None, **kwargs):
+        self.queries.append(query)
+        return FakeQueryJob(self.query_result, self.latency)
+
+    def load_table_from_dataframe(self, dataframe, destination, job_config=None, **kwargs):
+        load_job = FakeLoadJob(len(dataframe), self.load_duration)
+        self.load_jobs.append(load_job)
+        return load_job
+
+
+class _FakeEnum:
+    """
+    Stand-in of the BigQuery enum classes (WriteDisposition, SourceFormat, ...): any attribute is its own name.
+    """
+    def __getattr__(self, name):
+        return name
+
+
+class FakeLoadJobConfig:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeBigQueryModule:
+    """
+    Replacement of the google.cloud.bigquery module: bigquery.Client(...) returns the given FakeBigQueryClient.
+    Assign it to the 'bigquery' attribute of a loaded module to route its BigQuery calls to memory.
+    """
+    LoadJobConfig = FakeLoadJobConfig
+    WriteDisposition = _FakeEnum()
+    CreateDisposition = _FakeEnum()
+    SourceFormat = _FakeEnum()
+
+    def __init__(self, client):
+        self._client = client
+
+    def Client(self, *args, **kwargs):
+        return self._client
+
+
+class FakeCredentials:
+    project_id = 'local-benchmark'
+
+
+class _FakeSheetsRequest:
+    def __init__(self, response):
+        self._response = response
+
+    def execute(self):
+        return self._response
+
+
+class FakeSheetsValues:
+    def __init__(self, service):
+        self._service = service
+
+    def get(self, spreadsheetId, range, **kwargs):
+        self._service.request_count += 1
+        return _FakeSheetsRequest({'range': range, 'values': self._service.ranges.get(range, [])})
+
+    def batchGet(self, spreadsheetId, ranges, **kwargs):
+        self._service.request_count += 1
+        return _FakeSheetsRequest({
+            'spreadsheetId': spreadsheetId,
+            'valueRanges': [{'range': range, 'values': self._service.ranges.get(range, [])} for range in ranges]
+        })
+
+
+class FakeSheetsService:
+    """
+    In-memory Sheets API client implementing spreadsheets().values().get / batchGet.
+
+    :param ranges: dict of range name -> 2D list of cell strings, header first
+    """
+    def __init__(self, ranges: dict):
+        self.ranges = ranges
+        self.request_count = 0
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return FakeSheetsValues(self)
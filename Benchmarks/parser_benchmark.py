@@ -0,0 +1,121 @@
+"""
+Parser backend benchmark of the pipe-delimited feed files.
+
+A synthetic RS rating feed (pipe-delimited, ISO-8859-1, see synthetic_data.py) is parsed from its raw bytes
+by every backend of feed_parser.py, for every file size: pandas' C parser, and the Arrow CSV reader
+with 1 thread and with every core. The report gives, per size and backend, the best time over the repeats,
+rows/s, rows/s per core (rows/s divided by the cores used, at most the threads) and whether the frame
+equals the pandas one.
+
+Usage (from the repository root):
+    python Benchmarks/parser_benchmark.py --sizes 10000 100000 1000000 --repeat 3
+    python Benchmarks/parser_benchmark.py --threads 1 2 4
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import platform
+
+import pandas as pd
+import pyarrow as pa
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic_data
+
+REPO_ROOT = synthetic_data.REPO_ROOT
+RESULTS_DIR = os.path.join(REPO_ROOT, 'Benchmarks', 'results')
+
+#feed_parser.py is identical in S3_file_extractor and RS_price_extraction
+sys.path.insert(0, os.path.join(REPO_ROOT, 'S3_file_extractor'))
+from feed_parser import parse_feed
+
+
+def time_parse(content: bytes, backend: str, threads: int, repeat: int) -> tuple:
+    """
+    Parses the file repeat times and returns the best time and the last frame.
+    """
+    #The benchmark owns its process, the Arrow CPU pool is sized for each case
+    if backend == 'arrow' and threads > 1:
+        pa.set_cpu_count(threads)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = parse_feed(content, 'ISO-8859-1', backend=backend, use_threads=threads != 1)
+        timings.append(time.perf_counter() - start)
+    return min(timings), df
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description='Benchmarks the feed parser backends across file sizes.')
+    parser.add_argument('--sizes', type=int, nargs='*', default=[10000, 100000, 1000000], help='rows of the synthetic feed files')
+    parser.add_argument('--threads', type=int, nargs='*', default=sorted({1, cores}), help='threads of the arrow backend')
+    parser.add_argument('--repeat', type=int, default=3, help='timed parses per size and backend')
+    parser.add_argument('--seed', type=int, default=42, help='random seed of the synthetic data')
+    parser.add_argument('--output', help='result file, defaults to Benchmarks/results/parser_benchmark_<timestamp>.json')
+    args = parser.parse_args()
+
+    results = []
+    for rows in args.sizes:
+        content = synthetic_data.feed_bytes(synthetic_data.synthetic_frame(rows, args.seed))
+        print(f"{rows} rows, {len(content) / 1024 / 1024:.1f} MB", flush=True)
+
+        backends = [('pandas', 1)] + [('arrow', threads) for threads in args.threads]
+        pandas_df = None
+        for backend, threads in backends:
+            seconds, df = time_parse(content, backend, threads, args.repeat)
+            if backend == 'pandas':
+                pandas_df = df
+            try:
+                pd.testing.assert_frame_equal(df, pandas_df)
+                same_frame = True
+            except AssertionError:
+                same_frame = False
+
+            rows_per_s = rows / seconds if seconds > 0 else None
+            #Threads beyond the cores of the machine run on the same cores
+            cores_used = min(threads, cores)
+            result = {
+                'rows': rows,
+                'bytes': len(content),
+                'backend': backend,
+                'threads': threads,
+                'cores_used': cores_used,
+                'seconds_best': round(seconds, 6),
+                'rows_per_s': round(rows_per_s, 1) if rows_per_s else None,
+                'rows_per_s_per_core': round(rows_per_s / cores_used, 1) if rows_per_s else None,
+                'mb_per_s': round(len(content) / 1024 / 1024 / seconds, 1) if seconds > 0 else None,
+                'same_frame_as_pandas': same_frame,
+            }
+            results.append(result)
+            print(f"  {backend} ({threads} threads): {seconds:.4f}s, {result['rows_per_s']} rows/s, "
+                  f"{result['rows_per_s_per_core']} rows/s per core, same frame: {same_frame}")
+
+    report = {
+        'run': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'pyarrow': pa.__version__,
+            'platform': platform.platform(),
+            'cpu_count': cores,
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"parser_benchmark_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,465 @@
+"""
+Offline benchmarks of the ingestion and validation hot paths.
+
+The repository functions are loaded from their scripts and driven with synthetic data
+(see synthetic_data.py). S3 and BigQuery calls are routed to the in-memory stand-ins of
+local_stand_ins.py, so no credentials or network access are needed.
+
+Every case reports the best and mean wall time over the repeats, the peak memory of one extra run,
+and rows/s. tracemalloc only sees the Python and numpy allocations, so the peak of Arrow's memory pool
+(Arrow CSV reader, Arrow-backed frames, Feather) is reported next to it. Results are written as JSON, one file per run, so they can be
+compared over time.
+
+Usage (from the repository root):
+    python Benchmarks/run_benchmarks.py --rows 100000 --repeat 3
+    python Benchmarks/run_benchmarks.py --cases ingest_file_from_s3 data_point_statistics
+"""
+import os
+import io
+import sys
+import gzip
+import json
+import time
+import argparse
+import shutil
+import tempfile
+import platform
+import tracemalloc
+import threading
+import subprocess
+import contextlib
+import importlib.util
+import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local_stand_ins as stand_ins
+import synthetic_data
+
+REPO_ROOT = synthetic_data.REPO_ROOT
+RESULTS_DIR = os.path.join(REPO_ROOT, 'Benchmarks', 'results')
+BUCKET_NAME = 'benchmark-bucket'
+
+#Scripts of the repository used by the cases, loaded by path as their folders are not packages
+MODULE_PATHS = {
+    's3_extractor': 'S3_file_extractor/main.py',
+    'rs_price_extraction': 'Data validation automation/RS_price_extraction/main.py',
+    'screener_loader': 'Screener_loader/screen_loader.py',
+    'screener_inventory': 'Screener inventory/screen_loader.py',
+    'sproc_inventory': 'Fileds not used in SPROCs/SprocFieldInventory.py',
+    'gcp_testing': 'Utilities/GCP_testing.py',
+}
+_modules = {}
+
+
+def load_module(name: str):
+    """
+    Loads a repository script as a module. Every script is loaded once per benchmark run.
+    """
+    if name not in _modules:
+        path = os.path.join(REPO_ROOT, MODULE_PATHS[name])
+        spec = importlib.util.spec_from_file_location(f"benchmark_{name}", path)
+        module = importlib.util.module_from_spec(spec)
+        sys.path.insert(0, os.path.dirname(path))
+        try:
+            spec.loader.exec_module(module)
+        finally:
+            sys.path.remove(os.path.dirname(path))
+        _modules[name] = module
+    return _modules[name]
+
+
+class Case:
+    """
+    A benchmark case. setup() runs before every measured call and is not timed, run(*setup()) is timed.
+    """
+    def __init__(self, name, rows, run, setup=None):
+        self.name = name
+        self.rows = rows
+        self.run = run
+        self.setup = setup or (lambda: ())
+
+
+def _s3_client(objects: dict, latency: float) -> stand_ins.FakeS3Client:
+    return stand_ins.FakeS3Client({BUCKET_NAME: objects}, latency=latency)
+
+
+def _as_screener_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts a frame to the object columns returned by run_screen (JSON values).
+    """
+    return df.astype(object).where(df.notna(), None)
+
+
+@contextlib.contextmanager
+def _duckdb_sink(new_database: bool = False):
+    """
+    Routes the loads and queries of the loaders to an in-memory DuckDB database (see warehouse_sink.py).
+
+    :param new_database: if True, the database of the previous cases is dropped
+    """
+    sink_module = sys.modules['warehouse_sink']
+    previous = sink_module.WAREHOUSE_SINK, sink_module.WAREHOUSE_DUCKDB_PATH
+    sink_module.WAREHOUSE_SINK, sink_module.WAREHOUSE_DUCKDB_PATH = 'duckdb', ':memory:'
+    if new_database:
+        sink_module._duckdb_sinks.clear()
+    try:
+        yield
+    finally:
+        sink_module.WAREHOUSE_SINK, sink_module.WAREHOUSE_DUCKDB_PATH = previous
+
+
+def build_cases(args) -> list:
+    """
+    Builds the benchmark cases for the requested scale.
+    """
+    feed_df = synthetic_data.synthetic_frame(args.rows, args.seed)
+    feed_data = synthetic_data.feed_bytes(feed_df)
+    feed_key = synthetic_data.feed_key('wonW_WONDB_HSFINST3MRSRATING', pd.Timestamp('2025-01-28 21:04:22'))
+    listing_keys = synthetic_data.feed_listing(args.keys, args.seed)
+    listing_objects = {key: b'' for key in listing_keys}
+    prefix = synthetic_data.S3_PREFIX
+
+    cases = []
+
+    def s3_list_folder_contents():
+        module = load_module('s3_extractor')
+        module.boto3 = stand_ins.FakeBoto3(_s3_client(listing_objects, args.latency))
+        return module.list_folder_contents(BUCKET_NAME, prefix, 'key', 'secret', 'HSFINST3MRSRATING')
+    cases.append(Case('s3_extractor.list_folder_contents', len(listing_keys), s3_list_folder_contents))
+
+    def s3_latest_file_setup(warm):
+        module = load_module('s3_extractor')
+        module.LATEST_FILE_INDEX_FILE = os.path.join(tempfile.gettempdir(), 'benchmark_s3_latest_file_index.json')
+        module._latest_file_index.clear()
+        if os.path.exists(module.LATEST_FILE_INDEX_FILE):
+            os.remove(module.LATEST_FILE_INDEX_FILE)
+        module.boto3 = stand_ins.FakeBoto3(_s3_client(listing_objects, args.latency))
+        if warm:
+            module.resolve_latest_file(BUCKET_NAME, prefix, 'key', 'secret', 'wonW_WONDB_HSFINST3MRSRATING')
+        return (module,)
+
+    def s3_resolve_latest_file(module):
+        return module.resolve_latest_file(BUCKET_NAME, prefix, 'key', 'secret', 'wonW_WONDB_HSFINST3MRSRATING')
+    cases.append(Case('s3_extractor.resolve_latest_file[cold]', len(listing_keys), s3_resolve_latest_file, lambda: s3_latest_file_setup(False)))
+    cases.append(Case('s3_extractor.resolve_latest_file[warm]', len(listing_keys), s3_resolve_latest_file, lambda: s3_latest_file_setup(True)))
+
+    def rs_list_folder_contents():
+        module = load_module('rs_price_extraction')
+        module.boto3 = stand_ins.FakeBoto3(_s3_client(listing_objects, args.latency))
+        return module.list_folder_contents(BUCKET_NAME, prefix, 'key', 'secret')
+    cases.append(Case('rs_price_extraction.list_folder_contents', len(listing_keys), rs_list_folder_contents))
+
+    def s3_ingest_file():
+        module = load_module('s3_extractor')
+        module.boto3 = stand_ins.FakeBoto3(_s3_client({feed_key: feed_data}, args.latency))
+        return module.ingest_file_from_s3(BUCKET_NAME, feed_key, 'key', 'secret', 'PRD', use_cache=False)
+    cases.append(Case('s3_extractor.ingest_file_from_s3', args.rows, s3_ingest_file))
+
+    def feed_cache_setup(name, env):
+        #Fresh cache in the temp directory, filled by one ingestion that is not measured
+        module = load_module(name)
+        cache_dir = os.path.join(tempfile.gettempdir(), 'benchmark_s3_feed_cache')
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        feed_cache = sys.modules['feed_cache']
+        feed_cache._feed_cache = feed_cache.FeedCache(cache_dir, 512)
+        module.boto3 = stand_ins.FakeBoto3(_s3_client({feed_key: feed_data}, args.latency))
+        module.ingest_file_from_s3(BUCKET_NAME, feed_key, 'key', 'secret', env)
+        return (module, env)
+
+    def ingest_cached(module, env):
+        return module.ingest_file_from_s3(BUCKET_NAME, feed_key, 'key', 'secret', env)
+    cases.append(Case('s3_extractor.ingest_file_from_s3[cache hit]', args.rows, ingest_cached, lambda: feed_cache_setup('s3_extractor', 'PRD')))
+
+    def s3_ingest_projected():
+        module = load_module('s3_extractor')
+        module.boto3 = stand_ins.FakeBoto3(_s3_client({feed_key: feed_data}, args.latency))
+        return module.ingest_file_from_s3(BUCKET_NAME, feed_key, 'key', 'secret', 'PRD', columns=['Osid', 'I3MRSrk'], dtypes={'Osid': 'int64', 'I3MRSrk': 'int64'}, use_cache=False)
+    cases.append(Case('s3_extractor.ingest_file_from_s3[projected]', args.rows, s3_ingest_projected))
+
+    def s3_ingest_arrow():
+        #Multithreaded Arrow CSV reader instead of pandas' parser (see feed_parser.py)
+        module = load_module('s3_extractor')
+        module.boto3 = stand_ins.FakeBoto3(_s3_client({feed_key: feed_data}, args.latency))
+        parser_module = sys.modules['feed_parser']
+        previous = parser_module.FEED_PARSER
+        parser_module.FEED_PARSER = 'arrow'
+        try:
+            return module.ingest_file_from_s3(BUCKET_NAME, feed_key, 'key', 'secret', 'PRD', use_cache=False)
+        finally:
+            parser_module.FEED_PARSER = previous
+    cases.append(Case('s3_extractor.ingest_file_from_s3[arrow]', args.rows, s3_ingest_arrow))
+
+    def s3_preview_file():
+        module = load_module('s3_extractor')
+        module.boto3 = stand_ins.FakeBoto3(_s3_client({feed_key: feed_data}, args.latency))
+        return module.preview_file_from_s3(BUCKET_NAME, feed_key, 'key', 'secret', 'PRD', preview_rows=1000)
+    cases.append(Case('s3_extractor.preview_file_from_s3', 1000, s3_preview_file))
+
+    #The same feed delivered gzip compressed, decompressed while it is parsed (see feed_compression.py)
+    gzip_key = synthetic_data.feed_key('wonW_WONDB_HSFINST3MRSRATING', pd.Timestamp('2025-01-28 21:04:22'), '.csv.gz')
+    gzip_data = gzip.compress(feed_data, compresslevel=6)
+
+    def s3_ingest_gzip():
+        module = load_module('s3_extractor')
+        module.boto3 = stand_ins.FakeBoto3(_s3_client({gzip_key: gzip_data}, args.latency))
+        return module.ingest_file_from_s3(BUCKET_NAME, gzip_key, 'key', 'secret', 'PRD', use_cache=False)
+    cases.append(Case('s3_extractor.ingest_file_from_s3[gzip]', args.rows, s3_ingest_gzip))
+
+    def s3_preview_gzip():
+        module = load_module('s3_extractor')
+        module.boto3 = stand_ins.FakeBoto3(_s3_client({gzip_key: gzip_data}, args.latency))
+        return module.preview_file_from_s3(BUCKET_NAME, gzip_key, 'key', 'secret', 'PRD', preview_rows=1000)
+    cases.append(Case('s3_extractor.preview_file_from_s3[gzip]', 1000, s3_preview_gzip))
+
+    def rs_ingest_file():
+        module = load_module('rs_price_extraction')
+        module.boto3 = stand_ins.FakeBoto3(_s3_client({feed_key: feed_data}, args.latency))
+        return module.ingest_file_from_s3(BUCKET_NAME, feed_key, 'key', 'secret', 'PROD', use_cache=False)
+    cases.append(Case('rs_price_extraction.ingest_file_from_s3', args.rows, rs_ingest_file))
+    cases.append(Case('rs_price_extraction.ingest_file_from_s3[cache hit]', args.rows, ingest_cached, lambda: feed_cache_setup('rs_price_extraction', 'PROD')))
+
+    ingested_df = pd.read_csv(io.BytesIO(feed_data), sep='|', encoding='ISO-8859-1')
+    cases.append(Case(
+        's3_extractor.data_point_statistics', args.rows,
+        lambda: load_module('s3_extractor').data_point_statistics(ingested_df, ['Osid', 'I3MRSrk'])
+    ))
+
+    screener_df = _as_screener_strings(feed_df)
+    schema = {
+        'Osid': 'INTEGER', 'Ticker': 'STRING', 'Previous_Close_Price': 'FLOAT', 'Last_Div_Amount': 'FLOAT',
+        'Last_Dividend_ExDate': 'DATE', 'Last_Special_Div_Amount': 'FLOAT', 'Last_Special_Dividend_ExDate': 'DATE',
+        'Indicated_Annual_Div_Amount': 'FLOAT', 'Actual_Annual_Div_Amount': 'FLOAT', 'Last_Split_Date': 'DATE',
+        'Last_Split_Factor': 'FLOAT', 'Pricing_Start_Date': 'DATE', 'SourceEnv': 'STRING', 'repDate': 'TIMESTAMP',
+        'I3MRSrk': 'INTEGER', 'CoName': 'STRING',
+    }
+
+    def convert_types(df):
+        module = load_module('screener_loader')
+        fake_bigquery = stand_ins.FakeBigQueryModule(stand_ins.FakeBigQueryClient({'benchmark_table': schema}))
+        module.bigquery = fake_bigquery
+        sys.modules['warehouse_sink'].bigquery = fake_bigquery
+        return module.convert_dataframe_types(df, 'benchmark_dataset', 'benchmark_table', stand_ins.FakeCredentials())
+    cases.append(Case('screener_loader.convert_dataframe_types', args.rows, convert_types, lambda: (screener_df.copy(),)))
+
+    def compact_types(df):
+        #Frame as loaded by the Screener loader: converted to the table types, then compacted
+        module = load_module('screener_loader')
+        fake_bigquery = stand_ins.FakeBigQueryModule(stand_ins.FakeBigQueryClient({'benchmark_table': schema}))
+        module.bigquery = fake_bigquery
+        sys.modules['warehouse_sink'].bigquery = fake_bigquery
+        bq_schema = module.get_sink(stand_ins.FakeCredentials()).get_schema('benchmark_dataset', 'benchmark_table')
+        return module.compact_dtypes(df, bq_schema)
+    cases.append(Case(
+        'screener_loader.compact_dtypes', args.rows, compact_types,
+        lambda: (convert_types(screener_df.copy()),)
+    ))
+
+    #Loads of one run: submitted and waited for one by one, or submitted together and waited for at the end
+    load_tables = 6
+    load_df = screener_df.head(1000)
+
+    def bigquery_loads(async_loads):
+        module = load_module('screener_loader')
+        fake_bigquery = stand_ins.FakeBigQueryModule(stand_ins.FakeBigQueryClient(load_duration=max(args.latency, 0.05)))
+        module.bigquery = fake_bigquery
+        sys.modules['warehouse_sink'].bigquery = fake_bigquery
+        tracker = module.LoadJobTracker() if async_loads else None
+        for index in range(load_tables):
+            load_job = module.load_to_bigquery(load_df, 'benchmark_dataset', f'benchmark_table_{index}', 1, stand_ins.FakeCredentials(), wait=not async_loads)
+            if tracker is not None:
+                tracker.submit(load_job, table=f'benchmark_table_{index}')
+        return tracker.wait_all() if tracker is not None else None
+    cases.append(Case('screener_loader.load_to_bigquery[sequential]', load_tables * len(load_df), lambda: bigquery_loads(False)))
+    cases.append(Case('screener_loader.load_to_bigquery[async]', load_tables * len(load_df), lambda: bigquery_loads(True)))
+
+    #Same loads and the dedupe query of the RS loader against the local DuckDB sink, if duckdb is installed
+    if importlib.util.find_spec('duckdb') is not None:
+        def duckdb_loads():
+            module = load_module('screener_loader')
+            with _duckdb_sink(new_database=True):
+                for index in range(load_tables):
+                    module.load_to_bigquery(load_df, 'benchmark_dataset', f'benchmark_table_{index}', 1, None)
+        cases.append(Case('screener_loader.load_to_bigquery[duckdb]', load_tables * len(load_df), duckdb_loads))
+
+        #Feed table holding 10 daily files
+        feed_files_df = pd.concat([
+            ingested_df.head(20000).assign(SourceEnv='PROD', FileName='wonW_WONDB_HSFINST3MRSRATING', FileDate=f"202501{day:02d}235959")
+            for day in range(1, 11)
+        ], ignore_index=True)
+
+        def duckdb_dedupe_setup():
+            module = load_module('rs_price_extraction')
+            with _duckdb_sink(new_database=True), contextlib.redirect_stdout(io.StringIO()):
+                module.load_to_bigquery(feed_files_df, 'benchmark_dataset', 'benchmark_feed', None)
+            return (module,)
+
+        def duckdb_dedupe(module):
+            with _duckdb_sink():
+                return module.file_in_BigQuery('wonW_WONDB_HSFINST3MRSRATING', '20250105235959', 'PROD', 'benchmark_dataset', 'benchmark_feed', None)
+        cases.append(Case('rs_price_extraction.file_in_BigQuery[duckdb]', len(feed_files_df), duckdb_dedupe, duckdb_dedupe_setup))
+
+    def clean_text(df):
+        # Same column-wise application as in run_batch_process of the inventory loader
+        clean = load_module('screener_inventory').clean_text
+        return df.apply(lambda col: col.map(clean) if col.dtype == "object" else col)
+    cases.append(Case('screener_inventory.clean_text', args.rows, clean_text, lambda: (screener_df.copy(),)))
+
+    sproc_names, sproc_code = synthetic_data.sproc_sources(args.sprocs)
+    cases.append(Case(
+        'sproc_inventory.analyse_sproc_fields', args.sprocs,
+        lambda: load_module('sproc_inventory').analyse_sproc_fields(sproc_names, sproc_code)
+    ))
+
+    query_result = pa.Table.from_pandas(feed_df, preserve_index=False)
+
+    def bq_chunked_reader():
+        module = load_module('gcp_testing')
+        client = stand_ins.FakeBigQueryClient(query_result=query_result, latency=args.latency)
+        rows = 0
+        for chunk_df in module.read_bq_table_in_chunks('project', 'dataset', 'table', columns=['Osid', 'Ticker'], page_size=10000, client=client):
+            rows += len(chunk_df)
+        return rows
+    cases.append(Case('gcp_testing.read_bq_table_in_chunks', args.rows, bq_chunked_reader))
+
+    sheet_rows = min(args.rows, 20000)
+    sheet_values = [list(feed_df.columns)] + feed_df.head(sheet_rows).fillna('').astype(str).values.tolist()
+
+    def sheets_reader():
+        module = load_module('gcp_testing')
+        service = stand_ins.FakeSheetsService({'Data!A1:Q': sheet_values})
+        return module.read_sheet_ranges_to_dataframes(None, 'spreadsheet', ['Data!A1:Q'], service=service)
+    cases.append(Case('gcp_testing.read_sheet_ranges_to_dataframes', sheet_rows, sheets_reader))
+
+    if args.cases:
+        cases = [case for case in cases if any(selected in case.name for selected in args.cases)]
+    return cases
+
+
+#Seconds between two samples of Arrow's allocated memory
+ARROW_SAMPLE_INTERVAL = 0.001
+
+
+@contextlib.contextmanager
+def arrow_peak_memory():
+    """
+    Measures the peak of Arrow's allocated memory within the block, in bytes above the start, and yields a dict
+    filled with 'peak_bytes' at the end. The high-water mark of the pool is exact when the block raises it,
+    otherwise the memory is sampled every ARROW_SAMPLE_INTERVAL seconds.
+    """
+    pool = pa.default_memory_pool()
+    start_bytes = pa.total_allocated_bytes()
+    start_max = pool.max_memory()
+    samples = [start_bytes]
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(ARROW_SAMPLE_INTERVAL):
+            samples.append(pa.total_allocated_bytes())
+
+    sampler = threading.Thread(target=sample, name='arrow-memory-sampler', daemon=True)
+    result = {}
+    sampler.start()
+    try:
+        yield result
+    finally:
+        stop.set()
+        sampler.join()
+        samples.append(pa.total_allocated_bytes())
+        peak = max(samples)
+        if pool.max_memory() > start_max:
+            peak = max(peak, pool.max_memory())
+        result['peak_bytes'] = max(peak - start_bytes, 0)
+
+
+def measure(case: Case, repeat: int) -> dict:
+    """
+    Times the case repeat times, then runs it once more under tracemalloc and with Arrow's memory pool
+    sampled, for the peak memory. Output printed by the repository functions is discarded.
+    """
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            args = case.setup()
+            start = time.perf_counter()
+            case.run(*args)
+            timings.append(time.perf_counter() - start)
+
+        args = case.setup()
+        tracemalloc.start()
+        with arrow_peak_memory() as arrow_memory:
+            case.run(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    best = min(timings)
+    return {
+        'name': case.name,
+        'rows': case.rows,
+        'repeat': repeat,
+        'seconds_best': round(best, 6),
+        'seconds_mean': round(sum(timings) / len(timings), 6),
+        'peak_memory_mb': round(peak / 1024 / 1024, 3),
+        'peak_arrow_memory_mb': round(arrow_memory['peak_bytes'] / 1024 / 1024, 3),
+        'rows_per_s': round(case.rows / best, 1) if best > 0 else None,
+    }
+
+
+def run_metadata(args) -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'git_commit': commit or None,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'pyarrow': pa.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'rows': args.rows,
+        'keys': args.keys,
+        'sprocs': args.sprocs,
+        'latency_s': args.latency,
+        'seed': args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the offline benchmarks and writes the results as JSON.')
+    parser.add_argument('--rows', type=int, default=100000, help='rows of the synthetic feed file')
+    parser.add_argument('--keys', type=int, default=20000, help='keys of the synthetic S3 listing')
+    parser.add_argument('--sprocs', type=int, default=500, help='number of synthetic stored procedures')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every stand-in request')
+    parser.add_argument('--seed', type=int, default=42, help='random seed of the synthetic data')
+    parser.add_argument('--cases', nargs='*', help='only run cases whose name contains one of these strings')
+    parser.add_argument('--output', help='result file, defaults to Benchmarks/results/benchmark_<timestamp>.json')
+    args = parser.parse_args()
+
+    results = []
+    for case in build_cases(args):
+        print(f"Running {case.name} ...", flush=True)
+        result = measure(case, args.repeat)
+        results.append(result)
+        print(f"  {result['seconds_best']:.4f}s best, {result['peak_memory_mb']:.1f} MB peak, "
+              f"{result['peak_arrow_memory_mb']:.1f} MB Arrow peak, {result['rows_per_s']} rows/s")
+
+    report = {'run': run_metadata(args), 'results': results}
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"benchmark_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
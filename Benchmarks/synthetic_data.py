@@ -0,0 +1,106 @@
+"""
+Synthetic inputs for the benchmarks. The feed data is scaled up from the Screener extract
+in screener_IBDCorpActions.csv, the S3 listings and SPROC code follow the naming and structure
+of the production sources.
+"""
+import os
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_FILE = os.path.join(REPO_ROOT, 'screener_IBDCorpActions.csv')
+
+#Feed names of RS_price_extraction/file_config.csv
+FEED_NAMES = ['wonW_WONDB_Secmaster', 'wonW_WONDB_HSFINST3MRSRATING', 'wonW_WONDB_HSFINST6MRSRATING']
+S3_PREFIX = 'williamoneilco/licensed-feedextract/'
+
+
+def load_sample() -> pd.DataFrame:
+    """
+    Reads the Screener sample extract without its index column.
+    """
+    return pd.read_csv(SAMPLE_FILE, index_col=0)
+
+
+def synthetic_frame(rows: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Builds a frame of the given size by resampling the rows of the sample extract.
+    Identifiers are made unique, an RS rank and a Latin-1 company name are added to model the RS rating feeds.
+
+    :param rows: number of rows to generate
+    :param seed: random seed, the same seed always returns the same frame
+    :return: synthetic DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    sample_df = load_sample()
+
+    df = sample_df.iloc[rng.integers(0, len(sample_df), rows)].reset_index(drop=True)
+    df = df.rename(columns={'IbdOsid': 'Osid'})
+    df['Osid'] = np.arange(1, rows + 1)
+    df['Ticker'] = df['Ticker'].astype(str) + (np.arange(rows) // len(sample_df)).astype(str)
+    df['I3MRSrk'] = rng.integers(1, 100, rows)
+    df['CoName'] = 'Société ' + df['Ticker'] + ' Inc'
+
+    return df
+
+
+def feed_bytes(df: pd.DataFrame) -> bytes:
+    """
+    Encodes a frame the way the vendor delivers the feed files: pipe-delimited, ISO-8859-1.
+    """
+    return df.to_csv(sep='|', index=False).encode('ISO-8859-1')
+
+
+def feed_key(feed_name: str, file_timestamp: pd.Timestamp, extension: str = '.csv') -> str:
+    return f"{S3_PREFIX}{feed_name}_{file_timestamp.strftime('%Y%m%d%H%M%S')}{extension}"
+
+
+def feed_listing(keys: int, seed: int = 42) -> list:
+    """
+    Builds an S3 listing of timestamped feed files (several intraday drops per day and feed),
+    with a few keys that do not follow the naming convention.
+
+    :param keys: number of keys to generate
+    :param seed: random seed
+    :return: list of object keys
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2025-01-01')
+    output = [f"{S3_PREFIX}README.txt", f"{S3_PREFIX}manifest.json"]
+
+    for index in range(keys - len(output)):
+        feed_name = FEED_NAMES[index % len(FEED_NAMES)]
+        file_timestamp = start + pd.Timedelta(minutes=int(index // len(FEED_NAMES)) * 97 + int(rng.integers(0, 60)))
+        output.append(feed_key(feed_name, file_timestamp))
+
+    return output
+
+
+SPROC_TEMPLATE = """
+CREATE PROCEDURE [dbo].[pr_MS_DG_Report{index}]
+AS
+SET NOCOUNT ON
+ SELECT TOP 100 G.symbol, G.coname, G.price0 AS 'Price', G.price0 - G.price AS 'Price Change',
+   A.volPctChg, A.avol, G.epsrnk, G.rlst, G.smrl, M.smartSelect, G.field{index}
+   FROM getrsm1 G
+   INNER JOIN avolView A ON G.osid = A.osid
+   INNER JOIN mainFrameStockRatings M ON G.osid=M.osid
+  WHERE G.exchcd >= {index} AND G.rlst > 75 AND g.Price0 >= 5 AND av.avdolv >= 500000
+  GROUP BY G.symbol, G.coname, A.avol
+  HAVING M.smartSelect > 10
+  ORDER BY G.epsrnk DESC, G.rlst DESC
+UPDATE dgRPTSnapshot SET S.osid = G.osid WHERE S.dgRPT = 'DG{index}'
+SET NOCOUNT OFF
+"""
+
+
+def sproc_sources(count: int) -> tuple:
+    """
+    Builds stored procedure names and code modelled on the MarketSurge report SPROCs.
+
+    :param count: number of stored procedures
+    :return: list of names, list of code
+    """
+    names = [f"pr_MS_DG_Report{index}" for index in range(count)]
+    code = [SPROC_TEMPLATE.format(index=index) for index in range(count)]
+    return names, code
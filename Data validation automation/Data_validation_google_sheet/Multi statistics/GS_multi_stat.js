@@ -22,8 +22,21 @@ function onOpen() {
   // with the Service Account Token Creator and Service Account User roles!!!
   // link: https://console.cloud.google.com/iam-admin/serviceaccounts/details/109206829698862128173/permissions?inv=1&invt=Abm6gA&project=dj-ds-marketdata-nonprod
   
+  // The generated token is valid for an hour, so it is kept in the user's script cache and reused
+  // until shortly before it expires. The cache is per user, as every user generates their own token.
+  var TOKEN_AUDIENCE = "https://us-central1-dj-ds-marketdata-nonprod.cloudfunctions.net/data_validation";
+  var TOKEN_CACHE_KEY = "id_token_data_validation";
+  var TOKEN_EXPIRY_MARGIN_SECONDS = 300;
+  var CACHE_MAX_SECONDS = 21600; // CacheService limit
+  
   function getToken()
   {
+    var cache = CacheService.getUserCache();
+    var cachedToken = cache.get(TOKEN_CACHE_KEY);
+    if (cachedToken) {
+      return cachedToken;
+    }
+  
     var options = {
     'method': 'post',
     'headers': {
@@ -32,7 +45,7 @@ function onOpen() {
     'contentType': 'application/json',
     'payload': JSON.stringify({
       "includeEmail": true,
-      "audience": "https://us-central1-dj-ds-marketdata-nonprod.cloudfunctions.net/data_validation"  // Replace with your actual Cloud Function URL or service URL
+      "audience": TOKEN_AUDIENCE  // Replace with your actual Cloud Function URL or service URL
     })
   };
   
@@ -45,9 +58,27 @@ function onOpen() {
   writeLog("Token generated successfully");
   
   const token = JSON.parse(response.getContentText()).token;
+  
+  // Cache the token until shortly before the expiry stored in the token itself
+  var cacheSeconds = Math.min(getTokenExpiry(token) - Math.floor(Date.now() / 1000) - TOKEN_EXPIRY_MARGIN_SECONDS, CACHE_MAX_SECONDS);
+  if (cacheSeconds > 0) {
+    cache.put(TOKEN_CACHE_KEY, token, cacheSeconds);
+  }
   return token;
   }
   
+  // Function to read the expiry (epoch seconds) from the payload of the ID token
+  function getTokenExpiry(token) {
+    var payload = token.split(".")[1];
+    var decoded = Utilities.newBlob(Utilities.base64DecodeWebSafe(payload)).getDataAsString();
+    return JSON.parse(decoded).exp;
+  }
+  
+  // Function to drop the cached token, e.g. when the backend rejects it
+  function clearToken() {
+    CacheService.getUserCache().remove(TOKEN_CACHE_KEY);
+  }
+  
   // Function to write logs to the "logs" sheet
   function writeLog(message) {
     const sheetName = "logs"; // Name of the logs sheet
@@ -146,7 +177,15 @@ function onOpen() {
     // call the remote function and return JSON response
     try {
           // Call the Cloud Run function
-          const response = UrlFetchApp.fetch(CLOUD_RUN_URL + '/data_validation', options);
+          let response = UrlFetchApp.fetch(CLOUD_RUN_URL + '/data_validation', options);
+  
+          // If the cached token was rejected, generate a new one and retry once
+          if (response.getResponseCode() == 401 || response.getResponseCode() == 403) {
+              writeLog("Token rejected by the backend, generating a new token");
+              clearToken();
+              options.headers['Authorization'] = 'Bearer ' + getToken();
+              response = UrlFetchApp.fetch(CLOUD_RUN_URL + '/data_validation', options);
+          }
           const responseBody = response.getContentText();
   
           // Parse the entire response
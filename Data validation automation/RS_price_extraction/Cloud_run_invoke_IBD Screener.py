@@ -1,8 +1,7 @@
 import os
 import json
 import requests
-import google.oauth2.id_token
-import google.auth.transport.requests
+from id_tokens import get_id_token
 
 # Set Google Application Credentials
 os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = 'Data validation automation/RS_price_extraction/dj-ds-marketdata-nonprod-5b2c59fc4bff.json'
@@ -10,11 +9,6 @@ os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = 'Data validation automation/RS_pr
 # Define the Cloud Run URL and audience
 audience = 'https://us-central1-dj-ds-marketdata-nonprod.cloudfunctions.net/Transfer_Screener_data_to_Bigquery'
 
-# Fetch the identity token
-def get_id_token(audience_url):
-    request = google.auth.transport.requests.Request()
-    return google.oauth2.id_token.fetch_id_token(request, audience_url)
-
 # Make the GET request
 def invoke_cloud_run():
     # Fetch the token
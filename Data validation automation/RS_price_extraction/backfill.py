@@ -0,0 +1,160 @@
+"""
+Date-range backfill of the RS feeds.
+
+A backfill loads the feeds of file_config.csv for every day between a start and an end date. The files are
+selected as in the daily run (select_daily_files): the last file of each feed and day, never a file of today.
+plan_backfill compares the selection with the days already in the tables and returns one row per feed and day,
+with the status of the day:
+- loaded: a file of the day is already in the table
+- to_load: the file of the day is loaded by the backfill
+- no_file: no file of the feed was delivered that day
+
+run_backfill loads the to_load files in batches of BACKFILL_BATCH_DAYS consecutive days. The files of a batch are
+loaded in parallel (BACKFILL_MAX_WORKERS), the progress is printed after every batch. A failed file does not stop
+the backfill, it stays missing in the table and is planned again by the next backfill.
+
+Memory: every worker holds a whole file at once, its downloaded bytes (a ranged download of a large file, see
+s3_download.py), the parsed frame and the frame being loaded. The peak memory of a backfill is about
+BACKFILL_MAX_WORKERS times that of the daily run for the largest feed, so the default is 2. Raise it only on
+instances with the memory for it.
+
+Usage (from the Data validation automation folder):
+    python RS_price_extraction/main.py --mode backfill --start-date 2025-02-01 --end-date 2025-02-28 --dry-run
+    python RS_price_extraction/main.py --mode backfill --start-date 2025-02-01 --feeds wonW_WONDB_Secmaster
+"""
+import os
+import time
+import datetime
+import concurrent.futures
+import pandas as pd
+from run_metrics import run_timed
+
+#Files before this date are not loaded by the daily run
+INGESTION_START_DATE = os.environ.get('RS_INGESTION_START_DATE', '2025-01-23')
+#Files downloaded, parsed and loaded at the same time, each worker holds a whole file in memory
+BACKFILL_MAX_WORKERS = int(os.environ.get('RS_BACKFILL_MAX_WORKERS', 2))
+#Days of a batch, the progress is reported after every batch
+BACKFILL_BATCH_DAYS = int(os.environ.get('RS_BACKFILL_BATCH_DAYS', 7))
+
+
+def select_daily_files(folder_df: pd.DataFrame, feeds: list, start_date=None, end_date=None) -> pd.DataFrame:
+    """
+    Selects the files to load from the S3 listing: the last file of each feed and day.
+
+    :param folder_df: listing returned by list_folder_contents
+    :param feeds: S3 file names (FileName) to load
+    :param start_date: first day to load, INGESTION_START_DATE if None
+    :param end_date: optional last day to load. Files of today are never selected.
+    :return: one row of the listing per feed and day, with the FileDay column added
+    """
+    start_day = pd.Timestamp(start_date or INGESTION_START_DATE).normalize()
+
+    #pick only selected files, with a parsed file date
+    folder_df = folder_df[folder_df['FileName'].isin(feeds) & folder_df['FileDate'].notna()]
+    folder_df = folder_df[pd.to_datetime(folder_df['FileDate']) >= start_day].copy()
+
+    #Where multiple files are available, pick only the latest one
+    #Rationale: the last intraday file is closest in time of extraction to history files on the drive.
+    #Additionally, the last intraday extract is the most consistent with history files
+
+    #Add file date to support daily partitioning
+    folder_df['FileDay'] = pd.to_datetime(folder_df['FileDate']).dt.date
+    if end_date is not None:
+        folder_df = folder_df[folder_df['FileDay'] <= pd.Timestamp(end_date).date()]
+
+    #Including only the last file each day
+    folder_df = folder_df.loc[folder_df.groupby(['FileName', 'FileDay'])['FileDate'].idxmax()]
+
+    #Ensures that the script is only ingesting file from the previous day. To avoid picking up a midday file instead of the last file of the day
+    return folder_df.loc[folder_df['FileDay'] != datetime.date.today()]
+
+
+def plan_backfill(selected_df: pd.DataFrame, feed_tables: dict, start_date, end_date, loaded_days: dict) -> pd.DataFrame:
+    """
+    Returns the backfill plan, one row per feed and day of the range.
+
+    :param selected_df: files returned by select_daily_files for the same range
+    :param feed_tables: S3 file name -> BigQuery table of the feeds to backfill
+    :param start_date: first day of the range
+    :param end_date: last day of the range
+    :param loaded_days: S3 file name -> set of days (datetime.date) already in the table
+    :return: DataFrame with FileName, FileDay, Bigquery_table, ObjectKey, FileDateRaw and status (loaded, to_load or no_file)
+    """
+    days = pd.date_range(pd.Timestamp(start_date).normalize(), pd.Timestamp(end_date).normalize(), freq='D').date
+    plan = pd.DataFrame([(feed, day) for feed in feed_tables for day in days], columns=['FileName', 'FileDay'])
+    plan['Bigquery_table'] = plan['FileName'].map(feed_tables)
+    plan = plan.merge(selected_df[['FileName', 'FileDay', 'ObjectKey', 'FileDateRaw']], on=['FileName', 'FileDay'], how='left')
+
+    is_loaded = [day in loaded_days.get(feed, ()) for feed, day in zip(plan['FileName'], plan['FileDay'])]
+    plan['status'] = 'to_load'
+    plan.loc[plan['ObjectKey'].isna(), 'status'] = 'no_file'
+    plan.loc[is_loaded, 'status'] = 'loaded'
+    return plan
+
+
+def backfill_batches(plan: pd.DataFrame, batch_days: int = BACKFILL_BATCH_DAYS) -> list:
+    """
+    Splits the to_load files of a plan into batches of batch_days consecutive days (days with a file to load).
+
+    :return: list of DataFrames, in date order
+    """
+    to_load = plan[plan['status'] == 'to_load'].sort_values(['FileDay', 'FileName'])
+    days = sorted(to_load['FileDay'].unique())
+    return [to_load[to_load['FileDay'].isin(days[start:start + batch_days])] for start in range(0, len(days), max(batch_days, 1))]
+
+
+def format_plan(plan: pd.DataFrame, batch_days: int = BACKFILL_BATCH_DAYS) -> str:
+    """
+    Returns the plan as text, one line per feed, and the days without a file.
+    """
+    if plan.empty:
+        return "Backfill plan: no days in the range"
+    batches = backfill_batches(plan, batch_days)
+    lines = [f"Backfill plan {plan['FileDay'].min()} - {plan['FileDay'].max()}: {int((plan['status'] == 'to_load').sum())} files to load "
+             f"in {len(batches)} batches of up to {batch_days} days"]
+    for (feed, table), feed_plan in plan.groupby(['FileName', 'Bigquery_table'], sort=False):
+        counts = feed_plan['status'].value_counts()
+        lines.append(f"  {feed} -> {table}: {counts.get('to_load', 0)} to load, {counts.get('loaded', 0)} already loaded, "
+                     f"{counts.get('no_file', 0)} days without a file")
+        no_file_days = feed_plan.loc[feed_plan['status'] == 'no_file', 'FileDay']
+        if len(no_file_days):
+            lines.append(f"    days without a file: {', '.join(str(day) for day in no_file_days)}")
+    return '\n'.join(lines)
+
+
+def run_backfill(plan: pd.DataFrame, load_file, max_workers: int = BACKFILL_MAX_WORKERS, batch_days: int = BACKFILL_BATCH_DAYS) -> list:
+    """
+    Loads the to_load files of a plan, batch by batch, the files of a batch in parallel.
+
+    :param plan: plan returned by plan_backfill
+    :param load_file: function called with a row of the plan, returns the status of the file (e.g. 'loaded').
+        An exception fails the file, the other files are still loaded.
+    :param max_workers: files loaded at the same time
+    :param batch_days: days of a batch
+    :return: list of dict with file, feed, day, table, batch, status, error and duration_s, in date order
+    """
+    batches = backfill_batches(plan, batch_days)
+    total = sum(len(batch) for batch in batches)
+    results = []
+    start = time.perf_counter()
+
+    for batch_number, batch in enumerate(batches, start=1):
+        rows = [row for _, row in batch.iterrows()]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='rs-backfill') as executor:
+            outcomes = list(executor.map(lambda row: run_timed(load_file, row), rows))
+
+        for row, (status, error, seconds) in zip(rows, outcomes):
+            results.append({'file': row['ObjectKey'], 'feed': row['FileName'], 'day': str(row['FileDay']), 'table': row['Bigquery_table'],
+                            'batch': batch_number, 'status': status, 'error': error, 'duration_s': round(seconds, 3)})
+            if error:
+                print(f"{row['ObjectKey']} failed: {error}")
+
+        #Progress after every batch, the remaining time is extrapolated from the files done so far
+        done = len(results)
+        elapsed = time.perf_counter() - start
+        failed = sum(result['status'] == 'failed' for result in results)
+        remaining = elapsed / done * (total - done)
+        print(f"Batch {batch_number}/{len(batches)} ({batch['FileDay'].min()} - {batch['FileDay'].max()}): "
+              f"{done}/{total} files, {failed} failed, {elapsed:.1f}s elapsed, about {remaining:.0f}s remaining")
+
+    return results
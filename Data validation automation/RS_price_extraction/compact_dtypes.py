@@ -0,0 +1,137 @@
+"""
+Memory optimisation of frames before the BigQuery load.
+
+Screener and S3 frames arrive with object and float64 columns. compact_dtypes converts them to smaller
+types that load into the same BigQuery column types:
+- integers are downcast (int8/int16/int32, or the nullable Int variants), they still load as INTEGER
+- float64 columns are stored as float32 only if no value changes (FLOAT keeps full precision otherwise)
+- object columns of Python numbers, dates and timestamps get the matching numeric, Arrow date32 or datetime type
+- DATE/TIMESTAMP text columns of the destination table are parsed once
+- low-cardinality text becomes categorical, only for STRING columns of an existing destination table.
+  The BigQuery client converts categoricals with the table schema, but cannot detect their type for a new table.
+The memory of every column before and after is returned as a report.
+
+NOTE: every Cloud Function folder is deployed on its own, so this file is copied into each folder
+that uses it. Keep the copies identical.
+"""
+import numpy as np
+import pandas as pd
+from lazy_imports import lazy_import
+
+#Imported on first use, see lazy_imports.py
+pa = lazy_import('pyarrow')
+
+# Text columns with at most this share of distinct values are converted to categorical
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+
+def _is_text(series: pd.Series) -> bool:
+    if pd.api.types.is_string_dtype(series.dtype) and not series.dtype == object:
+        return True
+    # Object columns are text only if every value is a string, mixed JSON values are left as they are
+    return series.dtype == object and series.map(lambda value: value is None or isinstance(value, str) or value != value).all()
+
+
+def _compact_column(series: pd.Series, bq_type: str = None, category_max_unique_ratio: float = CATEGORY_MAX_UNIQUE_RATIO) -> pd.Series:
+    dtype = series.dtype
+
+    if isinstance(dtype, pd.CategoricalDtype) or isinstance(dtype, pd.ArrowDtype):
+        return series
+
+    if pd.api.types.is_bool_dtype(dtype):
+        return series
+
+    if pd.api.types.is_integer_dtype(dtype):
+        if pd.api.types.is_extension_array_dtype(dtype):
+            # Nullable integers (e.g. Int64 from convert_dataframe_types), the smallest type holding min and max
+            values = series.dropna()
+            if values.empty:
+                return series
+            for candidate in ('Int8', 'Int16', 'Int32'):
+                info = np.iinfo(candidate.lower())
+                if info.min <= values.min() and values.max() <= info.max:
+                    return series.astype(candidate)
+            return series
+        return pd.to_numeric(series, downcast='integer')
+
+    if pd.api.types.is_float_dtype(dtype):
+        if dtype == np.float64:
+            downcast = series.astype(np.float32)
+            # Only if every value is kept exactly, BigQuery FLOAT is float64
+            if np.array_equal(downcast.astype(np.float64).to_numpy(), series.to_numpy(), equal_nan=True):
+                return downcast
+        return series
+
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return series
+
+    if dtype == object or pd.api.types.is_string_dtype(dtype):
+        non_null = series.dropna()
+        if non_null.empty:
+            return series
+
+        # Text dates of DATE/TIMESTAMP columns are parsed once here instead of on every use
+        if bq_type in ('DATE', 'TIMESTAMP') and _is_text(series):
+            parsed = pd.to_datetime(series, errors='coerce', format='mixed')
+            if bq_type == 'TIMESTAMP':
+                return parsed
+            series = parsed.dt.date.astype(object).where(parsed.notna(), None)
+
+        if series.dtype == object:
+            # Python values (e.g. JSON numbers from Screener or dates from .dt.date) are typed by Arrow inference,
+            # only into types that load into the same BigQuery column type
+            try:
+                array = pa.array(series, from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                array = None
+            if array is not None:
+                if pa.types.is_date32(array.type) and bq_type in (None, 'DATE'):
+                    return pd.Series(pd.arrays.ArrowExtensionArray(array), index=series.index, name=series.name)
+                if pa.types.is_integer(array.type) and bq_type in (None, 'INTEGER', 'INT64'):
+                    return _compact_column(series.astype('Int64'), bq_type, category_max_unique_ratio)
+                if pa.types.is_floating(array.type) and bq_type in (None, 'FLOAT', 'FLOAT64'):
+                    return _compact_column(series.astype(np.float64), bq_type, category_max_unique_ratio)
+                if pa.types.is_timestamp(array.type) and bq_type in (None, 'TIMESTAMP'):
+                    return pd.to_datetime(series)
+
+        if bq_type == 'STRING' and _is_text(series):
+            if series.nunique(dropna=True) <= category_max_unique_ratio * len(series):
+                return series.astype('category')
+
+    return series
+
+
+def compact_dtypes(df: pd.DataFrame, bq_schema: dict = None, category_max_unique_ratio: float = CATEGORY_MAX_UNIQUE_RATIO):
+    """
+    Converts the columns of the frame to smaller types that load into the same BigQuery column types.
+
+    :param df: frame to be loaded
+    :param bq_schema: column types of the destination table (see get_schema in warehouse_sink.py). Without it no column
+        is converted to categorical and text is not parsed as dates.
+    :param category_max_unique_ratio: text columns with at most this share of distinct values become categorical
+    :return: converted frame, report DataFrame with the dtype and memory of every column before and after
+    """
+    bq_schema = bq_schema or {}
+    report = []
+    converted = {}
+
+    for col in df.columns:
+        series = df[col]
+        bytes_before = int(series.memory_usage(deep=True, index=False))
+        new_series = _compact_column(series, bq_schema.get(col), category_max_unique_ratio)
+        bytes_after = int(new_series.memory_usage(deep=True, index=False))
+
+        converted[col] = new_series
+        report.append({
+            'column': col,
+            'dtype_before': str(series.dtype),
+            'dtype_after': str(new_series.dtype),
+            'bytes_before': bytes_before,
+            'bytes_after': bytes_after,
+        })
+
+    compact_df = pd.DataFrame(converted, index=df.index)
+    report_df = pd.DataFrame(report, columns=['column', 'dtype_before', 'dtype_after', 'bytes_before', 'bytes_after'])
+    report_df['saved_pct'] = (100 * (1 - report_df['bytes_after'] / report_df['bytes_before'].where(report_df['bytes_before'] > 0))).round(1).fillna(0.0)
+
+    return compact_df, report_df
@@ -0,0 +1,189 @@
+"""
+Local cache of parsed S3 feed files.
+
+Feed files are immutable timestamped keys, so a parsed file can be reused as long as its ETag is unchanged.
+Frames are stored as Feather (Arrow IPC) files, keyed by bucket, key, ETag and parse options (e.g. the
+projected columns). The cache is size-limited, the least recently used frames are evicted first.
+The encoding that parsed a file is kept even after its frame was evicted, so a new download skips
+the failing attempts.
+
+The cache is off by default (FEED_CACHE_MAX_MB = 0): a scheduled run reads each file once, the cache only pays off
+when the same files are parsed again, e.g. in local runs. Several processes can share the directory. The directory
+itself is the index of the frames: a frame is written to a temporary file and renamed, its modification time is its
+last access and the eviction scans the directory, so the frames of every process are counted. index.json only holds
+the encodings, it is reloaded and merged before every write.
+
+NOTE: every Cloud Function folder is deployed on its own, so this file is copied into each folder
+that uses it. Keep the copies identical.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import pandas as pd
+
+# Location and size limit of the cache. On Cloud Functions the temp directory is held in memory,
+# so the limit counts against the memory of the instance. A limit of 0 (default) disables the cache.
+FEED_CACHE_DIR = os.environ.get('FEED_CACHE_DIR', os.path.join(tempfile.gettempdir(), 's3_feed_cache'))
+FEED_CACHE_MAX_MB = float(os.environ.get('FEED_CACHE_MAX_MB', 0))
+
+_INDEX_FILE_NAME = 'index.json'
+_FRAME_SUFFIX = '.feather'
+_feed_cache = None
+
+
+class FeedCache:
+    """
+    Size-limited cache of parsed feed files.
+
+    :param cache_dir: directory of the cached frames and of the index
+    :param max_mb: maximum total size of the cached frames in MB
+    """
+    def __init__(self, cache_dir: str = FEED_CACHE_DIR, max_mb: float = FEED_CACHE_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_path = os.path.join(cache_dir, _INDEX_FILE_NAME)
+        self._encodings = self._read_encodings()
+
+    def _read_encodings(self) -> dict:
+        try:
+            with open(self._index_path, 'r') as f:
+                return json.load(f).get('encodings', {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def _write_encodings(self):
+        # The encodings of other processes are merged in, the file is replaced in one step so it is never read half written
+        self._encodings = {**self._read_encodings(), **self._encodings}
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.index_', suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'encodings': self._encodings}, f)
+            os.replace(temp_path, self._index_path)
+        except OSError as e:
+            print(f"Feed cache index could not be written: {e}")
+
+    @staticmethod
+    def _file_id(bucket_name: str, file_key: str, etag: str) -> str:
+        return f"{bucket_name}/{file_key}@{etag}"
+
+    @staticmethod
+    def _entry_id(bucket_name: str, file_key: str, etag: str, variant: dict = None) -> str:
+        source = json.dumps([bucket_name, file_key, etag, variant], sort_keys=True, default=str)
+        return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+    def _path(self, entry_id: str) -> str:
+        return os.path.join(self.cache_dir, f"{entry_id}{_FRAME_SUFFIX}")
+
+    def _frames(self) -> list:
+        """
+        Returns (path, bytes, last access) of the cached frames of all processes, least recently used first.
+        """
+        frames = []
+        try:
+            entries = list(os.scandir(self.cache_dir))
+        except OSError:
+            return frames
+        for entry in entries:
+            if not entry.name.endswith(_FRAME_SUFFIX):
+                continue
+            try:
+                entry_stat = entry.stat()
+            except OSError:
+                #Evicted by another process meanwhile
+                continue
+            frames.append((entry.path, entry_stat.st_size, entry_stat.st_mtime))
+        return sorted(frames, key=lambda frame: frame[2])
+
+    def get(self, bucket_name: str, file_key: str, etag: str, variant: dict = None):
+        """
+        Returns the cached frame of the file version, or None if it is not cached.
+
+        :param variant: parse options the frame depends on, e.g. {'columns': [...], 'dtypes': {...}}
+        """
+        path = self._path(self._entry_id(bucket_name, file_key, etag, variant))
+        if not os.path.exists(path):
+            return None
+        try:
+            df = pd.read_feather(path)
+        except (OSError, ValueError) as e:
+            print(f"Cached frame of {file_key} could not be read, it is downloaded again: {e}")
+            return None
+
+        #The modification time is the last access of the frame
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return df
+
+    def put(self, bucket_name: str, file_key: str, etag: str, df: pd.DataFrame, variant: dict = None):
+        """
+        Stores the parsed frame of the file version, then evicts the least recently used frames over the size limit.
+        Frames that cannot be stored as Feather (e.g. mixed type object columns) are skipped.
+        """
+        path = self._path(self._entry_id(bucket_name, file_key, etag, variant))
+        temp_path = None
+        try:
+            #Written under a temporary name, other processes only ever see complete frames
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.frame_', suffix='.tmp')
+            os.close(fd)
+            df.reset_index(drop=True).to_feather(temp_path)
+            os.replace(temp_path, path)
+        except Exception as e:
+            print(f"Frame of {file_key} could not be cached: {e}")
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self._evict()
+
+    def _evict(self):
+        frames = self._frames()
+        total_bytes = sum(size for _, size, _ in frames)
+        for path, size, _ in frames:
+            if total_bytes <= self.max_bytes:
+                break
+            total_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_encoding(self, bucket_name: str, file_key: str, etag: str):
+        """
+        Returns the encoding that parsed the file version last time, or None.
+        """
+        return self._encodings.get(self._file_id(bucket_name, file_key, etag))
+
+    def set_encoding(self, bucket_name: str, file_key: str, etag: str, encoding: str):
+        file_id = self._file_id(bucket_name, file_key, etag)
+        if self._encodings.get(file_id) != encoding:
+            self._encodings[file_id] = encoding
+            self._write_encodings()
+
+    def size_mb(self) -> float:
+        return sum(size for _, size, _ in self._frames()) / 1024 / 1024
+
+
+def get_feed_cache():
+    """
+    Returns the cache of the process, or None if the cache is disabled (FEED_CACHE_MAX_MB = 0)
+    or the cache directory cannot be created.
+    """
+    global _feed_cache
+    if _feed_cache is None and FEED_CACHE_MAX_MB > 0:
+        try:
+            _feed_cache = FeedCache(FEED_CACHE_DIR, FEED_CACHE_MAX_MB)
+        except OSError as e:
+            print(f"Feed cache is disabled: {e}")
+    return _feed_cache
+
+
+def encoding_order(preferred: str = None, encodings: tuple = ('ISO-8859-1', 'cp1252')) -> list:
+    """
+    Returns the encodings to try, the one that worked last time first.
+    """
+    if preferred is None:
+        return list(encodings)
+    return [preferred] + [encoding for encoding in encodings if encoding != preferred]
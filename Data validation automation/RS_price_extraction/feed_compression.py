@@ -0,0 +1,73 @@
+"""
+Compressed feed files.
+
+The feeds can be delivered compressed, e.g. wonW_WONDB_Secmaster_20250128210422.csv.gz, 5-10x smaller to
+transfer. The compression of a file is given by the extension of its key (.gz, .bz2, .zst), or by the magic
+bytes at the start of its content for keys without a compression extension. The key parsing strips the whole
+extension (.csv, .csv.gz, ...), so FileName and FileDate are the same for compressed and plain files.
+
+Compressed files are decompressed while they are parsed: the parser reads from a decompressing stream
+(pyarrow codecs, no further dependency), the decompressed file is never held in memory in full.
+
+NOTE: every Cloud Function folder is deployed on its own, so this file is copied into each folder
+that uses it. Keep the copies identical.
+"""
+import os
+from io import BytesIO
+from lazy_imports import lazy_import
+
+#Imported on first use, see lazy_imports.py
+pa = lazy_import('pyarrow')
+
+# Compression extensions and the pyarrow codec reading them
+COMPRESSION_EXTENSIONS = {'.gz': 'gzip', '.gzip': 'gzip', '.bz2': 'bz2', '.zst': 'zstd', '.zstd': 'zstd'}
+_MAGIC_BYTES = {b'\x1f\x8b': 'gzip', b'BZh': 'bz2', b'\x28\xb5\x2f\xfd': 'zstd'}
+
+
+def _compression_extension(file_name: str) -> str:
+    lower_name = file_name.lower()
+    return next((extension for extension in COMPRESSION_EXTENSIONS if lower_name.endswith(extension)), '')
+
+
+def feed_extension(file_name: str) -> str:
+    """
+    Returns the whole extension of a file name, including the compression extension, e.g. '.csv.gz'.
+    An empty string is returned for a name without extension.
+    """
+    compression_extension = _compression_extension(file_name)
+    name = file_name[:len(file_name) - len(compression_extension)]
+    return os.path.splitext(name)[1] + compression_extension
+
+
+def detect_compression(file_key: str, content=None) -> str:
+    """
+    Returns the codec of a file (gzip, bz2 or zstd), from the extension of its key or the magic bytes
+    of its content, or None if it is not compressed.
+
+    :param content: optional first bytes (or all bytes) of the file
+    """
+    compression_extension = _compression_extension(file_key)
+    if compression_extension:
+        return COMPRESSION_EXTENSIONS[compression_extension]
+    if content is not None:
+        head = bytes(content[:4])
+        return next((codec for magic, codec in _MAGIC_BYTES.items() if head.startswith(magic)), None)
+    return None
+
+
+def open_feed(source, compression: str = None):
+    """
+    Returns a binary file object reading the decompressed file.
+
+    :param source: bytes-like content of the file, or a readable binary file object (io.RawIOBase or io.BufferedIOBase),
+                   e.g. a wrapper of the Body of a get_object response
+    :param compression: codec returned by detect_compression, None for a plain file
+    """
+    if compression is None:
+        return BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = pa.py_buffer(source)
+    elif not isinstance(source, pa.NativeFile):
+        #Python file objects are read through pyarrow as they are consumed, chunk by chunk
+        source = pa.PythonFile(source, mode='r')
+    return pa.input_stream(source, compression=compression)
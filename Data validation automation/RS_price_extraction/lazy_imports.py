@@ -0,0 +1,63 @@
+"""
+Lazy imports of heavy client libraries.
+
+A Cloud Function imports its main module on every cold start, before the first request is served.
+google.cloud.bigquery, boto3, pyarrow and the Google API clients take from 0.1s to 0.5s each to import,
+even on paths that never use them (e.g. a DuckDB sink run, or an S3 extract without BigQuery).
+lazy_import returns a placeholder that imports the module on its first attribute access:
+
+    bigquery = lazy_import('google.cloud.bigquery')
+    ...
+    client = bigquery.Client(...)   # google.cloud.bigquery is imported here
+
+Set LAZY_IMPORTS=0 to import everything eagerly, e.g. to compare cold starts (see Benchmarks/import_profile.py).
+
+NOTE: every Cloud Function folder is deployed on its own, so this file is copied into each folder
+that uses it. Keep the copies identical.
+"""
+import os
+import time
+import threading
+import importlib
+
+LAZY_IMPORTS = os.environ.get('LAZY_IMPORTS', '1') != '0'
+
+# Seconds spent importing each lazy module on its first use
+import_times = {}
+
+
+class LazyModule:
+    """
+    Placeholder of a module, imported on the first attribute access. Thread safe.
+
+    :param name: full module name, e.g. 'google.cloud.bigquery'
+    """
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                start = time.perf_counter()
+                self._module = importlib.import_module(self._name)
+                import_times[self._name] = round(time.perf_counter() - start, 4)
+        return self._module
+
+    def __getattr__(self, attribute):
+        module = self._module if self._module is not None else self._load()
+        return getattr(module, attribute)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name: str):
+    """
+    Returns the module, imported on its first use. With LAZY_IMPORTS=0 it is imported immediately.
+    """
+    if not LAZY_IMPORTS:
+        return importlib.import_module(name)
+    return LazyModule(name)
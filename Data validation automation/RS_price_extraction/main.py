@@ -1,44 +1,51 @@
 import os
+import argparse
 import pandas as pd
-from google.cloud import bigquery
-import glob
-from google.oauth2 import service_account
-import boto3
-from botocore.config import Config
 import json
-from io import StringIO
-import requests
+from lazy_imports import lazy_import
+from run_metrics import RunMetrics, optional_stage
+from feed_cache import get_feed_cache, encoding_order
+from feed_parser import parse_feed, FEED_PARSER
+from feed_compression import feed_extension, detect_compression
+from s3_download import download_object, s3_client_config
+from compact_dtypes import compact_dtypes
+from load_jobs import LoadJobTracker
+from table_spec import table_spec_from_row
+from warehouse_sink import get_sink, load_credentials
+from backfill import select_daily_files, plan_backfill, format_plan, run_backfill, BACKFILL_MAX_WORKERS, BACKFILL_BATCH_DAYS
 
+#Imported on first use, see lazy_imports.py
+boto3 = lazy_import('boto3')
+requests = lazy_import('requests')
 
 
-def load_to_bigquery(df :pd,dataset_id, table_id, credentials):
+
+def load_to_bigquery(df :pd,dataset_id, table_id, credentials, wait=True, table_spec=None):
     """
     Inserts the provided dataframe into the selected BigQuery table
 
     :param dataset_id: source data extracted from S3
     :param table_id: destination table name
     :param credentials: credentials of GCP service account
-    :return: None
+    :param wait: if False, the job is only submitted and the caller waits for it (see LoadJobTracker)
+    :param table_spec: partitioning and clustering of the table, see table_spec_from_row
+    :return: load job
     """
-    # Initialize the BigQuery client with the credentials
-    client = bigquery.Client(credentials=credentials, project=credentials.project_id)
-
-    # Define the table reference
-    table_ref = client.dataset(dataset_id).table(table_id) 
-    job_config = bigquery.LoadJobConfig(
-    write_disposition=bigquery.WriteDisposition.WRITE_APPEND,  # Options: WRITE_TRUNCATE, WRITE_APPEND, WRITE_EMPTY
-    source_format=bigquery.SourceFormat.CSV,
-    autodetect=False,  # Automatically detect the schema
-    )
-    # Load the DataFrame into BigQuery
-    load_job = client.load_table_from_dataframe(df, table_ref, job_config=job_config)
-    load_job.result()  # Wait for the job to complete
+    # Load the DataFrame into the warehouse (BigQuery, or DuckDB for local runs)
+    load_job = get_sink(credentials).load(df, dataset_id, table_id,
+                                          write_disposition='WRITE_APPEND',  # Options of bigquery.WriteDisposition: WRITE_TRUNCATE, WRITE_APPEND, WRITE_EMPTY
+                                          autodetect=False,  # Automatically detect the schema
+                                          table_spec=table_spec, wait=wait)
+    if wait:
+        print(f'Successfully loaded {load_job.output_rows} rows into {dataset_id}.{table_id}')
+    else:
+        print(f'Submitted load job {load_job.job_id} into {dataset_id}.{table_id}')
 
-    print(f'Successfully loaded {load_job.output_rows} rows into {dataset_id}.{table_id}')
+    return load_job
 
 
 
-def select_uniqueue_from_bigquery(dataset_id :str, table_id :str, columns : list,  credentials ,limit=None):
+def select_uniqueue_from_bigquery(dataset_id :str, table_id :str, columns : list,  credentials ,limit=None, filters : dict = None, since=None, stats : dict = None):
     """
     Retrieves specific columns from a BigQuery table and returns only uniqueue
 
@@ -48,12 +55,15 @@ def select_uniqueue_from_bigquery(dataset_id :str, table_id :str, columns : list
         :param columns (list): List of column names to retrieve.
         :param credentials: credentials of GCP service account
         :param limit (int, optional): Number of rows to retrieve. If None, retrieves all rows.
+        :param filters (dict, optional): column -> value, only rows equal to all values are retrieved
+        :param since (optional): only partitions from this date on are scanned, if the table is partitioned (see partition_filter)
+        :param stats (dict, optional): bytes processed and billed of the query are added to it
 
     Returns:
         pandas.DataFrame: A DataFrame containing the retrieved columns.
     """
-    # Initialize BigQuery client
-    client = bigquery.Client(credentials=credentials, project=credentials.project_id)
+    # BigQuery, or DuckDB for local runs
+    sink = get_sink(credentials)
 
     # Format the columns into a comma-separated string
     columns_str = ', '.join(columns)
@@ -61,16 +71,24 @@ def select_uniqueue_from_bigquery(dataset_id :str, table_id :str, columns : list
     # Construct the query
     query = f"""
     SELECT distinct {columns_str}
-    FROM `{credentials.project_id}.{dataset_id}.{table_id}`
+    FROM {sink.table_name(dataset_id, table_id)}
     """
+    #Values are passed as query parameters, the partition filter is a constant so BigQuery can prune partitions
+    conditions = [f"{column} = @{column}" for column in (filters or {})]
+    if since is not None:
+        pruning_condition = sink.partition_filter(dataset_id, table_id, since)
+        if pruning_condition is not None:
+            conditions.append(pruning_condition)
+    if conditions:
+        query += f" WHERE {' AND '.join(conditions)}"
     if limit is not None:
         query += f" LIMIT {limit}"
 
-    # Execute the query
-    query_job = client.query(query)
+    # Execute the query and convert the result to a DataFrame
+    results = sink.query(query, parameters={column: str(value) for column, value in (filters or {}).items()}, stats=stats)
 
-    # Convert the result to a DataFrame
-    results = query_job.result().to_dataframe()
+    if stats is not None:
+        stats['partition_pruning'] = since is not None and len(conditions) > len(filters or {})
 
     return results
 
@@ -92,7 +110,10 @@ def fileName_metadata(full_path : str,file_part : str):
     if file_part=='FileName':
         output = file_name[1:last_underscore_index]
     elif file_part=='FileDate':
-        output = file_name[last_underscore_index+1:-4]
+        #The whole extension is stripped, also of compressed files (e.g. .csv.gz, see feed_compression.py)
+        base_name = full_path[last_slash_index+1:]
+        stem = base_name[:len(base_name)-len(feed_extension(base_name))]
+        output = stem[stem.rfind('_')+1:]
     else:
         output = ''
     
@@ -144,7 +165,7 @@ def list_folder_contents(bucket_name, folder_path, aws_access_key_id, aws_secret
     return df
 
 
-def ingest_file_from_s3(bucket_name, file_key, aws_access_key_id, aws_secret_access_key, env):
+def ingest_file_from_s3(bucket_name, file_key, aws_access_key_id, aws_secret_access_key, env, metrics=None, use_cache=True):
     """
     Downloads a selected file from S3 and ingests it into a Pandas DataFrame.
 
@@ -153,6 +174,8 @@ def ingest_file_from_s3(bucket_name, file_key, aws_access_key_id, aws_secret_acc
     :param aws_access_key_id: AWS access key ID
     :param aws_secret_access_key: AWS secret access key
     :param env: Environment where the file is taken from
+    :param metrics: optional RunMetrics, download and parse are recorded as separate stages
+    :param use_cache: if True, the parsed file is taken from / stored in the local feed cache (keyed by bucket, key and ETag)
     :return: Pandas DataFrame containing the file data
     """
     # Initialize a session using the provided credentials
@@ -161,29 +184,62 @@ def ingest_file_from_s3(bucket_name, file_key, aws_access_key_id, aws_secret_acc
         aws_secret_access_key=aws_secret_access_key
     )
     
-    # Access the S3 client
-    s3_client = session.client('s3')
-    
-    # Download the file content as a string
-    response = s3_client.get_object(Bucket=bucket_name, Key=file_key)
-    file_content = response['Body'].read().decode('ISO-8859-1')
-    
-    # Load the file content into a Pandas DataFrame
-    try:
-        df = pd.read_csv(StringIO(file_content),sep='|' ,encoding='ISO-8859-1')
-    except UnicodeDecodeError:
-        # If 'ISO-8859-1' fails, try 'cp1252'
-        df = pd.read_csv(StringIO(file_content), sep='|', encoding='cp1252')
-    
-    #Adding file metadata
-    df['SourceEnv'] = env 
-    df['FileName'] = fileName_metadata(file_key,'FileName')
-    df['FileDate'] = fileName_metadata(file_key,'FileDate')
-    df['repDate']  = pd.to_datetime('today')
+    # Access the S3 client, with a pooled connection per ranged download worker
+    s3_client = session.client('s3', config=s3_client_config())
+
+    cache = get_feed_cache() if use_cache else None
+    head = None
+    df = None
+    if cache is not None:
+        with optional_stage(metrics, 'cache_lookup', file=file_key) as stage:
+            #Only the ETag is requested, a cached file needs no download
+            head = s3_client.head_object(Bucket=bucket_name, Key=file_key)
+            etag = head['ETag']
+            df = cache.get(bucket_name, file_key, etag)
+            stage['hit'] = df is not None
+        if metrics is not None:
+            metrics.count('feed_cache_hits' if df is not None else 'feed_cache_misses')
+
+    if df is None:
+        with optional_stage(metrics, 'download', file=file_key) as stage:
+            # Download the file content, large files in parallel byte ranges (see s3_download.py)
+            file_content, file_etag = download_object(s3_client, bucket_name, file_key,
+                                                      size=head['ContentLength'] if head else None, etag=head['ETag'] if head else None, stats=stage)
+
+        with optional_stage(metrics, 'parse', file=file_key) as stage:
+            # Load the file content into a Pandas DataFrame
+            # 'ISO-8859-1' is tried first, then 'cp1252'. The encoding that worked for this file before is tried first.
+            encodings = encoding_order(cache.get_encoding(bucket_name, file_key, file_etag) if cache is not None else None)
+            #Compressed files are decompressed while they are parsed
+            compression = detect_compression(file_key, file_content)
+            for encoding in encodings:
+                try:
+                    #Parsed by the FEED_PARSER backend, pandas or the multithreaded Arrow reader (see feed_parser.py)
+                    df = parse_feed(file_content, encoding, compression=compression)
+                    break
+                except UnicodeDecodeError:
+                    if encoding == encodings[-1]:
+                        raise
+            stage['encoding'] = encoding
+            stage['parser'] = FEED_PARSER
+            stage['compression'] = compression
+
+        #The parsed file is cached without the metadata of the current run
+        if cache is not None:
+            cache.set_encoding(bucket_name, file_key, file_etag, encoding)
+            cache.put(bucket_name, file_key, file_etag, df)
+
+    with optional_stage(metrics, 'file_metadata', file=file_key) as stage:
+        #Adding file metadata
+        df['SourceEnv'] = env 
+        df['FileName'] = fileName_metadata(file_key,'FileName')
+        df['FileDate'] = fileName_metadata(file_key,'FileDate')
+        df['repDate']  = pd.to_datetime('today')
+        stage['rows'] = len(df)
 
     return df
 
-def file_in_BigQuery(file_name : str, file_date : str, environment : str, dataset_id : str, table_id : str, credentials)->bool:
+def file_in_BigQuery(file_name : str, file_date : str, environment : str, dataset_id : str, table_id : str, credentials, stats : dict = None)->bool:
     """
     Checks if the selected file is already ingested into Bigquery given the environment.
 
@@ -193,13 +249,18 @@ def file_in_BigQuery(file_name : str, file_date : str, environment : str, datase
     :param dataset_id: Bigquery dataset ID
     :param table_id: Bigquery table name
     :param credentials: Bigquery authentication credentials
+    :param stats: optional dict, bytes processed and billed of the query are added to it
     :return: Boolean value, True if the file is already ingested
     """
 
-    result_df = select_uniqueue_from_bigquery(dataset_id = dataset_id, table_id = table_id, columns =['FileName', 'FileDate','SourceEnv'],  credentials=credentials)
-    
-    #List of files to be excluded from insertion
-    result_df = result_df[(result_df['FileName'] == file_name) & (result_df['FileDate'] == file_date) & (result_df['SourceEnv'] == environment)]
+    #A file is loaded after it was written, so in a table partitioned by repDate only the partitions
+    #from the file date on can hold it. One day earlier for the time zone difference.
+    file_day = pd.to_datetime(file_date[:8], format='%Y%m%d', errors='coerce')
+    since = None if pd.isna(file_day) else file_day - pd.Timedelta(days=1)
+
+    #Only the rows of the selected file are retrieved, instead of every file of the table
+    result_df = select_uniqueue_from_bigquery(dataset_id = dataset_id, table_id = table_id, columns =['FileName', 'FileDate','SourceEnv'],  credentials=credentials,
+                                              limit=1, filters={'FileName': file_name, 'FileDate': file_date, 'SourceEnv': environment}, since=since, stats=stats)
 
     if len(result_df) > 0:
         return True
@@ -270,76 +331,139 @@ def run_screen(screen_name : str, environment :str, **kwargs)-> pd.DataFrame:
 
 
 
-def run_batch_process(source_env :str):
+def wait_for_loads(tracker : LoadJobTracker, metrics) -> list:
+    """
+    Waits for the load jobs submitted during the run, see LoadJobTracker.wait_all.
+
+    :return: one record per load job, empty if the loads were not submitted asynchronously
+    """
+    if tracker is None:
+        return []
+    with metrics.stage('bigquery_load_wait') as stage:
+        load_results = tracker.wait_all()
+        stage['jobs'] = len(load_results)
+        stage['failed_jobs'] = sum(load_result['error'] is not None for load_result in load_results)
+        stage['output_rows'] = sum(load_result['output_rows'] or 0 for load_result in load_results)
+    for load_result in load_results:
+        print(f"Load job {load_result['job_id']} into {load_result['table']}: {load_result['state']}, {load_result['output_rows']} rows in {load_result['duration_s']}s")
+    return load_results
+
+def read_config(source_env : str) -> dict:
+    """
+    Reads the S3 and BigQuery parameters of the selected environment.
+
+    :param source_env: Determines the source environment. (It can be STG or PROD)
+    :return: dict of bucket_name, folder_path, aws_access_key_id, aws_secret_access_key, credentials and dataset_id,
+        None if the environment is not matching
+    """
+    # Define authentication parameters and environment
+    #Read authentication parameters
+    with open('RS_price_extraction/config.json', 'r') as f:
+        data = f.read()
+    config = json.loads(data)
+
+    #S3 credentials
+    if source_env == 'STG':
+        folder_path = config['S3_DEFAULT_PATH_STG']
+    elif source_env == 'PROD':
+        folder_path = config['S3_DEFAULT_PATH_PROD']
+    else:
+        return None
+
+    #Define BigQuery parameters
+    # Path to your service account key file
+    key_path = 'RS_price_extraction/dj-ds-marketdata-nonprod-5b2c59fc4bff.json'
+
+    return {
+        'bucket_name': config['S3_BUCKET_NAME'],
+        'folder_path': folder_path,
+        'aws_access_key_id': config['S3_ACCESS_KEY'],
+        'aws_secret_access_key': config['S3_SECRET_KEY'],
+        # Load the credentials from the key file
+        'credentials': load_credentials(key_path),
+        #Dataset ID
+        'dataset_id': 'IBD_Automation',
+    }
+
+def read_file_config() -> pd.DataFrame:
+    """
+    Reads the file and table configuration, only the active files. If status is 0, the file is skipped from refresh.
+    """
+    config_df = pd.read_csv('RS_price_extraction/file_config.csv')
+    config_df['Active'] = pd.to_numeric(config_df['Active']) 
+    
+    #Keeping only files that are selected to be active by the user
+    return config_df.loc[config_df['Active']==1]
+
+def load_file(folder_row, config_row, source_env : str, run_config : dict, metrics, tracker : LoadJobTracker = None, use_cache : bool = False):
+    """
+    Ingests a file from S3 and loads it into the table of its config row.
+
+    :param folder_row: row of the S3 listing (ObjectKey)
+    :param config_row: row of file_config.csv matching the file
+    :param run_config: parameters returned by read_config
+    :param tracker: if given, the load job is only submitted and registered in the tracker
+    :param use_cache: see ingest_file_from_s3. Off by default, the daily run and the backfill read every file once
+    :return: load job
+    """
+    table_id = config_row['Bigquery_table']
+    dataset_id = run_config['dataset_id']
+    credentials = run_config['credentials']
+    file_df = ingest_file_from_s3(run_config['bucket_name'], folder_row['ObjectKey'], run_config['aws_access_key_id'], run_config['aws_secret_access_key'],
+                                  source_env, metrics=metrics, use_cache=use_cache)
+    if config_row.get('Compact_dtypes', 0) == 1:
+        with metrics.stage('compact_dtypes', file=folder_row['ObjectKey'], table=table_id) as stage:
+            #Smaller types loading into the same BigQuery column types, the memory of every column is logged
+            file_df, dtype_report = compact_dtypes(file_df, get_sink(credentials).get_schema(dataset_id, table_id))
+            stage['bytes_before'] = int(dtype_report['bytes_before'].sum())
+            stage['bytes_after'] = int(dtype_report['bytes_after'].sum())
+            stage['columns'] = dtype_report.to_dict('records')
+    with metrics.stage('bigquery_load', file=folder_row['ObjectKey'], table=table_id) as stage:
+        load_job = load_to_bigquery(file_df,dataset_id, table_id, credentials, wait=tracker is None, table_spec=table_spec_from_row(config_row))
+        stage['rows'] = len(file_df)
+        if tracker is not None:
+            stage['job_id'] = tracker.submit(load_job, file=folder_row['ObjectKey'], table=table_id)
+    metrics.count('files_loaded')
+    return load_job
+
+def run_batch_process(source_env :str, async_loads : bool = False):
     """
     Iterates through the S3 bucket in the selected environment and extracts the selected files. 
     Then the files are matched with the respective Bigquery table and inserted with a timestamp.
     :param source_env: Determines the source environment. (It can be STG or PROD)
+    :param async_loads: if True, load jobs are only submitted and all of them are waited for at the end of the run
     :return: None
     """
+    #Stage timings and memory of the run, returned in the response
+    metrics = RunMetrics('Transfer_IBD_files_to_Bigquery')
+    tracker = LoadJobTracker() if async_loads else None
     try:
 
-        # Define authentication parameters and environment
-        #Read authentication parameters
-        with open('RS_price_extraction/config.json', 'r') as f:
-            data = f.read()
-        config = json.loads(data)
-
-        #S3 credentials
-        bucket_name = config['S3_BUCKET_NAME']
-        if source_env == 'STG':
-            folder_path = config['S3_DEFAULT_PATH_STG']
-        elif source_env == 'PROD':
-            folder_path = config['S3_DEFAULT_PATH_PROD']
-        else:
-            return "Error: Environment not matching."
-        
-        aws_access_key_id = config['S3_ACCESS_KEY']
-        aws_secret_access_key = config['S3_SECRET_KEY']
-
-        #Define BigQuery parameters
-        # Path to your service account key file
-        key_path = 'RS_price_extraction/dj-ds-marketdata-nonprod-5b2c59fc4bff.json'
-        # Load the credentials from the key file
-        service_account_credentials = service_account.Credentials.from_service_account_file(key_path)
-        #Dataset ID
-        dataset_id = 'IBD_Automation'
+        with metrics.stage('read_config'):
+            run_config = read_config(source_env)
+            if run_config is None:
+                metrics.close()
+                return "Error: Environment not matching."
+            dataset_id = run_config['dataset_id']
+            service_account_credentials = run_config['credentials']
 
 
         # List folder contents
         print('Starting to read files')
-        folder_df = list_folder_contents(bucket_name, folder_path, aws_access_key_id, aws_secret_access_key)
+        with metrics.stage('listing') as stage:
+            folder_df = list_folder_contents(run_config['bucket_name'], run_config['folder_path'], run_config['aws_access_key_id'], run_config['aws_secret_access_key'])
+            stage['objects'] = len(folder_df)
         folder_df.to_csv('folder_list_30.csv')
         print('Finished reading files')
         #Apply conditions for file ingestion:
 
-        #File and table configuration. If status is 0, the file is skipped from refresh.
-        config_df = pd.read_csv('RS_price_extraction/file_config.csv')
-        config_df['S3_file_name'] = config_df['S3_file_name']
-        config_df['Bigquery_table'] = config_df['Bigquery_table']
-        config_df['Active'] = pd.to_numeric(config_df['Active']) 
-        
-        #Keeping only files that are selected to be active by the user
-        config_df = config_df.loc[config_df['Active']==1]
-
-        #pick only selected files
-        folder_df = folder_df[folder_df['FileName'].isin(config_df['S3_file_name'])]
-
-        #Including files only after 2025-01-23
-        folder_df = folder_df[folder_df['FileDate'] >= pd.Timestamp('2025-01-23')]
+        with metrics.stage('selection') as stage:
+            #File and table configuration
+            config_df = read_file_config()
 
-        #Where multiple files are available, pick only the latest one
-        #Rationale: the last intraday file is closest in time of extraction to history files on the drive.
-        #Additionally, the last intraday extract is the most consistent with history files
-        
-        #Add file date to support daily partitioning
-        folder_df['FileDay'] = folder_df['FileDate'].dt.date
-
-        #Including only the last file each day
-        folder_df = folder_df.loc[folder_df.groupby(['FileName','FileDay'])['FileDate'].idxmax()]
-        
-        #Ensures that the script is only ingesting file from the previous day. To avoid picking up a midday file instead of the last file of the day
-        folder_df = folder_df.loc[folder_df['FileDay'] != pd.Timestamp.today().normalize()]
+            #Including files only after INGESTION_START_DATE, only the last file each day (see backfill.py)
+            folder_df = select_daily_files(folder_df, config_df['S3_file_name'])
+            stage['files'] = len(folder_df)
 
         
         
@@ -353,12 +477,15 @@ def run_batch_process(source_env :str):
                     table_id = config_row['Bigquery_table']
                     
                     #Check if file is already in BigQuery
-                    file_exists = file_in_BigQuery(file_name=folder_row['FileName'],file_date=folder_row['FileDateRaw'],environment=source_env,dataset_id=dataset_id,table_id=table_id,credentials=service_account_credentials)
+                    with metrics.stage('dedupe_query', file=folder_row['ObjectKey'], table=table_id) as stage:
+                        file_exists = file_in_BigQuery(file_name=folder_row['FileName'],file_date=folder_row['FileDateRaw'],environment=source_env,dataset_id=dataset_id,table_id=table_id,credentials=service_account_credentials, stats=stage)
+                    metrics.count('query_bytes_processed', stage.get('bytes_processed') or 0)
                     
                     if file_exists is False:
                         print(f"Path = {folder_row['ObjectKey']}, Filenme = {folder_row['FileName']}, Filedate = {folder_row['FileDate']} DOESNT EXIST")
-                        file_df = ingest_file_from_s3(bucket_name, folder_row['ObjectKey'], aws_access_key_id, aws_secret_access_key,source_env)
-                        load_to_bigquery(file_df,dataset_id, table_id, service_account_credentials)
+                        load_file(folder_row, config_row, source_env, run_config, metrics, tracker)
+                    else:
+                        metrics.count('files_already_loaded')
         
         #SCREENER:
         #Extracting the selected screen from Screener and transferring to BigQuery
@@ -372,13 +499,123 @@ def run_batch_process(source_env :str):
         #NOTE: table to be defined
         load_to_bigquery(screener_df,dataset_id, table_id, service_account_credentials)
         '''
+        load_results = wait_for_loads(tracker, metrics)
+        failed_loads = [f"{load_result['table']}: {load_result['error']}" for load_result in load_results if load_result['error']]
+        if failed_loads:
+            raise RuntimeError(f"{len(failed_loads)} load jobs failed. {'; '.join(failed_loads)}")
+
         result = "Job executed successfully"  # TODO: Add more details
-        return {'response': result} 
+        return {'response': result, 'load_jobs': load_results, 'run_summary': metrics.log_summary()} 
                
     except Exception as e:
         # Handle any exception that occurs
         error_message = str(e)  # Convert the exception to a string message
-        return {'response': error_message}
+        return {'response': error_message, 'run_summary': metrics.log_summary()}
+
+def loaded_days(file_name : str, table_id : str, environment : str, dataset_id : str, credentials, since=None, stats : dict = None) -> set:
+    """
+    Returns the days of the files of a feed already ingested into Bigquery given the environment.
+    One query per feed, instead of one query per file as file_in_BigQuery.
+
+    :param file_name: File name
+    :param table_id: Bigquery table name
+    :param environment: Environment where the file is taken from
+    :param dataset_id: Bigquery dataset ID
+    :param credentials: Bigquery authentication credentials
+    :param since: optional first file day of interest, only the partitions from the day before on are scanned
+    :param stats: optional dict, bytes processed and billed of the query are added to it
+    :return: set of datetime.date
+    """
+    #Nothing is loaded into a table that does not exist yet
+    if not get_sink(credentials).get_schema(dataset_id, table_id):
+        return set()
+    #A file is loaded after it was written, see file_in_BigQuery
+    since = None if since is None else pd.Timestamp(since).normalize() - pd.Timedelta(days=1)
+    result_df = select_uniqueue_from_bigquery(dataset_id = dataset_id, table_id = table_id, columns =['FileDate'],  credentials=credentials,
+                                              filters={'FileName': file_name, 'SourceEnv': environment}, since=since, stats=stats)
+    file_days = pd.to_datetime(result_df['FileDate'].astype(str).str[:8], format='%Y%m%d', errors='coerce')
+    return set(file_days.dropna().dt.date)
+
+def run_backfill_process(source_env :str, start_date, end_date=None, feeds : list = None, dry_run : bool = False,
+                         max_workers : int = BACKFILL_MAX_WORKERS, batch_days : int = BACKFILL_BATCH_DAYS, async_loads : bool = False):
+    """
+    Loads the days of a date range that are missing in Bigquery (see backfill.py). The last file of each feed and day
+    is selected as in run_batch_process, the days already in the tables are skipped, the missing days are loaded in
+    batches of batch_days days, the files of a batch in parallel.
+    :param source_env: Determines the source environment. (It can be STG or PROD)
+    :param start_date: first day to load
+    :param end_date: last day to load, yesterday if None
+    :param feeds: S3 file names to load, all active files of file_config.csv if None
+    :param dry_run: if True, nothing is loaded, the plan is printed and returned
+    :param max_workers: files loaded at the same time
+    :param batch_days: days of a batch, the progress is printed after every batch
+    :param async_loads: if True, load jobs are only submitted and all of them are waited for at the end of the run
+    :return: response message, plan, result of every file, load jobs in async mode and the run summary
+    """
+    #Stage timings and memory of the run, returned in the response
+    metrics = RunMetrics('Backfill_IBD_files_to_Bigquery')
+    tracker = LoadJobTracker() if async_loads else None
+    end_date = pd.Timestamp.today().normalize() - pd.Timedelta(days=1) if end_date is None else end_date
+    try:
+
+        with metrics.stage('read_config'):
+            run_config = read_config(source_env)
+            if run_config is None:
+                metrics.close()
+                return "Error: Environment not matching."
+            config_df = read_file_config()
+            if feeds is not None:
+                unknown_feeds = set(feeds) - set(config_df['S3_file_name'])
+                if unknown_feeds:
+                    raise ValueError(f"Files not active in file_config.csv: {', '.join(sorted(unknown_feeds))}")
+                config_df = config_df[config_df['S3_file_name'].isin(feeds)]
+            config_rows = {config_row['S3_file_name']: config_row for _, config_row in config_df.iterrows()}
+
+        with metrics.stage('listing') as stage:
+            folder_df = list_folder_contents(run_config['bucket_name'], run_config['folder_path'], run_config['aws_access_key_id'], run_config['aws_secret_access_key'])
+            stage['objects'] = len(folder_df)
+
+        with metrics.stage('selection') as stage:
+            selected_df = select_daily_files(folder_df, list(config_rows), start_date, end_date)
+            stage['files'] = len(selected_df)
+
+        with metrics.stage('ingested_days', files=len(config_rows)) as stage:
+            ingested = {}
+            for file_name, config_row in config_rows.items():
+                query_stats = {}
+                ingested[file_name] = loaded_days(file_name, config_row['Bigquery_table'], source_env, run_config['dataset_id'], run_config['credentials'],
+                                                  since=start_date, stats=query_stats)
+                metrics.count('query_bytes_processed', query_stats.get('bytes_processed') or 0)
+            stage['days'] = sum(len(days) for days in ingested.values())
+
+        plan = plan_backfill(selected_df, {file_name: config_row['Bigquery_table'] for file_name, config_row in config_rows.items()}, start_date, end_date, ingested)
+        print(format_plan(plan, batch_days))
+        files_to_load = int((plan['status'] == 'to_load').sum())
+        plan_records = plan.astype({'FileDay': str}).fillna('').to_dict('records')
+        if dry_run:
+            return {'response': f"Dry run: {files_to_load} files to load", 'plan': plan_records, 'run_summary': metrics.log_summary()}
+
+        def backfill_file(plan_row):
+            #A backfill reads every file once, the files are not kept in the feed cache
+            load_file(plan_row, config_rows[plan_row['FileName']], source_env, run_config, metrics, tracker, use_cache=False)
+            return 'loaded'
+
+        with metrics.stage('backfill', files=files_to_load, max_workers=max_workers, batch_days=batch_days):
+            file_results = run_backfill(plan, backfill_file, max_workers, batch_days)
+
+        load_results = wait_for_loads(tracker, metrics)
+        failed_files = [f"{file_result['file']}: {file_result['error']}" for file_result in file_results if file_result['error']]
+        failed_files += [f"{load_result['file']}: {load_result['error']}" for load_result in load_results if load_result['error']]
+
+        result = f"Backfill loaded {len(file_results) - len(failed_files)} of {files_to_load} files"
+        if failed_files:
+            result += f", {len(failed_files)} failed. {'; '.join(failed_files)}"
+        return {'response': result, 'plan': plan_records, 'files': file_results, 'load_jobs': load_results, 'run_summary': metrics.log_summary()}
+
+    except Exception as e:
+        # Handle any exception that occurs
+        error_message = str(e)  # Convert the exception to a string message
+        return {'response': error_message, 'run_summary': metrics.log_summary()}
     
     
 
@@ -398,5 +635,25 @@ def execute_batch(request):
 
 '''
 #Calling the main execution
-run_batch_process('PROD')
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Transfers the RS feed files from S3 to BigQuery.')
+    parser.add_argument('--mode', choices=['daily', 'backfill'], default='daily', help='daily run, or backfill of a date range (see backfill.py)')
+    parser.add_argument('--env', default='PROD', help='source environment, STG or PROD')
+    parser.add_argument('--start-date', help='first day of the backfill, e.g. 2025-02-01')
+    parser.add_argument('--end-date', help='last day of the backfill, yesterday by default')
+    parser.add_argument('--feeds', nargs='*', help='S3 file names to backfill, all active files of file_config.csv by default')
+    parser.add_argument('--dry-run', action='store_true', help='print the backfill plan without loading')
+    parser.add_argument('--max-workers', type=int, default=BACKFILL_MAX_WORKERS, help='files loaded at the same time by the backfill')
+    parser.add_argument('--batch-days', type=int, default=BACKFILL_BATCH_DAYS, help='days of a backfill batch')
+    parser.add_argument('--async-loads', action='store_true', help='submit the load jobs and wait for all of them at the end')
+    args = parser.parse_args()
+
+    if args.mode == 'backfill':
+        if args.start_date is None:
+            parser.error('--start-date is required in backfill mode')
+        result = run_backfill_process(args.env, args.start_date, args.end_date, feeds=args.feeds, dry_run=args.dry_run,
+                                      max_workers=args.max_workers, batch_days=args.batch_days, async_loads=args.async_loads)
+    else:
+        result = run_batch_process(args.env, async_loads=args.async_loads)
+    print(result['response'] if isinstance(result, dict) else result)
 
@@ -6,8 +6,11 @@ from google.oauth2 import service_account
 import boto3
 from botocore.config import Config
 import json
-from io import StringIO
 import logging
+from feed_parser import parse_feed
+from feed_compression import feed_extension, detect_compression
+#The S3 download and file metadata are shared with the Cloud Function
+from main import ingest_file_from_s3, fileName_metadata
 # Enable debug logging
 #logging.basicConfig(level=logging.DEBUG)
 
@@ -46,18 +49,21 @@ def load_to_bigquery(df,dataset_id, table_id, credentials):
 
 def import_file(csv_directory,file_name):
     file_path = f'{csv_directory}/{file_name}'
-    # Attempt to read the CSV file with 'ISO-8859-1' encoding
+    with open(file_path, 'rb') as f:
+        file_content = f.read()
+    # Attempt to read the CSV file with 'ISO-8859-1' encoding, parsed by the FEED_PARSER backend (see feed_parser.py)
+    compression = detect_compression(file_name, file_content)
     try:
-        df = pd.read_csv(file_path,sep='|' ,encoding='ISO-8859-1')
+        df = parse_feed(file_content, 'ISO-8859-1', compression=compression)
     except UnicodeDecodeError:
         # If 'ISO-8859-1' fails, try 'cp1252'
-        df = pd.read_csv(file_path, sep='|', encoding='cp1252')
+        df = parse_feed(file_content, 'cp1252', compression=compression)
 
     base_name = os.path.basename(file_path)
     last_underscore_index = base_name.rfind('_')
 
     df['FileName'] = base_name[:last_underscore_index]
-    df['FileDate'] = base_name[last_underscore_index+1:-4]
+    df['FileDate'] = base_name[last_underscore_index+1:len(base_name)-len(feed_extension(base_name))]
     df['repDate']  = pd.to_datetime('today')
     return df
 
@@ -100,30 +106,6 @@ config = json.loads(data)
 
 
 
-def fileName_metadata(full_path : str,file_part : str):
-    """
-    Returns the required section of the selected file
-
-    :param full_path: path to the file
-    :param file_part: it returns either the filename without datetime information (FileName) or the datepart after the filename, without file extension (FileDate)
-    :return: selected part of filepath in str.
-    """
-    output = ''
-
-    last_slash_index = full_path.rfind('/')
-    file_name = full_path[last_slash_index:]
-    last_underscore_index = file_name.rfind('_')
-
-    if file_part=='FileName':
-        output = file_name[1:last_underscore_index]
-    elif file_part=='FileDate':
-        output = file_name[last_underscore_index+1:-4]
-    else:
-        output = ''
-    
-    return output    
-
-
 def list_folder_contents(bucket_name, folder_path, aws_access_key_id, aws_secret_access_key):
     """
     Lists the contents of a specific folder in an S3 bucket.
@@ -162,45 +144,6 @@ def list_folder_contents(bucket_name, folder_path, aws_access_key_id, aws_secret
     return df
 
 
-def ingest_file_from_s3(bucket_name, file_key, aws_access_key_id, aws_secret_access_key, env):
-    """
-    Downloads a selected file from S3 and ingests it into a Pandas DataFrame.
-
-    :param bucket_name: Name of the S3 bucket
-    :param file_key: Key of the file to download
-    :param aws_access_key_id: AWS access key ID
-    :param aws_secret_access_key: AWS secret access key
-    :param env: Environment where the file is taken from
-    :return: Pandas DataFrame containing the file data
-    """
-    # Initialize a session using the provided credentials
-    session = boto3.Session(
-        aws_access_key_id=aws_access_key_id,
-        aws_secret_access_key=aws_secret_access_key
-    )
-    
-    # Access the S3 client
-    s3_client = session.client('s3')
-    
-    # Download the file content as a string
-    response = s3_client.get_object(Bucket=bucket_name, Key=file_key)
-    file_content = response['Body'].read().decode('ISO-8859-1')
-    
-    # Load the file content into a Pandas DataFrame
-    try:
-        df = pd.read_csv(StringIO(file_content),sep='|' ,encoding='ISO-8859-1')
-    except UnicodeDecodeError:
-        # If 'ISO-8859-1' fails, try 'cp1252'
-        df = pd.read_csv(StringIO(file_content), sep='|', encoding='cp1252')
-    
-    #Adding file metadata
-    df['SourceEnv'] = env 
-    df['FileName'] = fileName_metadata(file_key,'FileName')
-    df['FileDate'] = fileName_metadata(file_key,'FileDate')
-    df['repDate']  = pd.to_datetime('today')
-
-    return df
-
 def run_batch_process(source_env :str, selected_files : list):
     """
     Iterates through the S3 bucket in the selected environment and extracts the selected files. 
@@ -0,0 +1,160 @@
+"""
+Parser backends of the pipe-delimited feed files.
+
+FEED_PARSER selects the backend:
+- pandas (default): pandas' C parser, single threaded
+- arrow: pyarrow's CSV reader. Blocks of the file are parsed on several threads, straight from the downloaded
+  bytes. FEED_PARSER_THREADS sizes Arrow's CPU pool: 0 keeps Arrow's default (all cores), 1 parses on the calling
+  thread. The pool is shared by the whole process, it is sized once on the first arrow parse. The reader transcodes ISO-8859-1 / cp1252 to UTF-8
+  while reading, a file that is pure ASCII is read without transcoding.
+
+Both backends return the same frame: pandas does not infer dates and times, so the arrow backend reads
+such columns again as text, empty columns are float columns of NaN and projected columns keep the file order, as with
+pandas. A file that is not valid in the encoding raises UnicodeDecodeError with both backends, so the callers can try
+the next encoding: pyarrow's own UTF-8 check raises ArrowInvalid, or returns binary columns, both are translated.
+Compressed files are parsed from a decompressing stream with both backends (see feed_compression.py).
+See Benchmarks/parser_benchmark.py for the rows/s of both backends.
+
+NOTE: every Cloud Function folder is deployed on its own, so this file is copied into each folder
+that uses it. Keep the copies identical.
+"""
+import os
+import csv
+import pandas as pd
+from lazy_imports import lazy_import
+from feed_compression import open_feed
+
+#Imported on first use, see lazy_imports.py
+pa = lazy_import('pyarrow')
+pa_csv = lazy_import('pyarrow.csv')
+
+FEED_PARSER = os.environ.get('FEED_PARSER', 'pandas').lower()
+FEED_PARSER_THREADS = int(os.environ.get('FEED_PARSER_THREADS', 0))
+
+# dtypes parsed as text by the arrow backend, so values like '007' keep their leading zeros
+_TEXT_DTYPES = ('str', 'object', 'string')
+_arrow_pool_sized = False
+
+
+# Values read as missing by pandas (also in text columns), the arrow backend uses the same list
+_NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+              '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+
+def _is_text(dtype) -> bool:
+    return dtype in (str, object) or str(dtype) in _TEXT_DTYPES
+
+
+class _InvalidText(UnicodeDecodeError):
+    """
+    UnicodeDecodeError of the arrow backend, pyarrow does not report the position of the invalid bytes.
+    """
+    def __init__(self, encoding: str, reason: str):
+        super().__init__(encoding, b'', 0, 0, reason)
+
+    def __str__(self):
+        return f"'{self.encoding}' codec can't decode the file: {self.reason}"
+
+
+def _header(content: bytes, encoding: str, compression: str = None) -> list:
+    """
+    Returns the column names of the file, in file order.
+    """
+    stream = open_feed(content, compression)
+    first_line = b''
+    while b'\n' not in first_line:
+        chunk = stream.read(1 << 16)
+        if not chunk:
+            break
+        first_line += chunk
+    header_text = first_line.split(b'\n', 1)[0].decode(encoding).rstrip('\r')
+    return next(csv.reader([header_text], delimiter='|'), [])
+
+
+def _size_arrow_pool():
+    global _arrow_pool_sized
+    if not _arrow_pool_sized:
+        if FEED_PARSER_THREADS > 1:
+            pa.set_cpu_count(FEED_PARSER_THREADS)
+        _arrow_pool_sized = True
+
+
+def _read_arrow(content: bytes, encoding: str, columns: list = None, dtypes: dict = None, use_threads: bool = None, compression: str = None) -> pd.DataFrame:
+    _size_arrow_pool()
+    use_threads = FEED_PARSER_THREADS != 1 if use_threads is None else use_threads
+    dtypes = dtypes or {}
+    # ASCII reads the same in every supported encoding, the transcoding step is skipped
+    read_encoding = 'utf8' if compression is None and content.isascii() else encoding
+
+    def read(include_columns, text_columns):
+        try:
+            return pa_csv.read_csv(
+                open_feed(content, compression),
+                read_options=pa_csv.ReadOptions(encoding=read_encoding, use_threads=use_threads),
+                parse_options=pa_csv.ParseOptions(delimiter='|'),
+                convert_options=pa_csv.ConvertOptions(
+                    include_columns=include_columns,
+                    column_types={column: pa.string() for column in text_columns},
+                    null_values=_NA_VALUES,
+                    strings_can_be_null=True,
+                ),
+            )
+        except pa.ArrowInvalid as e:
+            #Text columns are checked for valid UTF-8 by pyarrow, raised as by pandas
+            if 'UTF8' in str(e):
+                raise _InvalidText(read_encoding, str(e)) from e
+            raise
+
+    table = read(columns, [column for column, dtype in dtypes.items() if _is_text(dtype)])
+
+    #Inferred columns with invalid UTF-8 are returned as binary instead of failing
+    binary_columns = [field.name for field in table.schema if pa.types.is_binary(field.type) or pa.types.is_large_binary(field.type)]
+    if binary_columns:
+        raise _InvalidText(read_encoding, f"invalid {read_encoding} data in column(s) {', '.join(binary_columns)}")
+
+    #include_columns returns the requested order, pandas' usecols the file order
+    if columns and len(columns) > 1:
+        file_order = _header(content, read_encoding, compression)
+        positions = {column: position for position, column in reversed(list(enumerate(file_order)))}
+        ordered = sorted(table.column_names, key=lambda column: positions.get(column, len(file_order)))
+        if ordered != table.column_names:
+            table = table.select(ordered)
+
+    #pandas does not infer dates and times, such columns are read again as text (only these columns)
+    temporal_columns = [field.name for field in table.schema if pa.types.is_temporal(field.type)]
+    if temporal_columns:
+        text_table = read(temporal_columns, temporal_columns)
+        for column in temporal_columns:
+            table = table.set_column(table.schema.get_field_index(column), column, text_table.column(column))
+
+    #Empty columns are float columns of NaN, as with pandas
+    for index, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            table = table.set_column(index, field.name, table.column(index).cast(pa.float64()))
+
+    df = table.to_pandas()
+    #Text columns were read as strings, the requested dtypes are applied to all columns (e.g. object)
+    dtypes = {column: dtype for column, dtype in dtypes.items() if column in df.columns}
+    return df.astype(dtypes) if dtypes else df
+
+
+def parse_feed(content: bytes, encoding: str, columns: list = None, dtypes: dict = None, backend: str = None, use_threads: bool = None,
+               compression: str = None) -> pd.DataFrame:
+    """
+    Parses a pipe-delimited feed file.
+
+    :param content: raw bytes of the file
+    :param encoding: encoding of the file, e.g. ISO-8859-1 or cp1252
+    :param columns: optional list of columns to parse, all other columns are skipped by the parser
+    :param dtypes: optional dict of column -> dtype, columns not listed are inferred
+    :param backend: pandas or arrow, FEED_PARSER by default
+    :param use_threads: parse on Arrow's CPU pool (arrow backend), by default unless FEED_PARSER_THREADS is 1
+    :param compression: codec of a compressed file (see feed_compression.detect_compression), None for a plain file
+    :return: Pandas DataFrame containing the file data
+    """
+    backend = (backend or FEED_PARSER).lower()
+    if backend == 'arrow':
+        return _read_arrow(content, encoding, columns, dtypes, use_threads, compression)
+    if backend != 'pandas':
+        raise ValueError(f"Unknown feed parser: {backend}. Use pandas or arrow.")
+    return pd.read_csv(open_feed(content, compression), sep='|', encoding=encoding, usecols=columns, dtype=dtypes)
@@ -1,14 +1,25 @@
 import pandas as pd
-import boto3
-from botocore.config import Config
 import json
+import os
+import re
+import io
+import time
+import stat
+import tempfile
+import threading
 from io import StringIO
 import functions_framework
 from flask import jsonify
-import pandas as pd
-import json
-from collections import OrderedDict #Required to maintain order fields in statistics
 import numpy as np
+from lazy_imports import lazy_import
+from run_metrics import RunMetrics, optional_stage
+from feed_cache import get_feed_cache, encoding_order
+from feed_parser import parse_feed, FEED_PARSER
+from feed_compression import feed_extension, detect_compression, open_feed
+from s3_download import download_object, s3_client_config
+
+#Imported on first use, see lazy_imports.py
+boto3 = lazy_import('boto3')
 
 def fileName_metadata(full_path : str,file_part : str):
     """
@@ -27,7 +38,10 @@ def fileName_metadata(full_path : str,file_part : str):
     if file_part=='FileName':
         output = file_name[1:last_underscore_index]
     elif file_part=='FileDate':
-        output = file_name[last_underscore_index+1:-4]
+        #The whole extension is stripped, also of compressed files (e.g. .csv.gz, see feed_compression.py)
+        base_name = full_path[last_slash_index+1:]
+        stem = base_name[:len(base_name)-len(feed_extension(base_name))]
+        output = stem[stem.rfind('_')+1:]
     else:
         output = ''
     
@@ -85,6 +99,154 @@ def list_folder_contents(bucket_name, folder_path, aws_access_key_id, aws_secret
 
     return df
 
+# Index of FileName -> newest object key, per bucket and folder. It is kept in memory (reused by warm
+# instances) and in a file of a per-user folder of the temp directory (reused by local runs). A lookup within
+# LATEST_FILE_INDEX_TTL_SECONDS of the last refresh needs no listing, older entries are refreshed
+# with one listing limited to the keys after the newest known one. A file name without a match is always
+# listed again, but a newer file of a known file name is only seen once the TTL expired.
+# The file is replaced in one step and only read if the folder and the file belong to the current user and
+# are not accessible by others, so no other user can choose the object key that is read.
+LATEST_FILE_INDEX_TTL_SECONDS = 300
+LATEST_FILE_INDEX_FILE = os.environ.get('S3_LATEST_FILE_INDEX_FILE', os.path.join(
+    tempfile.gettempdir(), f"s3_latest_file_index_{os.getuid() if hasattr(os, 'getuid') else 'user'}", 'index.json'))
+_latest_file_index = {}
+_latest_file_index_lock = threading.Lock()
+
+# FileDate is a 14 digit timestamp (YYYYMMDDHHMMSS), so keys of the same FileName sort by date
+FILE_DATE_PATTERN = re.compile(r'^\d{14}$')
+
+def _is_private(path : str) -> bool:
+    """
+    Returns True if the file or folder belongs to the current user and is not accessible by others.
+    """
+    path_stat = os.stat(path)
+    if hasattr(os, 'getuid') and path_stat.st_uid != os.getuid():
+        return False
+    return not path_stat.st_mode & (stat.S_IRWXG | stat.S_IRWXO)
+
+def _read_latest_file_index():
+    #Called with _latest_file_index_lock held
+    if not _latest_file_index:
+        try:
+            if _is_private(os.path.dirname(LATEST_FILE_INDEX_FILE)) and _is_private(LATEST_FILE_INDEX_FILE):
+                with open(LATEST_FILE_INDEX_FILE, 'r') as f:
+                    _latest_file_index.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+    return _latest_file_index
+
+def _write_latest_file_index():
+    #Called with _latest_file_index_lock held
+    try:
+        folder = os.path.dirname(LATEST_FILE_INDEX_FILE)
+        os.makedirs(folder, mode=0o700, exist_ok=True)
+        if not _is_private(folder):
+            raise OSError(f"{folder} is accessible by other users")
+        #mkstemp creates the file readable by the current user only, it replaces the index in one step
+        fd, temp_path = tempfile.mkstemp(dir=folder, prefix='.index_', suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(_latest_file_index, f)
+        os.replace(temp_path, LATEST_FILE_INDEX_FILE)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Latest file index could not be written: {e}")
+
+def _update_latest_file_index(folder_index : dict, object_keys : list):
+    """
+    Adds the listed keys to the index, keeping the newest key of every FileName.
+    Keys not following the FileName_YYYYMMDDHHMMSS.ext convention are skipped.
+    """
+    for object_key in object_keys:
+        file_date = fileName_metadata(object_key, 'FileDate')
+        if not FILE_DATE_PATTERN.match(file_date):
+            continue
+        file_name = fileName_metadata(object_key, 'FileName')
+        current = folder_index['files'].get(file_name)
+        if current is None or file_date > current['FileDate']:
+            folder_index['files'][file_name] = {'ObjectKey': object_key, 'FileDate': file_date}
+
+def _list_keys(s3_client, bucket_name : str, prefix : str, start_after : str = None) -> list:
+    """
+    Lists all keys under the prefix, optionally only the keys sorting after start_after.
+    """
+    keys = []
+    request = {'Bucket': bucket_name, 'Prefix': prefix}
+    if start_after:
+        request['StartAfter'] = start_after
+
+    while True:
+        response = s3_client.list_objects_v2(**request)
+        keys.extend(obj['Key'] for obj in response.get('Contents', []))
+        if response.get('IsTruncated'):
+            request['ContinuationToken'] = response['NextContinuationToken']
+        else:
+            break
+    return keys
+
+def resolve_latest_file(bucket_name, folder_path, aws_access_key_id, aws_secret_access_key, file_name, metrics=None):
+    """
+    Returns the key of the most recent file whose FileName contains file_name, using the latest file index.
+
+    A warm lookup (refreshed within LATEST_FILE_INDEX_TTL_SECONDS, with a match) makes no S3 request. Otherwise the folder
+    is listed with the file name as prefix, starting after the newest known key. If the file name is not the
+    start of the FileName (substring match), the whole folder is listed once, as in list_folder_contents.
+
+    :param bucket_name: Name of the S3 bucket
+    :param folder_path: Path of the folder (e.g., "folder/subfolder/")
+    :param aws_access_key_id: AWS access key ID
+    :param aws_secret_access_key: AWS secret access key
+    :param file_name: core file name, without the date and extension
+    :param metrics: optional RunMetrics, listings are recorded as a stage
+    :return: object key of the latest file or None if no file matches
+    """
+    def latest_match():
+        matches = [entry for name, entry in folder_index['files'].items() if file_name in name]
+        return max(matches, key=lambda entry: entry['FileDate']) if matches else None
+
+    with _latest_file_index_lock:
+        folder_index = _read_latest_file_index().setdefault(f"{bucket_name}/{folder_path}", {'files': {}, 'refreshed': {}})
+        match = latest_match()
+        fresh = time.time() - folder_index['refreshed'].get(file_name, 0) < LATEST_FILE_INDEX_TTL_SECONDS
+        known = {name: entry for name, entry in folder_index['files'].items() if file_name in name}
+
+    #A miss is listed again, the file may have been delivered since the last refresh
+    if fresh and match is not None:
+        if metrics is not None:
+            metrics.count('latest_file_index_hits')
+        return match['ObjectKey']
+
+    session = boto3.Session(
+        aws_access_key_id=aws_access_key_id,
+        aws_secret_access_key=aws_secret_access_key
+    )
+    s3_client = session.client('s3')
+
+    with optional_stage(metrics, 'listing', file_name=file_name) as stage:
+        if all(name.startswith(file_name) for name in known):
+            # Keys are returned in lexicographic order, every new key sorts after the newest known key of its FileName
+            start_after = min((entry['ObjectKey'] for entry in known.values()), default=None)
+            object_keys = _list_keys(s3_client, bucket_name, f"{folder_path}{file_name}", start_after)
+            stage['mode'] = 'incremental' if start_after else 'prefix'
+        else:
+            object_keys = []
+            stage['mode'] = 'full'
+
+        # The file name may also be found in the middle of the FileName, which only a full listing can find
+        if stage['mode'] == 'full' or (not known and not object_keys):
+            object_keys = [key for key in _list_keys(s3_client, bucket_name, folder_path) if file_name in key]
+            stage['mode'] = 'full'
+
+        stage['objects'] = len(object_keys)
+
+    with _latest_file_index_lock:
+        _update_latest_file_index(folder_index, object_keys)
+        folder_index['refreshed'][file_name] = time.time()
+        _write_latest_file_index()
+        match = latest_match()
+    if metrics is not None:
+        metrics.count('latest_file_index_misses')
+
+    return match['ObjectKey'] if match else None
+
 '''
 #Return field statistics of the selected target variable
 def data_point_statistics(input_df : pd.DataFrame, data_point : str) -> dict:
@@ -153,7 +315,7 @@ def data_point_statistics(input_df : pd.DataFrame, data_point : list) -> pd.Data
 
     return stats_df
 
-def ingest_file_from_s3(bucket_name, file_key, aws_access_key_id, aws_secret_access_key, env):
+def ingest_file_from_s3(bucket_name, file_key, aws_access_key_id, aws_secret_access_key, env, metrics=None, columns=None, dtypes=None, use_cache=True):
     """
     Downloads a selected file from S3 and ingests it into a Pandas DataFrame.
 
@@ -162,6 +324,10 @@ def ingest_file_from_s3(bucket_name, file_key, aws_access_key_id, aws_secret_acc
     :param aws_access_key_id: AWS access key ID
     :param aws_secret_access_key: AWS secret access key
     :param env: Environment where the file is taken from
+    :param metrics: optional RunMetrics, download and parse are recorded as separate stages
+    :param columns: optional list of columns to parse, all other columns are skipped by the parser
+    :param dtypes: optional dict of column -> dtype, columns not listed are inferred
+    :param use_cache: if True, the parsed file is taken from / stored in the local feed cache (keyed by bucket, key and ETag)
     :return: Pandas DataFrame containing the file data
     """
     # Initialize a session using the provided credentials
@@ -170,30 +336,218 @@ def ingest_file_from_s3(bucket_name, file_key, aws_access_key_id, aws_secret_acc
         aws_secret_access_key=aws_secret_access_key
     )
     
-    # Access the S3 client
-    s3_client = session.client('s3')
+    # Access the S3 client, with a pooled connection per ranged download worker
+    s3_client = session.client('s3', config=s3_client_config())
+
+    cache = get_feed_cache() if use_cache else None
+    head = None
+    cache_variant = {'columns': columns, 'dtypes': dtypes}
+    if cache is not None:
+        with optional_stage(metrics, 'cache_lookup', file=file_key) as stage:
+            #Only the ETag is requested, a cached file needs no download
+            head = s3_client.head_object(Bucket=bucket_name, Key=file_key)
+            etag = head['ETag']
+            df = cache.get(bucket_name, file_key, etag, cache_variant)
+            stage['hit'] = df is not None
+        if metrics is not None:
+            metrics.count('feed_cache_hits' if df is not None else 'feed_cache_misses')
+        if df is not None:
+            return df
     
-    # Download the file content as a string
-    response = s3_client.get_object(Bucket=bucket_name, Key=file_key)
-    file_content = response['Body'].read().decode('ISO-8859-1')
+    with optional_stage(metrics, 'download', file=file_key) as stage:
+        # Download the file content, large files in parallel byte ranges (see s3_download.py)
+        file_content, file_etag = download_object(s3_client, bucket_name, file_key,
+                                                  size=head['ContentLength'] if head else None, etag=head['ETag'] if head else None, stats=stage)
+    
+    with optional_stage(metrics, 'parse', file=file_key) as stage:
+        # Load the file content into a Pandas DataFrame
+        # 'ISO-8859-1' is tried first, then 'cp1252'. The encoding that worked for this file before is tried first.
+        encodings = encoding_order(cache.get_encoding(bucket_name, file_key, file_etag) if cache is not None else None)
+        #Compressed files are decompressed while they are parsed
+        compression = detect_compression(file_key, file_content)
+        for encoding in encodings:
+            try:
+                #Parsed by the FEED_PARSER backend, pandas or the multithreaded Arrow reader (see feed_parser.py)
+                df = parse_feed(file_content, encoding, columns=columns, dtypes=dtypes, compression=compression)
+                break
+            except UnicodeDecodeError:
+                if encoding == encodings[-1]:
+                    raise
+        stage['rows'] = len(df)
+        stage['encoding'] = encoding
+        stage['parser'] = FEED_PARSER
+        stage['compression'] = compression
+
+    if cache is not None:
+        cache.set_encoding(bucket_name, file_key, file_etag, encoding)
+        cache.put(bucket_name, file_key, file_etag, df, cache_variant)
     
-    # Load the file content into a Pandas DataFrame
+    return df
+
+#Preview mode: the first request fetches PREVIEW_INITIAL_BYTES, further ranges double in size until the
+#requested rows are available or PREVIEW_MAX_BYTES is reached
+PREVIEW_INITIAL_BYTES = 256 * 1024
+PREVIEW_MAX_BYTES = 16 * 1024 * 1024
+
+class _CountingBody(io.RawIOBase):
+    """
+    Readable wrapper of a get_object Body, counting the bytes transferred.
+    """
+    def __init__(self, body):
+        self.body = body
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.body.read(len(buffer))
+        buffer[:len(data)] = data
+        self.bytes_read += len(data)
+        return len(data)
+
+def _read_compressed_preview(s3_client, bucket_name, file_key, compression, preview_rows):
+    """
+    Reads the first lines of a compressed file. A byte range of a compressed file cannot be decompressed on its own,
+    so the object is streamed and decompressed until preview_rows lines or PREVIEW_MAX_BYTES are read, then the
+    transfer is stopped.
+
+    :return: (decompressed bytes, compressed bytes transferred, object size, whether the whole file was read)
+    """
+    response = s3_client.get_object(Bucket=bucket_name, Key=file_key)
+    body = _CountingBody(response['Body'])
+    stream = open_feed(body, compression)
+    file_bytes = b''
+    lines = 0
     try:
-        df = pd.read_csv(StringIO(file_content),sep='|' ,encoding='ISO-8859-1')
-    except UnicodeDecodeError:
-        # If 'ISO-8859-1' fails, try 'cp1252'
-        df = pd.read_csv(StringIO(file_content), sep='|', encoding='cp1252')
+        while True:
+            chunk = stream.read(PREVIEW_INITIAL_BYTES)
+            is_complete = not chunk
+            file_bytes += chunk
+            lines += chunk.count(b'\n')
+            # The header line is not a data row
+            if is_complete or lines > preview_rows or len(file_bytes) >= PREVIEW_MAX_BYTES:
+                break
+    finally:
+        response['Body'].close()
+    return file_bytes, body.bytes_read, response['ContentLength'], is_complete
+
+def preview_file_from_s3(bucket_name, file_key, aws_access_key_id, aws_secret_access_key, env, preview_rows=1000, metrics=None, columns=None, dtypes=None):
+    """
+    Reads only the header and the first rows of a selected file from S3, using ranged GET requests.
+    Compressed files are streamed and decompressed until the rows are read instead.
+    The transfer details are stored in df.attrs['transfer'] (bytes transferred, object size, rows sampled).
+
+    :param bucket_name: Name of the S3 bucket
+    :param file_key: Key of the file to read
+    :param aws_access_key_id: AWS access key ID
+    :param aws_secret_access_key: AWS secret access key
+    :param env: Environment where the file is taken from
+    :param preview_rows: number of data rows to read
+    :param metrics: optional RunMetrics, download and parse are recorded as separate stages
+    :param columns: optional list of columns to parse, see ingest_file_from_s3
+    :param dtypes: optional dict of column -> dtype, see ingest_file_from_s3
+    :return: Pandas DataFrame containing the first rows of the file
+    """
+    # Initialize a session using the provided credentials
+    session = boto3.Session(
+        aws_access_key_id=aws_access_key_id,
+        aws_secret_access_key=aws_secret_access_key
+    )
     
+    # Access the S3 client
+    s3_client = session.client('s3')
+
+    compression = detect_compression(file_key)
+    with optional_stage(metrics, 'download', file=file_key, mode='preview', compression=compression) as stage:
+        if compression is not None:
+            file_bytes, bytes_transferred, object_size, is_complete = _read_compressed_preview(s3_client, bucket_name, file_key, compression, preview_rows)
+            requests_made = 1
+        else:
+            file_bytes = b''
+            range_size = PREVIEW_INITIAL_BYTES
+            requests_made = 0
+            while True:
+                range_start = len(file_bytes)
+                response = s3_client.get_object(Bucket=bucket_name, Key=file_key, Range=f'bytes={range_start}-{range_start + range_size - 1}')
+                file_bytes += response['Body'].read()
+                requests_made += 1
+
+                # ContentRange has the form 'bytes start-end/total'
+                object_size = int(response['ContentRange'].split('/')[-1])
+                is_complete = len(file_bytes) >= object_size
+
+                # The header line is not a data row
+                if is_complete or file_bytes.count(b'\n') > preview_rows or len(file_bytes) >= PREVIEW_MAX_BYTES:
+                    break
+                range_size = min(range_size * 2, PREVIEW_MAX_BYTES - len(file_bytes))
+            bytes_transferred = len(file_bytes)
+
+        # Size of the file once decompressed, estimated from the compression ratio of the bytes read. The bytes
+        # transferred include the read-ahead of the decompressor, so the row estimate of a compressed file is a lower bound
+        file_size = object_size if compression is None else object_size * len(file_bytes) / max(bytes_transferred, 1)
+        # Dropping the partial last line of an incomplete read
+        if not is_complete:
+            file_bytes = file_bytes[:file_bytes.rfind(b'\n') + 1]
+        stage['bytes'] = bytes_transferred
+
+    with optional_stage(metrics, 'parse', file=file_key, mode='preview') as stage:
+        file_content = file_bytes.decode('ISO-8859-1')
+        try:
+            df = pd.read_csv(StringIO(file_content), sep='|', encoding='ISO-8859-1', nrows=preview_rows, usecols=columns, dtype=dtypes)
+        except UnicodeDecodeError:
+            # If 'ISO-8859-1' fails, try 'cp1252'
+            df = pd.read_csv(StringIO(file_content), sep='|', encoding='cp1252', nrows=preview_rows, usecols=columns, dtype=dtypes)
+        stage['rows'] = len(df)
+
+    # Average row width of the sample gives an estimate of the rows in the whole file
+    header_bytes = file_bytes.find(b'\n') + 1
+    rows_read = file_bytes.count(b'\n') - 1 + (0 if file_bytes.endswith(b'\n') else 1)
+    row_bytes = (len(file_bytes) - header_bytes) / max(rows_read, 1)
+    df.attrs['transfer'] = {
+        'file_key': file_key,
+        'object_size_bytes': object_size,
+        'bytes_transferred': bytes_transferred,
+        'transfer_saved_pct': round(100 * (1 - bytes_transferred / object_size), 2) if object_size else 0.0,
+        'range_requests': requests_made,
+        'sample_rows': len(df),
+        'is_complete_file': is_complete and len(df) == rows_read,
+        'estimated_total_rows': int((file_size - header_bytes) / row_bytes) if row_bytes else len(df),
+        'compression': compression,
+    }
+
     return df
 
-def run_batch_process(source_env :str, selected_file : str, exact_match :bool)->pd.DataFrame:
+def approximate_statistics(sample_df : pd.DataFrame, data_point : list) -> pd.DataFrame:
+    """
+    Returns data_point_statistics computed on a preview sample, extended with the sample size
+    and the estimated number of rows of the whole file. Counts are sample counts, not scaled.
+
+    :param sample_df: DataFrame returned by preview_file_from_s3
+    :param data_point: list of fields
+    :return: statistics in the data_point_statistics format
+    """
+    stats_df = data_point_statistics(sample_df, data_point)
+    transfer = sample_df.attrs.get('transfer', {})
+
+    sample_measures = pd.DataFrame({'Measures': ['sample_rows', 'estimated_total_rows', 'is_complete_file']})
+    for field in data_point:
+        sample_measures[field] = [transfer.get('sample_rows', len(sample_df)), transfer.get('estimated_total_rows'), transfer.get('is_complete_file')]
+
+    return pd.concat([stats_df, sample_measures], ignore_index=True)
+
+def run_batch_process(source_env :str, selected_file : str, exact_match :bool, metrics=None, preview_rows : int = None, columns : list = None, dtypes : dict = None)->pd.DataFrame:
     """
     Queries the S3 bucket in the selected environment and extracts the selected file. 
     Then the selected file is returned in Dataframe format.
     :param source_env: Determines the source environment. (It can be STG or PRD)
     :param selected_file: File selected by the user.
     :param exact_match: if True is selected, the user defines the filename explicitly. If False then only the core file name is defined, and the most recent file is returned.
-    :return: selected file as DataFrame or None if the file is not found
+    :param metrics: optional RunMetrics collecting the listing, download and parse stages
+    :param preview_rows: if provided, only the header and the first preview_rows rows are read with ranged requests
+    :param columns: optional list of columns to parse. Parsing only the fields needed for statistics cuts time and memory on wide feeds
+    :param dtypes: optional dict of column -> dtype for the parsed columns
+    :return: selected file as DataFrame, or a DataFrame with an Error column if the file is not found
     """
     try:
 
@@ -216,10 +570,16 @@ def run_batch_process(source_env :str, selected_file : str, exact_match :bool)->
         aws_secret_access_key = config['S3_SECRET_KEY']
 
 
+        #Full download or preview of the first rows only
+        if preview_rows:
+            read_file = lambda file_key: preview_file_from_s3(bucket_name, file_key, aws_access_key_id, aws_secret_access_key, source_env, preview_rows=preview_rows, metrics=metrics, columns=columns, dtypes=dtypes)
+        else:
+            read_file = lambda file_key: ingest_file_from_s3(bucket_name, file_key, aws_access_key_id, aws_secret_access_key, source_env, metrics=metrics, columns=columns, dtypes=dtypes)
+
         #Check if exact matching is required and filter files accordingly
         if exact_match:
             try:
-                file_df = ingest_file_from_s3(bucket_name, f'{folder_path}{selected_file}' , aws_access_key_id, aws_secret_access_key,source_env)
+                file_df = read_file(f'{folder_path}{selected_file}')
                 return file_df
             
             except Exception as e:
@@ -227,14 +587,13 @@ def run_batch_process(source_env :str, selected_file : str, exact_match :bool)->
                 return pd.DataFrame({'Error': [f"File was not found. '{error_message}'"]})    
             
         else:
-            folder_df = list_folder_contents(bucket_name, folder_path, aws_access_key_id, aws_secret_access_key, selected_file)
             #pick only the latest file
-            folder_df = folder_df.sort_values(by='FileDate', ascending=False, ).iloc[[0]]
+            latest_key = resolve_latest_file(bucket_name, folder_path, aws_access_key_id, aws_secret_access_key, selected_file, metrics=metrics)
             #Check if any match is found
-            if folder_df.empty:
-                return None
+            if latest_key is None:
+                return pd.DataFrame({'Error': [f"File was not found. No file name contains '{selected_file}'."]})
             else:
-                file_df = ingest_file_from_s3(bucket_name, str(folder_df['ObjectKey'].iloc[0]), aws_access_key_id, aws_secret_access_key,source_env)
+                file_df = read_file(latest_key)
                 return file_df
                
     except Exception as e:
@@ -242,16 +601,6 @@ def run_batch_process(source_env :str, selected_file : str, exact_match :bool)->
         error_message = str(e)  # Convert the exception to a string message
         return pd.DataFrame({'Error': [f"File was not found. Make sure the file name is correct and check if you selected exact matching, you really provided the full filename. Detailed error message:: '{error_message}'"]})
     
-result_df = run_batch_process(source_env = 'PRD', selected_file ='wonW_WONDB_HSFINST3MRSRATING_20250128210422.csv', exact_match = True)
-result_df.to_csv('test_extract.csv')
-
-
-contextual_data = data_point_statistics(result_df,['Osid','I3MRSrk'])
-#contextual_data_df= pd.Series(contextual_data, name='Osid')
-contextual_data.to_csv('data_point_statistics.csv')
-
-
-'''
 # This function is the entry point
 @functions_framework.http
 def extract_file(request):
@@ -271,26 +620,52 @@ def extract_file(request):
 
         data_point = request_data.get("Data_point", "Not Provided")
 
-        result_df = run_batch_process(source_env = environment, selected_file =file_name, exact_match = exact_match)
+        #Optional preview mode: only the first rows of the file are fetched and statistics are approximate
+        preview_rows = request_data.get("PreviewRows", None)
+
+        #Optional column projection with explicit types, e.g. {"Columns": ["Osid", "I3MRSrk"], "Dtypes": {"Osid": "Int64"}}
+        columns = request_data.get("Columns", None)
+        dtypes = request_data.get("Dtypes", None)
+
+        #Stage timings and memory of the request, returned next to the data
+        metrics = RunMetrics('extract_file')
+        result_df = run_batch_process(source_env = environment, selected_file =file_name, exact_match = exact_match, metrics = metrics, preview_rows = preview_rows, columns = columns, dtypes = dtypes)
 
         # Convert the result dataframe to JSON format
         result_json = result_df.to_json(orient='split')
         result_data = json.loads(result_json)  # Convert string to actual JSON object
 
-        # Generate contextual data
-        if data_point in result_df.columns and data_point != 'Not Provided':
-            contextual_data = OrderedDict(data_point_statistics(result_df,data_point))
-
-        elif  data_point == 'Not Provided':
+        # Generate contextual data, for one field or a list of fields
+        data_points = [data_point] if isinstance(data_point, str) else list(data_point)
+        missing_points = [field for field in data_points if field not in result_df.columns]
+        if data_point == 'Not Provided':
             contextual_data = None
+        elif not missing_points:
+            with metrics.stage('statistics'):
+                if preview_rows:
+                    stats_df = approximate_statistics(result_df,data_points)
+                else:
+                    stats_df = data_point_statistics(result_df,data_points)
+            contextual_data = json.loads(stats_df.to_json(orient='records'))
         else:    
-            contextual_data = {"error": f"Data point '{data_point}' not found in input dataframe."}
+            contextual_data = {"error": f"Data point '{', '.join(missing_points)}' not found in input dataframe."}
 
         return jsonify({
             "core_data": result_data,
-            "contextual_data": contextual_data
+            "contextual_data": contextual_data,
+            "transfer": result_df.attrs.get('transfer'),
+            "run_summary": metrics.log_summary()
         })
     except Exception as e:
         # Error handling
         return jsonify({"error": str(e)}), 400
-'''
\ No newline at end of file
+
+if __name__ == "__main__":
+    #Only the fields used for the statistics are parsed
+    result_df = run_batch_process(source_env = 'PRD', selected_file ='wonW_WONDB_HSFINST3MRSRATING_20250128210422.csv', exact_match = True, columns = ['Osid','I3MRSrk'], dtypes = {'Osid': 'Int64', 'I3MRSrk': 'Int64'})
+    result_df.to_csv('test_extract.csv')
+
+
+    contextual_data = data_point_statistics(result_df,['Osid','I3MRSrk'])
+    #contextual_data_df= pd.Series(contextual_data, name='Osid')
+    contextual_data.to_csv('data_point_statistics.csv')
@@ -0,0 +1,105 @@
+"""
+Parallel ranged download of large S3 objects.
+
+A single get_object stream is limited by the throughput of one connection. Objects of at least
+RANGED_DOWNLOAD_THRESHOLD_MB are split into byte ranges of RANGED_DOWNLOAD_PART_MB, which are fetched
+concurrently by RANGED_DOWNLOAD_WORKERS threads over the connection pool of the client (see s3_client_config).
+Every range is written at its offset, so the object is reassembled in order into one preallocated buffer,
+or into a file for objects that should not be held in memory. Smaller objects are fetched with one request.
+
+The ranges are requested with IfMatch on the ETag, a file replaced during the download fails the download
+instead of mixing two versions. Benchmarks/download_benchmark.py measures the throughput against the
+local S3 stand-in.
+
+NOTE: every Cloud Function folder is deployed on its own, so this file is copied into each folder
+that uses it. Keep the copies identical.
+"""
+import os
+import concurrent.futures
+from lazy_imports import lazy_import
+
+#Imported on first use, see lazy_imports.py
+botocore_config = lazy_import('botocore.config')
+
+RANGED_DOWNLOAD_THRESHOLD_MB = float(os.environ.get('S3_RANGED_DOWNLOAD_THRESHOLD_MB', 64))
+RANGED_DOWNLOAD_PART_MB = float(os.environ.get('S3_RANGED_DOWNLOAD_PART_MB', 16))
+RANGED_DOWNLOAD_WORKERS = int(os.environ.get('S3_RANGED_DOWNLOAD_WORKERS', 8))
+
+
+def s3_client_config():
+    """
+    Returns the client config of the S3 client, with a connection per download worker in the pool.
+    """
+    return botocore_config.Config(max_pool_connections=max(RANGED_DOWNLOAD_WORKERS, 10))
+
+
+def byte_ranges(size: int, part_bytes: int) -> list:
+    """
+    Splits an object of the given size into (start, end) ranges of part_bytes, end included.
+    """
+    return [(start, min(start + part_bytes, size) - 1) for start in range(0, size, part_bytes)]
+
+
+def download_object(s3_client, bucket_name: str, file_key: str, size: int = None, etag: str = None, path: str = None,
+                    threshold_mb: float = None, part_mb: float = None, workers: int = None, stats: dict = None):
+    """
+    Downloads an S3 object, with parallel ranged requests if it is large.
+
+    :param s3_client: boto3 S3 client, thread safe
+    :param size: size of the object in bytes, and etag its ETag, requested with head_object if not given
+    :param path: optional file the object is written to, otherwise it is returned in memory
+    :param threshold_mb: objects of at least this size are downloaded in ranges, RANGED_DOWNLOAD_THRESHOLD_MB by default
+    :param part_mb: size of a range, RANGED_DOWNLOAD_PART_MB by default
+    :param workers: ranges fetched at the same time, RANGED_DOWNLOAD_WORKERS by default
+    :param stats: optional dict, bytes, number of requests and whether the download was ranged are added to it
+    :return: (content, etag), content is a bytes-like object, or the path if a path was given
+    """
+    threshold_bytes = int((RANGED_DOWNLOAD_THRESHOLD_MB if threshold_mb is None else threshold_mb) * 1024 * 1024)
+    part_bytes = max(int((RANGED_DOWNLOAD_PART_MB if part_mb is None else part_mb) * 1024 * 1024), 1)
+    workers = RANGED_DOWNLOAD_WORKERS if workers is None else workers
+    stats = {} if stats is None else stats
+
+    if size is None or etag is None:
+        head = s3_client.head_object(Bucket=bucket_name, Key=file_key)
+        size, etag = head['ContentLength'], head['ETag']
+
+    if size < threshold_bytes or size <= part_bytes or workers <= 1:
+        response = s3_client.get_object(Bucket=bucket_name, Key=file_key)
+        content = response['Body'].read()
+        stats.update({'bytes': len(content), 'requests': 1, 'ranged': False})
+        if path is None:
+            return content, response['ETag']
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path, response['ETag']
+
+    ranges = byte_ranges(size, part_bytes)
+    if path is None:
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+    else:
+        file_descriptor = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.ftruncate(file_descriptor, size)
+
+    def fetch(byte_range):
+        start, end = byte_range
+        response = s3_client.get_object(Bucket=bucket_name, Key=file_key, Range=f'bytes={start}-{end}', IfMatch=etag)
+        data = response['Body'].read()
+        if len(data) != end - start + 1:
+            raise IOError(f"Range {start}-{end} of {file_key} returned {len(data)} bytes")
+        #Every range is written at its offset, the object is in order whatever the order the ranges finish in
+        if path is None:
+            view[start:end + 1] = data
+        else:
+            os.pwrite(file_descriptor, data, start)
+        return len(data)
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(ranges)), thread_name_prefix='s3-range') as executor:
+            downloaded = sum(executor.map(fetch, ranges))
+    finally:
+        if path is not None:
+            os.close(file_descriptor)
+
+    stats.update({'bytes': downloaded, 'requests': len(ranges), 'ranged': True})
+    return (buffer if path is None else path), etag
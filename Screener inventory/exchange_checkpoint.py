@@ -0,0 +1,117 @@
+"""
+Checkpoints of iterative loads.
+
+An iterative load calls its screen once per exchange (see iterative_load). When the run fails or times out
+partway through the exchange list, the extracts of the finished exchanges are kept: every extract is written
+as an uncompressed Feather chunk as soon as it is fetched, and a manifest lists the finished exchanges.
+Layout: <CHECKPOINT_DIR>/<screen>/<environment>/<parameter>/manifest.json and <parameter hash>.feather chunks
+
+The next run resumes the checkpoint: finished exchanges are not called again, the missing ones are fetched,
+and all chunks are merged and loaded together, with the repDate of the run that loads them. A checkpoint started
+more than CHECKPOINT_MAX_AGE_HOURS ago (24 by default) is discarded, so every chunk of a load was fetched at most
+that long before its repDate: a failed run retried the same day is resumed, the next scheduled run starts over.
+The checkpoint is removed once the table is loaded.
+Empty extracts (failed calls) are not checkpointed, they are called again on resume.
+"""
+import os
+import json
+import shutil
+import tempfile
+import pandas as pd
+from lazy_imports import lazy_import
+from snapshot_store import parameter_hash, to_arrow
+
+#Imported on first use, see lazy_imports.py
+feather = lazy_import('pyarrow.feather')
+
+CHECKPOINT_DIR = os.environ.get('SCREENER_CHECKPOINT_DIR', os.path.join(tempfile.gettempdir(), 'screener_checkpoints'))
+#Chunks are loaded with the repDate of the resuming run, only a retry within a day resumes a checkpoint
+CHECKPOINT_MAX_AGE_HOURS = float(os.environ.get('SCREENER_CHECKPOINT_MAX_AGE_HOURS', 24))
+
+
+class IterativeCheckpoint:
+    """
+    Per exchange chunks of an iterative load.
+
+    :param screen_name: Screener name
+    :param environment: STG or PROD
+    :param screener_parameter: parameter the screen is called with, e.g. ExchangeID
+    :param root: directory of the checkpoints
+    :param max_age_hours: older checkpoints are not resumed
+    """
+    def __init__(self, screen_name: str, environment: str, screener_parameter: str, root: str = None, max_age_hours: float = None):
+        self.screener_parameter = screener_parameter
+        self.folder = os.path.join(root or CHECKPOINT_DIR, screen_name, environment, screener_parameter)
+        self.max_age_hours = CHECKPOINT_MAX_AGE_HOURS if max_age_hours is None else max_age_hours
+        self._manifest_path = os.path.join(self.folder, 'manifest.json')
+        self.manifest = {'started': None, 'chunks': {}}
+
+    def _write_manifest(self):
+        # Written to a temporary file first, a run killed while writing keeps the previous manifest
+        temp_path = f"{self._manifest_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(temp_path, self._manifest_path)
+
+    def start(self, resume: bool = True) -> list:
+        """
+        Opens the checkpoint for a run. Without resume, or if the checkpoint is too old, it is started over.
+
+        :param resume: if True, the chunks of a previous run are kept
+        :return: exchanges already finished
+        """
+        manifest = None
+        if resume:
+            try:
+                with open(self._manifest_path, 'r') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                manifest = None
+        if manifest is not None:
+            age_hours = (pd.Timestamp.now() - pd.Timestamp(manifest['started'])).total_seconds() / 3600
+            if age_hours > self.max_age_hours:
+                print(f"Checkpoint {self.folder} is {age_hours:.0f} hours old, starting over")
+                manifest = None
+
+        if manifest is None:
+            self.clear()
+            os.makedirs(self.folder, exist_ok=True)
+            self.manifest = {'started': pd.Timestamp.now().isoformat(), 'chunks': {}}
+            self._write_manifest()
+        else:
+            self.manifest = manifest
+            print(f"Resuming checkpoint {self.folder}: {len(manifest['chunks'])} exchanges already extracted")
+        return list(self.manifest['chunks'])
+
+    def is_done(self, value) -> bool:
+        return str(value) in self.manifest['chunks']
+
+    def save(self, value, df: pd.DataFrame):
+        """
+        Writes the extract of one exchange and marks it as finished.
+        """
+        if df is None or df.empty:
+            return
+        file_name = f"{parameter_hash({self.screener_parameter: value})}.feather"
+        path = os.path.join(self.folder, file_name)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        feather.write_feather(to_arrow(df), temp_path, compression='uncompressed')
+        os.replace(temp_path, path)
+
+        self.manifest['chunks'][str(value)] = {'file': file_name, 'rows': len(df), 'saved': pd.Timestamp.now().isoformat()}
+        self._write_manifest()
+
+    def merge(self, values: list) -> pd.DataFrame:
+        """
+        Returns the union of the chunks of the given exchanges, in their order, or None if no chunk exists.
+        Chunks of exchanges no longer in the list are ignored.
+        """
+        frames = [feather.read_table(os.path.join(self.folder, self.manifest['chunks'][str(value)]['file']), memory_map=True).to_pandas()
+                  for value in values if self.is_done(value)]
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+    def clear(self):
+        """
+        Removes the checkpoint, e.g. once the table is loaded.
+        """
+        shutil.rmtree(self.folder, ignore_errors=True)
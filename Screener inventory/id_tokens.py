@@ -0,0 +1,102 @@
+"""
+Cached Google identity tokens of the Cloud Run / Cloud Function invoker scripts.
+
+Identity tokens are valid for an hour. They are reused until TOKEN_EXPIRY_MARGIN_SECONDS before expiry, both within
+the process and across runs of the invoker scripts. The cache is keyed by the identity the token is minted for (the
+service account email of GOOGLE_APPLICATION_CREDENTIALS) and the audience, and a cached token is only returned if
+its email claim is that identity, so a token is never reused by another service account.
+
+The file cache (TOKEN_CACHE_FILE) is per user, in the home directory by default. It is replaced atomically by a file
+created with 0600 permissions, and ignored if it belongs to another user or is readable by others. Without a key file
+the identity is not known before a token is fetched, the tokens are then only cached in process memory.
+
+NOTE: every Cloud Function folder is deployed on its own, so this file is copied into each folder
+that uses it. Keep the copies identical.
+"""
+import os
+import json
+import stat
+import time
+import tempfile
+import google.auth.jwt
+import google.oauth2.id_token
+import google.auth.transport.requests
+
+TOKEN_EXPIRY_MARGIN_SECONDS = 300
+TOKEN_CACHE_FILE = os.environ.get('CLOUD_RUN_TOKEN_CACHE_FILE', os.path.join(os.path.expanduser('~'), '.cache', 'cloud_run_id_tokens.json'))
+_token_cache = {}
+
+
+def token_identity() -> str:
+    """
+    Returns the service account email of GOOGLE_APPLICATION_CREDENTIALS, or None if there is no readable key file.
+    """
+    key_path = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
+    if not key_path:
+        return None
+    try:
+        with open(key_path, 'r') as f:
+            return json.load(f).get('client_email')
+    except (OSError, ValueError):
+        return None
+
+
+def _read_token_cache_file() -> dict:
+    try:
+        with open(TOKEN_CACHE_FILE, 'r') as f:
+            file_stat = os.fstat(f.fileno())
+            #A cache of another user, or readable by others, is not trusted
+            if hasattr(os, 'getuid') and file_stat.st_uid != os.getuid():
+                return {}
+            if file_stat.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+                return {}
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_token_cache_file(cache: dict):
+    try:
+        folder = os.path.dirname(TOKEN_CACHE_FILE)
+        os.makedirs(folder, mode=0o700, exist_ok=True)
+        #mkstemp creates the file readable by the current user only, it replaces the cache in one step
+        fd, temp_path = tempfile.mkstemp(dir=folder, prefix='.cloud_run_id_tokens_')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(cache, f)
+        os.replace(temp_path, TOKEN_CACHE_FILE)
+    except OSError as e:
+        print(f"Token cache could not be written: {e}")
+
+
+def get_id_token(audience_url: str) -> str:
+    """
+    Returns an identity token of the current credentials for the audience, a cached one if it is still valid.
+
+    :param audience_url: URL of the called service
+    :return: identity token
+    """
+    now = time.time()
+    identity = token_identity()
+    key = f"{identity}|{audience_url}"
+    cached = _token_cache.get(key)
+    if cached is None and identity is not None:
+        cached = _read_token_cache_file().get(key)
+    if cached and cached['expiry'] - TOKEN_EXPIRY_MARGIN_SECONDS > now and (identity is None or cached.get('email') == identity):
+        _token_cache[key] = cached
+        return cached['token']
+
+    request = google.auth.transport.requests.Request()
+    token = google.oauth2.id_token.fetch_id_token(request, audience_url)
+
+    # The expiry and email are read from the token itself, the signature is checked by the called service
+    claims = google.auth.jwt.decode(token, verify=False)
+    entry = {'token': token, 'expiry': claims['exp'], 'email': claims.get('email')}
+    _token_cache[key] = entry
+
+    #Only tokens of a known identity are shared with other runs
+    if identity is not None and entry['email'] == identity:
+        file_cache = {cache_key: cache_entry for cache_key, cache_entry in _read_token_cache_file().items() if cache_entry['expiry'] > now}
+        file_cache[key] = entry
+        _write_token_cache_file(file_cache)
+
+    return token
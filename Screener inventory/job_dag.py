@@ -0,0 +1,232 @@
+"""
+Job DAG of screener_config.csv.
+
+Every active row of the config is a job loading one screen into one table. A row with Iterative_load = 1 calls
+its screen once per value of the screen named in Param_values, so it depends on the row loading that screen in
+the same environment (e.g. DataStrategy.Teo.Inventory depends on DataStrategy.Teo.ExchangeList2). A row split
+on Split_param likewise depends on the row loading its Split_values screen (see screen_splitter.py).
+Independent jobs run in parallel, up to max_workers at a time. A job starts when all of its dependencies
+finished, and is not run if one of them failed.
+
+The expected duration of a job is the duration of its last successful run, kept in JOB_DURATIONS_FILE,
+or DEFAULT_JOB_SECONDS for a job that never ran. plan_dag returns the execution plan without running anything:
+the level and expected start and end of every job, the critical path (the longest chain of dependent jobs,
+which no number of workers makes shorter) and the expected duration of the run with max_workers.
+"""
+import os
+import json
+import heapq
+import tempfile
+import concurrent.futures
+import pandas as pd
+from run_metrics import run_timed
+
+#Screens extracted at the same time, kept low as every job calls the Screener API
+DAG_MAX_WORKERS = int(os.environ.get('SCREENER_DAG_MAX_WORKERS', 3))
+DEFAULT_JOB_SECONDS = 60.0
+#Per user folder of the temp directory, the file is only written by the runs of the same user
+JOB_DURATIONS_FILE = os.environ.get('SCREENER_JOB_DURATIONS_FILE', os.path.join(
+    tempfile.gettempdir(), f"screener_job_durations_{os.getuid() if hasattr(os, 'getuid') else 'user'}", 'job_durations.json'))
+
+# Statuses of a job that did not finish successfully, its dependents are not run
+FAILED_STATUSES = ('failed', 'upstream_failed')
+
+
+def job_id(row) -> str:
+    """
+    Returns the name of the job of a config row: screen, environment and destination table.
+    """
+    return f"{row['Screen_name']} ({row['environment']}) -> {row['Dataset_id']}.{row['Bigquery_table']}"
+
+
+def build_dag(rows: list) -> dict:
+    """
+    Compiles config rows into jobs and their dependencies.
+
+    :param rows: active rows of screener_config.csv
+    :return: dict of job id -> {'row': config row, 'depends_on': list of job ids}, in the order of the config
+    """
+    jobs = {}
+    for row in rows:
+        name = job_id(row)
+        if name in jobs:
+            raise ValueError(f"Screen {row['Screen_name']} is loaded twice into {row['Dataset_id']}.{row['Bigquery_table']}")
+        jobs[name] = {'row': row, 'depends_on': []}
+
+    for name, job in jobs.items():
+        row = job['row']
+        inputs = []
+        if row.get('Iterative_load', 0) == 1 and not pd.isna(row.get('Param_values')):
+            inputs.append(row['Param_values'])
+        if not pd.isna(row.get('Split_values')):
+            inputs.append(row['Split_values'])
+        #An input screen that no active row loads is fetched by the job itself
+        job['depends_on'] = [other_name for other_name, other in jobs.items() if other_name != name
+                             and other['row']['Screen_name'] in inputs and other['row']['environment'] == row['environment']]
+
+    topological_order(jobs)
+    return jobs
+
+
+def topological_order(jobs: dict) -> list:
+    """
+    Returns the job ids with every job after its dependencies, otherwise in the order of the config.
+    Raises a ValueError if the dependencies form a cycle.
+    """
+    order = []
+    done = set()
+    remaining = list(jobs)
+    while remaining:
+        ready = [name for name in remaining if all(dependency in done for dependency in jobs[name]['depends_on'])]
+        if not ready:
+            raise ValueError(f"Circular Param_values / Split_values dependencies between: {', '.join(remaining)}")
+        for name in ready:
+            order.append(name)
+            done.add(name)
+        remaining = [name for name in remaining if name not in done]
+    return order
+
+
+def load_job_durations(path: str = JOB_DURATIONS_FILE) -> dict:
+    """
+    Returns the duration in seconds of the last successful run of every job, empty if no run was recorded.
+    """
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_job_durations(results: list, path: str = JOB_DURATIONS_FILE):
+    """
+    Records the durations of the jobs that finished successfully, for the plans of the next runs.
+    Jobs skipped by the freshness check are not recorded, as they do not extract anything.
+    """
+    durations = load_job_durations(path)
+    durations.update({result['job']: result['duration_s'] for result in results if result['status'] == 'loaded'})
+    folder = os.path.dirname(path) or '.'
+    os.makedirs(folder, mode=0o700, exist_ok=True)
+    #Every run writes its own temporary file, concurrent runs replace the file in one step each
+    fd, temp_path = tempfile.mkstemp(dir=folder, prefix='.job_durations_', suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(durations, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def plan_dag(jobs: dict, max_workers: int = DAG_MAX_WORKERS, durations: dict = None) -> dict:
+    """
+    Returns the execution plan of the jobs, without running them.
+
+    :param jobs: jobs returned by build_dag
+    :param max_workers: jobs run at the same time
+    :param durations: expected seconds per job id, by default the durations of the last runs (see load_job_durations)
+    :return: dict with the jobs (level, expected duration, start and end with max_workers), the critical path
+        and its duration, and the expected duration of the run
+    """
+    durations = load_job_durations() if durations is None else durations
+    expected = {name: float(durations.get(name, DEFAULT_JOB_SECONDS)) for name in jobs}
+    order = topological_order(jobs)
+
+    #Earliest end of every job with unlimited workers, the longest chain ending at the job
+    level, earliest_end, previous = {}, {}, {}
+    for name in order:
+        dependencies = jobs[name]['depends_on']
+        level[name] = 1 + max((level[dependency] for dependency in dependencies), default=-1)
+        previous[name] = max(dependencies, key=lambda dependency: earliest_end[dependency], default=None)
+        earliest_end[name] = (earliest_end[previous[name]] if previous[name] else 0.0) + expected[name]
+
+    critical_path = []
+    name = max(order, key=lambda job: earliest_end[job], default=None)
+    while name is not None:
+        critical_path.insert(0, name)
+        name = previous[name]
+
+    #Start and end of every job with max_workers, ready jobs are started in the order of the config
+    start, end = {}, {}
+    running = []
+    pending = list(order)
+    clock = 0.0
+    while pending or running:
+        ready = [name for name in pending if all(dependency in end for dependency in jobs[name]['depends_on'])]
+        for name in ready[:max(max_workers - len(running), 0)]:
+            start[name] = clock
+            heapq.heappush(running, (clock + expected[name], order.index(name), name))
+            pending.remove(name)
+        clock, _, name = heapq.heappop(running)
+        end[name] = clock
+
+    return {
+        'max_workers': max_workers,
+        'jobs': [{
+            'job': name,
+            'screen': jobs[name]['row']['Screen_name'],
+            'table': jobs[name]['row']['Bigquery_table'],
+            'depends_on': jobs[name]['depends_on'],
+            'level': level[name],
+            'expected_s': round(expected[name], 1),
+            'start_s': round(start[name], 1),
+            'end_s': round(end[name], 1),
+        } for name in order],
+        'critical_path': critical_path,
+        'critical_path_s': round(sum(expected[name] for name in critical_path), 1),
+        'expected_run_s': round(max(end.values(), default=0.0), 1),
+    }
+
+
+def format_plan(plan: dict) -> str:
+    """
+    Returns the plan as text, one line per job grouped by level.
+    """
+    lines = [f"Execution plan with {plan['max_workers']} workers, expected duration {plan['expected_run_s']}s"]
+    for job in plan['jobs']:
+        after = f", after {', '.join(job['depends_on'])}" if job['depends_on'] else ''
+        lines.append(f"  level {job['level']}: {job['job']}, {job['start_s']}s - {job['end_s']}s (expected {job['expected_s']}s{after})")
+    lines.append(f"Critical path ({plan['critical_path_s']}s): {' => '.join(plan['critical_path'])}")
+    return '\n'.join(lines)
+
+
+def run_dag(jobs: dict, run_job, max_workers: int = DAG_MAX_WORKERS) -> list:
+    """
+    Runs the jobs in parallel, every job after its dependencies.
+
+    :param jobs: jobs returned by build_dag
+    :param run_job: function called with the config row of a job, returns the status of the job (e.g. 'loaded', 'skipped').
+        An exception fails the job, and the jobs depending on it are not run (status 'upstream_failed').
+    :param max_workers: jobs run at the same time
+    :return: list of dict with job, screen, table, status, error and duration_s, in the order of the config
+    """
+    results = {name: {'job': name, 'screen': job['row']['Screen_name'], 'table': job['row']['Bigquery_table'],
+                      'status': 'pending', 'error': None, 'duration_s': None} for name, job in jobs.items()}
+    order = topological_order(jobs)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='screener-job') as executor:
+        futures = {}
+
+        def submit_ready():
+            #Dependencies come first in the order, a failure is passed down the whole chain in one pass
+            for name in order:
+                result = results[name]
+                if result['status'] != 'pending':
+                    continue
+                dependency_statuses = [results[dependency]['status'] for dependency in jobs[name]['depends_on']]
+                if any(status in FAILED_STATUSES for status in dependency_statuses):
+                    result['status'] = 'upstream_failed'
+                    result['error'] = f"Not run, a dependency failed: {', '.join(jobs[name]['depends_on'])}"
+                    print(f"{name}: {result['error']}")
+                elif all(status not in ('pending', 'running') for status in dependency_statuses):
+                    result['status'] = 'running'
+                    futures[executor.submit(run_timed, run_job, jobs[name]['row'])] = name
+
+        submit_ready()
+        while futures:
+            finished, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                name = futures.pop(future)
+                status, error, seconds = future.result()
+                results[name].update({'status': status, 'error': error, 'duration_s': round(seconds, 3)})
+                if error:
+                    print(f"{name} failed: {error}")
+            submit_ready()
+
+    return [results[name] for name in jobs]
@@ -1,17 +1,29 @@
 import requests
 import pandas as pd
 import json
-from google.cloud import bigquery
-from google.oauth2 import service_account
+import time
 import logging
-
-def run_screen(screen_name : str, environment :str, config ,**kwargs)-> pd.DataFrame:
+import threading
+from run_metrics import RunMetrics
+from snapshot_store import write_snapshot
+from compact_dtypes import compact_dtypes
+from load_jobs import LoadJobTracker
+from table_spec import table_spec_from_row
+from warehouse_sink import get_sink, load_credentials
+from exchange_checkpoint import IterativeCheckpoint
+from screen_splitter import split_screen
+from job_dag import DAG_MAX_WORKERS, FAILED_STATUSES, build_dag, plan_dag, format_plan, run_dag, save_job_durations
+
+def run_screen(screen_name : str, environment :str, config, timeout : float = None, stats : dict = None, **kwargs)-> pd.DataFrame:
     """
     Retrive the selected screen from the given environment with optional parameters
 
     :param screen_name: Screener name
     :param environment: STG or PROD
     :param config: configuration file for API access
+    :param timeout: optional timeout of the request in seconds
+    :param stats: optional dict, duration (seconds), payload size (bytes), error and error_kind of the request are added to it.
+        error_kind is timeout (also HTTP 408 / 504), truncated (the JSON could not be parsed), http, request or missing_key
     :param **kwargs: optional parameters for screener
     :return: pd.DataFrame
     """
@@ -42,9 +54,14 @@ def run_screen(screen_name : str, environment :str, config ,**kwargs)-> pd.DataF
         'Dylan2010.EntitlementToken': ckey
     }
 
+    #Truncated payloads fail the JSON parsing, see screen_splitter.py
+    request_stats = stats if stats is not None else {}
     try:
         # Perform the GET request
-        response = requests.get(url, headers=headers)
+        start = time.perf_counter()
+        response = requests.get(url, headers=headers, timeout=timeout)
+        request_stats['seconds'] = time.perf_counter() - start
+        request_stats['bytes'] = len(response.content)
         response.raise_for_status()  # Raise an HTTPError for bad responses (4xx, 5xx)
     
         # Attempt to parse the JSON response
@@ -57,44 +74,102 @@ def run_screen(screen_name : str, environment :str, config ,**kwargs)-> pd.DataF
                 raise KeyError("The key 'QueryResults' was not found in the response.")
         except ValueError as json_err:
             print(f"Error parsing JSON: {json_err}")
+            request_stats['error'] = f"Error parsing JSON: {json_err}"
+            request_stats['error_kind'] = 'truncated'
             df_results = pd.DataFrame()  # Return an empty DataFrame as fallback
 
     except requests.exceptions.RequestException as req_err:
         print(f"HTTP Request error: {req_err}")
+        request_stats['error'] = f"HTTP Request error: {req_err}"
+        status_code = getattr(getattr(req_err, 'response', None), 'status_code', None)
+        if isinstance(req_err, requests.exceptions.Timeout) or status_code in (408, 504):
+            request_stats['error_kind'] = 'timeout'
+        elif status_code is not None:
+            request_stats['error_kind'] = 'http'
+        else:
+            request_stats['error_kind'] = 'request'
         df_results = pd.DataFrame()  # Return an empty DataFrame as fallback
 
     except KeyError as key_err:
         print(f"Key error: {key_err}")
+        request_stats['error'] = f"Key error: {key_err}"
+        request_stats['error_kind'] = 'missing_key'
         df_results = pd.DataFrame()  # Return an empty DataFrame as fallback
     return  df_results   
 
 
-def load_to_bigquery(df :pd.DataFrame,dataset_id :str, table_id :str, credentials):
+class ScreenCache:
+    """
+    Run-scoped memo of run_screen results, keyed by screen, environment and parameters.
+    A screen loaded as its own table and also used as the Param_values source of an iterative load
+    (e.g. DataStrategy.Teo.ExchangeList2) is fetched once per run.
+    Empty extracts (failed calls) are not kept, so the next caller retries them.
+    Thread safe: jobs of the DAG asking for the same screen at the same time wait for a single fetch.
+
+    :param config: screener login config
+    :param metrics: optional RunMetrics, hits and misses are counted as run_screen_cache_hits / run_screen_cache_misses
+    """
+    def __init__(self, config, metrics=None):
+        self.config = config
+        self.metrics = metrics
+        self._extracts = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(screen_name : str, environment : str, params : dict) -> tuple:
+        # Parameters without a value are not sent to Screener, see run_screen
+        return (screen_name, environment, tuple(sorted((key, str(value)) for key, value in params.items() if value is not None)))
+
+    def run_screen(self, screen_name : str, environment : str, **kwargs) -> pd.DataFrame:
+        """
+        Returns the extract of the screen, from the memo if it was already fetched in this run.
+        A copy is returned, as the extracts are transformed in place by the callers.
+        """
+        key = self._key(screen_name, environment, kwargs)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            df = self._extracts.get(key)
+            hit = df is not None
+            with self._lock:
+                if hit:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            if self.metrics is not None:
+                self.metrics.count('run_screen_cache_hits' if hit else 'run_screen_cache_misses')
+            if not hit:
+                df = run_screen(screen_name, environment, self.config, **kwargs)
+                if not df.empty:
+                    self._extracts[key] = df
+        return df.copy()
+
+
+def load_to_bigquery(df :pd.DataFrame,dataset_id :str, table_id :str, credentials, wait=True, table_spec=None):
     """
     Inserts the provided dataframe into the selected BigQuery table
 
     :param dataset_id: source data extracted from S3
     :param table_id: destination table name
     :param credentials: credentials of GCP service account
-    :return: None
+    :param wait: if False, the job is only submitted and the caller waits for it (see LoadJobTracker)
+    :param table_spec: partitioning and clustering of the table, see table_spec_from_row
+    :return: load job
     """
-    # Initialize the BigQuery client with the credentials
-    client = bigquery.Client(credentials=credentials, project=credentials.project_id)
-
-    # Define the table reference
-    table_ref = client.dataset(dataset_id).table(table_id) 
-    job_config = bigquery.LoadJobConfig(
-    write_disposition=bigquery.WriteDisposition.WRITE_APPEND,  # Options: WRITE_TRUNCATE, WRITE_APPEND, WRITE_EMPTY
-    source_format=bigquery.SourceFormat.CSV,
-    autodetect=True,  # Automatically detect the schema
-    )
-    # Load the DataFrame into BigQuery
-    load_job = client.load_table_from_dataframe(df, table_ref, job_config=job_config)
-    load_job.result()  # Wait for the job to complete
+    # Load the DataFrame into the warehouse (BigQuery, or DuckDB for local runs)
+    load_job = get_sink(credentials).load(df, dataset_id, table_id,
+                                          write_disposition='WRITE_APPEND',  # Options of bigquery.WriteDisposition: WRITE_TRUNCATE, WRITE_APPEND, WRITE_EMPTY
+                                          autodetect=True,  # Automatically detect the schema
+                                          table_spec=table_spec, wait=wait)
 
     #print(f'Successfully loaded {load_job.output_rows} rows into {dataset_id}.{table_id}')
+    return load_job
 
-def iterative_load(exchangelist :list,screen_name : str, environment : str, screener_parameter : str,config)-> pd.DataFrame:
+def iterative_load(exchangelist :list,screen_name : str, environment : str, screener_parameter : str,config, checkpoint : IterativeCheckpoint = None)-> pd.DataFrame:
     """
     The inventory table is iteretavily loaded to avoid system overload. This function iterates over the provided exchange list,
     extracts data from screener for each and returns the results in a single dataframe.
@@ -104,23 +179,34 @@ def iterative_load(exchangelist :list,screen_name : str, environment : str, scre
     :param environment: Screener environment (PROD or STG)
     :param screener_parameter: screener parameters to pass to the API call
     :param config: screener login config
+    :param checkpoint: optional started checkpoint, every extract is saved to it and exchanges already in it are not called again
     :return: dataframe with the union of all extracts
     """
 
     full_extract_df = None
 
     for exchangeID in exchangelist:
+        if checkpoint is not None and checkpoint.is_done(exchangeID):
+            print(f"exchangeID {exchangeID} already extracted, resumed from checkpoint")
+            continue
         temp_param = {
            screener_parameter : exchangeID
         }
+        #Per exchange extracts are used once, they are not kept in the ScreenCache
         temp_df = run_screen(screen_name,environment,config,**temp_param)
 
-        if not temp_df.empty:
+        if checkpoint is not None:
+            #Chunks are merged from the checkpoint at the end
+            checkpoint.save(exchangeID, temp_df)
+        elif not temp_df.empty:
             if full_extract_df is None:
                 full_extract_df = temp_df  # Initialize with the first valid DataFrame
             else:
                 full_extract_df = pd.concat([full_extract_df, temp_df], ignore_index=True)
         print(f"processed exchangeID: {exchangeID}")
+
+    if checkpoint is not None:
+        full_extract_df = checkpoint.merge(exchangelist)
     return full_extract_df
 
 # Function to clean text: removes newlines, trims spaces, and replaces problematic characters
@@ -135,7 +221,7 @@ def clean_text(value):
         return value.replace("\n", " ").replace("\r", " ").strip()  # Remove newlines and extra spaces
     return value
 
-def select_top_date_from_bigquery(dataset_id :str, table_id :str, column : str,  credentials):
+def select_top_date_from_bigquery(dataset_id :str, table_id :str, column : str,  credentials, since=None, stats : dict = None):
     """
     Retrieves the maximum date of a selected table 
 
@@ -144,111 +230,229 @@ def select_top_date_from_bigquery(dataset_id :str, table_id :str, column : str,
         :param table_id (str): BigQuery table ID.
         :param columns (list): List of column names to retrieve.
         :param credentials: credentials of GCP service account
+        :param since (optional): only partitions from this date on are scanned, if the table is partitioned (see partition_filter).
+            The result is empty (NaT) if the table has no rows since then.
+        :param stats (dict, optional): bytes processed and billed of the query are added to it
 
     Returns:
         pandas.DataFrame: A DataFrame containing the retrieved date.
     """
-    # Initialize BigQuery client
-    client = bigquery.Client(credentials=credentials, project=credentials.project_id)
+    # BigQuery, or DuckDB for local runs
+    sink = get_sink(credentials)
 
     # Construct the query
     query = f"""
     SELECT max({column}) 
-    FROM `{credentials.project_id}.{dataset_id}.{table_id}`
+    FROM {sink.table_name(dataset_id, table_id)}
     """
+    pruning_condition = sink.partition_filter(dataset_id, table_id, since) if since is not None else None
+    if pruning_condition is not None:
+        query += f" WHERE {pruning_condition}"
 
-    # Execute the query
-    query_job = client.query(query)
+    # Execute the query and convert the result to a DataFrame
+    results = sink.query(query, stats=stats)
 
-    # Convert the result to a DataFrame
-    results = query_job.result().to_dataframe()
+    if stats is not None:
+        stats['partition_pruning'] = pruning_condition is not None
 
     return results
 
-def run_batch_process():
-    try:
-        print('Process started')
-        #Get screener authentication parameters
-        with open('Screener inventory/config.json', 'r') as f:
-            data = f.read()
-        config = json.loads(data)
-
-        #Get Screener list for ingestion
-        screen_list_df = pd.read_csv('Screener inventory/screener_config.csv')
-        #Define BigQuery parameters
-        # Path to your service account key file
-        key_path = 'Screener inventory/dj-ds-marketdata-nonprod-5b2c59fc4bff.json'
-        # Load the credentials from the key file
-        service_account_credentials = service_account.Credentials.from_service_account_file(key_path)
-        df_temp = pd.DataFrame()
-
-        for index, row in screen_list_df.iterrows():
-            if(row['Active']==1):
-                #Retrieve screener config data
-                screen= row['Screen_name']
-                env = row['environment']
-                dataset_id = row['Dataset_id']
-                table_id = row['Bigquery_table']
-                Iterative_load = row['Iterative_load']
-                Param_name = row['Param_name']
-                print(f"Processing: {screen}")
-
-                # CRON does not support biweekly schedules. 
-                # Therefore the batch is scheduled weekly, and it is checked inside the script how many days have passed since the last refresh
-                # If less than 13 days, the extraction is not executed.
-
-                max_date = select_top_date_from_bigquery(dataset_id, table_id, 'repDate' ,service_account_credentials).iloc[0, 0]
-                delta = pd.Timestamp.now()- max_date
-                tables_updated_ct = 0
-                
-                if(delta.days>=13):
-                    print("Execute")
-                    if Iterative_load==0:
-                        df_temp = run_screen(screen,env,config)
-                        print(f"{screen} extracted successfully")
-                    else:
-                        Param_values = row['Param_values']
-                        #Extracting the list of Exchange IDs that are required to be pasted into each call as a parameter
-                        exchange_df = run_screen(Param_values,env,config)
-                        exchange_list = exchange_df.iloc[:,0].to_list()
-
-                        df_temp = iterative_load(exchange_list,screen,env,Param_name,config)
-
-                        print("Successfully processed iterative extract")
-                        
-                    df_temp.dropna(how='all', inplace=True)
-                    # Apply to all string columns in the DataFrame
-                    df_temp = df_temp.apply(lambda col: col.map(clean_text) if col.dtype == "object" else col)
-                    
-                    #Replace spaces in column names as BigQuery doesn't support it
-                    df_temp.columns = df_temp.columns.str.strip().str.replace(' ', '_')
-
-                    df_temp['SourceEnv'] = env
-
-                    #For reporting purposes, adding extraction timestamp
-                    df_temp['repDate']  = pd.to_datetime('today')
-
-                    if df_temp is None or df_temp.empty:
-                        print("df_temp is empty before adding SourceEnv")
-                    
-
-                    #Calling bigquery function and inserting to table
-                    load_to_bigquery(df_temp,dataset_id, table_id, service_account_credentials)
-
-                    tables_updated_ct = tables_updated_ct +1
-                else:
-                    print('skip')
+def wait_for_loads(tracker : LoadJobTracker, metrics) -> list:
+    """
+    Waits for the load jobs submitted during the run, see LoadJobTracker.wait_all.
 
-                
+    :return: one record per load job, empty if the loads were not submitted asynchronously
+    """
+    if tracker is None:
+        return []
+    with metrics.stage('bigquery_load_wait') as stage:
+        load_results = tracker.wait_all()
+        stage['jobs'] = len(load_results)
+        stage['failed_jobs'] = sum(load_result['error'] is not None for load_result in load_results)
+        stage['output_rows'] = sum(load_result['output_rows'] or 0 for load_result in load_results)
+    for load_result in load_results:
+        logging.info(f"Load job {load_result['job_id']} into {load_result['table']}: {load_result['state']}, {load_result['output_rows']} rows in {load_result['duration_s']}s")
+    return load_results
+
+def refresh_screen(row, config, credentials, screen_cache : ScreenCache, metrics : RunMetrics, tracker : LoadJobTracker = None, resume : bool = True) -> str:
+    """
+    Refreshes the screen of a screener_config.csv row in BigQuery, if its last refresh is at least 13 days old.
 
-        if(tables_updated_ct>0):
+    :param row: row of screener_config.csv
+    :param config: screener login config
+    :param credentials: credentials of GCP service account
+    :param screen_cache: screens fetched in this run
+    :param metrics: RunMetrics of the run
+    :param tracker: if given, the load job is only submitted to it
+    :param resume: if True, an iterative load resumes the checkpoint of a failed run (see exchange_checkpoint.py)
+    :return: 'loaded', 'skipped' if the table is fresh, or 'empty' if the extract has no rows
+    """
+    #Retrieve screener config data
+    screen= row['Screen_name']
+    env = row['environment']
+    dataset_id = row['Dataset_id']
+    table_id = row['Bigquery_table']
+    Iterative_load = row['Iterative_load']
+    Param_name = row['Param_name']
+    print(f"Processing: {screen}")
+
+    # CRON does not support biweekly schedules. 
+    # Therefore the batch is scheduled weekly, and it is checked inside the script how many days have passed since the last refresh
+    # If less than 13 days, the extraction is not executed.
+
+    with metrics.stage('freshness_query', screen=screen, table=table_id) as stage:
+        #Only the partitions of the last 14 days are scanned, no date within them means the table is older
+        max_date = select_top_date_from_bigquery(dataset_id, table_id, 'repDate' ,credentials,
+                                                 since=pd.Timestamp.now().normalize() - pd.Timedelta(days=14), stats=stage).iloc[0, 0]
+    metrics.count('query_bytes_processed', stage.get('bytes_processed') or 0)
+
+    if not (pd.isna(max_date) or (pd.Timestamp.now()- max_date).days>=13):
+        print(f"{screen}: skip")
+        metrics.count('tables_skipped')
+        return 'skipped'
+
+    print(f"{screen}: execute")
+    with metrics.stage('fetch', screen=screen) as stage:
+        if Iterative_load==0 and not pd.isna(row.get('Split_param')):
+            #Oversized screens are split on Split_param, the values are taken from the Split_values screen
+            split_values = screen_cache.run_screen(row['Split_values'],env).iloc[:,0].to_list()
+            split_requests = []
+            df_temp = split_screen(lambda *args, **kwargs: run_screen(*args, config=config, **kwargs), screen, env,
+                                   row['Split_param'], split_values, requests_log=split_requests)
+            stage['requests'] = len(split_requests)
+            stage['split_requests'] = split_requests
+            print(f"{screen} extracted successfully")
+        elif Iterative_load==0:
+            df_temp = screen_cache.run_screen(screen,env)
+            print(f"{screen} extracted successfully")
+        else:
+            Param_values = row['Param_values']
+            #Extracting the list of Exchange IDs that are required to be pasted into each call as a parameter
+            exchange_df = screen_cache.run_screen(Param_values,env)
+            exchange_list = exchange_df.iloc[:,0].to_list()
+
+            #Extracts are checkpointed per exchange, a failed run is resumed by the next one
+            checkpoint = IterativeCheckpoint(screen, env, Param_name)
+            stage['resumed_exchanges'] = len(set(checkpoint.start(resume)) & {str(exchangeID) for exchangeID in exchange_list})
+            df_temp = iterative_load(exchange_list,screen,env,Param_name,config,checkpoint)
+
+            print("Successfully processed iterative extract")
+        stage['rows'] = len(df_temp) if df_temp is not None else 0
+
+    #An iterative load without any chunk returns None (e.g. every exchange was empty), nothing is loaded
+    if df_temp is None or df_temp.empty:
+        print(f"{screen}: empty extract, the table is not loaded")
+        metrics.count('tables_empty')
+        return 'empty'
+        
+    with metrics.stage('transform', screen=screen):
+        df_temp.dropna(how='all', inplace=True)
+        # Apply to all string columns in the DataFrame
+        df_temp = df_temp.apply(lambda col: col.map(clean_text) if col.dtype == "object" else col)
+        
+        #Replace spaces in column names as BigQuery doesn't support it
+        df_temp.columns = df_temp.columns.str.strip().str.replace(' ', '_')
+
+        df_temp['SourceEnv'] = env
+
+        #For reporting purposes, adding extraction timestamp
+        df_temp['repDate']  = pd.to_datetime('today')
+
+    if row.get('Compact_dtypes', 0) == 1:
+        with metrics.stage('compact_dtypes', screen=screen, table=table_id) as stage:
+            #Smaller types loading into the same BigQuery column types, the memory of every column is logged
+            df_temp, dtype_report = compact_dtypes(df_temp, get_sink(credentials).get_schema(dataset_id, table_id))
+            stage['bytes_before'] = int(dtype_report['bytes_before'].sum())
+            stage['bytes_after'] = int(dtype_report['bytes_after'].sum())
+            stage['columns'] = dtype_report.to_dict('records')
+
+    with metrics.stage('snapshot', screen=screen) as stage:
+        #Local copy of the extract, validation and reloads can read it without calling Screener again
+        snapshot_params = {Param_name: row['Param_values']} if Iterative_load != 0 else None
+        stage['path'] = write_snapshot(df_temp, screen, env, snapshot_params)
+    
+
+    with metrics.stage('bigquery_load', screen=screen, table=table_id) as stage:
+        #Calling bigquery function and inserting to table
+        load_job = load_to_bigquery(df_temp,dataset_id, table_id, credentials, wait=tracker is None, table_spec=table_spec_from_row(row))
+        stage['rows'] = len(df_temp)
+        if tracker is not None:
+            stage['job_id'] = tracker.submit(load_job, screen=screen, table=table_id)
+
+    metrics.count('tables_loaded')
+    return 'loaded'
+
+
+def run_batch_process(async_loads : bool = False, max_workers : int = DAG_MAX_WORKERS, dry_run : bool = False, resume : bool = True):
+    """
+    Refreshes the active screens of screener_config.csv in BigQuery, if their last refresh is at least 13 days old.
+    The rows run as a job DAG (see job_dag.py): independent screens are refreshed in parallel, an iterative load
+    starts after the row loading its Param_values screen.
+
+    :param async_loads: if True, load jobs are only submitted and all of them are waited for at the end of the run
+    :param max_workers: screens refreshed at the same time, 1 refreshes them one by one in dependency order
+    :param dry_run: if True, nothing is run, the execution plan and its critical path are printed and returned
+    :param resume: if True, iterative loads resume the checkpoints of failed runs, otherwise they start over
+    :return: response message, result of every screen, load jobs in async mode and the run summary
+    """
+    #Stage timings and memory of the run, returned in the response
+    metrics = RunMetrics('Refresh_Screener_Inventory')
+    tracker = LoadJobTracker() if async_loads else None
+    try:
+        print('Process started')
+        with metrics.stage('read_config'):
+            #Get Screener list for ingestion
+            screen_list_df = pd.read_csv('Screener inventory/screener_config.csv')
+            jobs = build_dag([row for _, row in screen_list_df.iterrows() if row['Active']==1])
+
+        if dry_run:
+            plan = plan_dag(jobs, max_workers)
+            print(format_plan(plan))
+            return {'response': f"Dry run: {len(jobs)} screens, expected duration {plan['expected_run_s']}s", 'plan': plan}
+
+        with metrics.stage('read_credentials'):
+            #Get screener authentication parameters
+            with open('Screener inventory/config.json', 'r') as f:
+                data = f.read()
+            config = json.loads(data)
+
+            #Define BigQuery parameters
+            # Path to your service account key file
+            key_path = 'Screener inventory/dj-ds-marketdata-nonprod-5b2c59fc4bff.json'
+            # Load the credentials from the key file
+            service_account_credentials = load_credentials(key_path)
+        #Screens fetched in this run, a screen is fetched once even if it is used by several rows
+        screen_cache = ScreenCache(config, metrics)
+
+        with metrics.stage('job_dag', jobs=len(jobs), max_workers=max_workers):
+            screen_results = run_dag(jobs, lambda row: refresh_screen(row, config, service_account_credentials, screen_cache, metrics, tracker, resume), max_workers)
+        save_job_durations(screen_results)
+
+        load_results = wait_for_loads(tracker, metrics)
+        failed_loads = [f"{load_result['table']}: {load_result['error']}" for load_result in load_results if load_result['error']]
+
+        #Checkpoints of loaded tables are removed, the others are resumed by the next run
+        failed_tables = {load_result['table'] for load_result in load_results if load_result['error']}
+        for screen_result in screen_results:
+            row = jobs[screen_result['job']]['row']
+            if screen_result['status'] in ('loaded', 'empty') and row['Iterative_load'] != 0 and row['Bigquery_table'] not in failed_tables:
+                IterativeCheckpoint(row['Screen_name'], row['environment'], row['Param_name']).clear()
+
+        if failed_loads:
+            raise RuntimeError(f"{len(failed_loads)} load jobs failed. {'; '.join(failed_loads)}")
+
+        tables_updated_ct = sum(screen_result['status'] == 'loaded' for screen_result in screen_results)
+        failed_screens = [f"{screen_result['job']}: {screen_result['error']}" for screen_result in screen_results if screen_result['status'] in FAILED_STATUSES]
+        if failed_screens:
+            result = f"Job finished with errors. {tables_updated_ct} tables were refreshed, {len(failed_screens)} screens failed. {'; '.join(failed_screens)}"
+        elif(tables_updated_ct>0):
             result = f"Job executed successfully. {tables_updated_ct} tables were refreshed"
         else:
             result = "Job executed successfully, but no tables were refreshed, due to update frequency rules"
 
         print(result)
-        logging.log(result)
-        return {'response': result}
+        logging.info(result)
+        return {'response': result, 'screens': screen_results, 'load_jobs': load_results, 'run_summary': metrics.log_summary()}
     
     
     except Exception as e:
@@ -256,7 +460,7 @@ def run_batch_process():
         error_message = str(e)  # Convert the exception to a string message
         logging.error(error_message)
         print(error_message)
-        return {'response': error_message}    
+        return {'response': error_message, 'run_summary': metrics.log_summary()}    
 
 '''
 def execute_batch(request):
@@ -272,4 +476,5 @@ def execute_batch(request):
     return (run_batch_process())
 '''
 
-run_batch_process()
\ No newline at end of file
+if __name__ == "__main__":
+    run_batch_process()
\ No newline at end of file
@@ -0,0 +1,111 @@
+"""
+Adaptive splitting of oversized Screener requests.
+
+Large screens can time out or return a truncated payload when called in one request. A row of
+screener_config.csv with Split_param and Split_values is first requested as a whole. If the request times out,
+returns a truncated payload, takes longer than SPLIT_MAX_SECONDS or returns more than SPLIT_MAX_MB, it is
+requested again per slice of the values of Split_param (e.g. ExchangeID), taken from the first column of the
+Split_values screen. A slice is sent as one parameter, its values joined by SPLIT_VALUE_SEPARATOR. Slices over
+budget are halved again, until every slice is within budget or holds a single value. The slices are merged
+into one extract.
+
+Other failures (e.g. 401/403 for a wrong ckey, other 4xx and 5xx) are not caused by the size of the request,
+they raise straight away instead of being split. A single value that still times out or is truncated cannot be
+split further, the extract would be incomplete, so the screen fails with the failed values.
+
+Unlike Iterative_load, which always calls the screen once per value, a screen within budget is still fetched
+in one request, and an oversized one in as few requests as the budgets allow.
+"""
+import os
+import pandas as pd
+
+SPLIT_MAX_SECONDS = float(os.environ.get('SCREENER_SPLIT_MAX_SECONDS', 120))
+SPLIT_MAX_MB = float(os.environ.get('SCREENER_SPLIT_MAX_MB', 50))
+SPLIT_VALUE_SEPARATOR = os.environ.get('SCREENER_SPLIT_VALUE_SEPARATOR', ',')
+
+# Failures caused by the size of a request (see run_screen), a smaller request can succeed
+SPLIT_ERROR_KINDS = ('timeout', 'truncated')
+
+
+def over_budget(stats: dict, max_seconds: float, max_bytes: int) -> str:
+    """
+    Returns why a response is not within the budgets, or None if it is.
+
+    :param stats: request stats filled by run_screen (seconds, bytes, error, error_kind)
+    :raises RuntimeError: if the request failed for a reason that splitting does not fix
+    """
+    if stats.get('error'):
+        if stats.get('error_kind') not in SPLIT_ERROR_KINDS:
+            raise RuntimeError(stats['error'])
+        return f"failed ({stats['error']})"
+    if stats.get('seconds', 0) > max_seconds:
+        return f"slow ({stats['seconds']:.1f}s)"
+    if stats.get('bytes', 0) > max_bytes:
+        return f"oversized ({stats['bytes'] / 1024 / 1024:.1f} MB)"
+    return None
+
+
+def split_screen(fetch, screen_name: str, environment: str, split_param: str, values: list,
+                 max_seconds: float = None, max_mb: float = None, requests_log: list = None) -> pd.DataFrame:
+    """
+    Fetches the screen in one request, or in slices of the split parameter if the request is over budget.
+
+    :param fetch: function fetching a screen, called as fetch(screen_name, environment, timeout=, stats=, **params) (see run_screen)
+    :param split_param: screen parameter the request is split on, e.g. ExchangeID
+    :param values: values of the split parameter
+    :param max_seconds: latency budget of a request, also its timeout
+    :param max_mb: size budget of a response payload
+    :param requests_log: optional list, one record per request is appended (values, rows, seconds, bytes, over_budget)
+    :return: union of the slices
+    :raises RuntimeError: if a request fails for another reason than its size, or a single value still fails
+    """
+    max_seconds = SPLIT_MAX_SECONDS if max_seconds is None else max_seconds
+    max_bytes = int((SPLIT_MAX_MB if max_mb is None else max_mb) * 1024 * 1024)
+    requests_log = [] if requests_log is None else requests_log
+
+    def request(values_slice):
+        stats = {}
+        params = {} if values_slice is None else {split_param: SPLIT_VALUE_SEPARATOR.join(str(value) for value in values_slice)}
+        df = fetch(screen_name, environment, timeout=max_seconds, stats=stats, **params)
+        try:
+            reason = over_budget(stats, max_seconds, max_bytes)
+        except RuntimeError as e:
+            raise RuntimeError(f"{screen_name} failed: {e}") from e
+        requests_log.append({
+            'values': None if values_slice is None else len(values_slice),
+            'rows': len(df),
+            'seconds': round(stats.get('seconds', 0), 3),
+            'bytes': stats.get('bytes', 0),
+            'over_budget': reason,
+        })
+        return df, reason, bool(stats.get('error'))
+
+    failed_values = []
+
+    def fetch_slice(values_slice) -> list:
+        df, reason, failed = request(values_slice)
+        if reason is None:
+            return [df]
+        if len(values_slice) == 1:
+            #A single value cannot be split further. A slow or large extract is complete and kept, a failed one is not.
+            print(f"{screen_name} {split_param}={values_slice[0]} is {reason}, it cannot be split further")
+            if failed:
+                failed_values.append(values_slice[0])
+            return [df]
+        middle = len(values_slice) // 2
+        print(f"{screen_name}: slice of {len(values_slice)} {split_param} values is {reason}, splitting it in two")
+        return fetch_slice(values_slice[:middle]) + fetch_slice(values_slice[middle:])
+
+    df, reason, failed = request(None)
+    if failed and not values:
+        raise RuntimeError(f"{screen_name} is {reason}, and there are no {split_param} values to split it on")
+    if reason is None or not values:
+        return df
+
+    print(f"{screen_name} is {reason}, splitting it on {split_param}")
+    frames = [frame for frame in fetch_slice(list(values)) if not frame.empty]
+    if failed_values:
+        raise RuntimeError(f"{screen_name} failed for {split_param} {', '.join(str(value) for value in failed_values)} "
+                           f"after {len(requests_log)} requests, the extract is incomplete")
+    print(f"{screen_name} extracted in {len(requests_log)} requests")
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
@@ -0,0 +1,71 @@
+"""
+Non-blocking BigQuery load jobs.
+
+load_to_bigquery(..., wait=False) returns the submitted load job instead of waiting for it. The jobs of a run are
+registered in a LoadJobTracker and waited for together at the end, so BigQuery ingests the tables in parallel and
+the wall time of the loads is close to the slowest load instead of the sum of all loads.
+
+NOTE: every Cloud Function folder is deployed on its own, so this file is copied into each folder
+that uses it. Keep the copies identical.
+"""
+import time
+import concurrent.futures
+
+# Maximum time to wait for all load jobs of a run, in seconds
+LOAD_WAIT_TIMEOUT_SECONDS = 480
+
+
+def _seconds_between(start, end):
+    if start is None or end is None:
+        return None
+    return round((end - start).total_seconds(), 3)
+
+
+class LoadJobTracker:
+    """
+    Collects the load jobs of a run by job id and waits for them together.
+    """
+    def __init__(self):
+        self.jobs = {}
+
+    def submit(self, load_job, **labels) -> str:
+        """
+        Registers a submitted load job. Labels (e.g. screen or table) are added to its result.
+
+        :return: job id
+        """
+        self.jobs[load_job.job_id] = {'job': load_job, 'labels': labels}
+        return load_job.job_id
+
+    def wait_all(self, timeout: float = LOAD_WAIT_TIMEOUT_SECONDS) -> list:
+        """
+        Waits for all registered jobs, within one common timeout.
+
+        :param timeout: maximum seconds to wait for all jobs together
+        :return: one record per job with state, output_rows, output_bytes, durations and error
+        """
+        deadline = time.perf_counter() + timeout
+        results = []
+
+        for job_id, entry in self.jobs.items():
+            load_job = entry['job']
+            record = {'job_id': job_id, **entry['labels'], 'state': None, 'output_rows': None, 'output_bytes': None, 'error': None}
+            try:
+                #Jobs run in parallel on BigQuery, so waiting for them one by one takes as long as the slowest job
+                load_job.result(timeout=max(deadline - time.perf_counter(), 0))
+            except concurrent.futures.TimeoutError:
+                record['error'] = f"Load job did not finish within {timeout}s"
+            except Exception as e:
+                record['error'] = str(e)
+
+            record['state'] = load_job.state
+            if record['error'] is None:
+                record['output_rows'] = load_job.output_rows
+                record['output_bytes'] = load_job.output_bytes
+            #Time waiting in the BigQuery queue and time of the load itself
+            record['queued_s'] = _seconds_between(load_job.created, load_job.started)
+            record['duration_s'] = _seconds_between(load_job.started, load_job.ended)
+            record['total_s'] = _seconds_between(load_job.created, load_job.ended)
+            results.append(record)
+
+        return results
@@ -0,0 +1,208 @@
+"""
+Stage-level timing and memory instrumentation of batch runs.
+
+Each stage is timed with RunMetrics.stage (context manager) or RunMetrics.timed (decorator).
+While a stage is open, the resident set size of the process is sampled in the background, so
+every stage reports its own peak RSS. A JSON record is printed per stage, which Cloud Logging
+stores as a structured jsonPayload, and summary() returns the per-run breakdown for the response.
+
+NOTE: every Cloud Function folder is deployed on its own, so this file is copied into each folder
+that uses it. Keep the copies identical.
+"""
+import os
+import json
+import time
+import uuid
+import resource
+import threading
+import functools
+from contextlib import contextmanager, nullcontext
+
+# Page size used to convert /proc/self/statm pages into bytes
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss_mb() -> float:
+    """
+    Returns the current resident set size of the process in MB.
+    Falls back to the process high-water mark where /proc is not available (e.g. macOS).
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 1024 / 1024
+    except (OSError, IndexError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """
+    Returns the peak resident set size of the process so far in MB.
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB on Linux
+    return max_rss / 1024 / 1024 if os.uname().sysname == 'Darwin' else max_rss / 1024
+
+
+def log_record(record: dict):
+    """
+    Prints a single-line JSON record. Cloud Logging parses it into a structured log entry.
+    """
+    print(json.dumps(record, default=str), flush=True)
+
+
+def run_timed(function, *args) -> tuple:
+    """
+    Calls the function, e.g. one job of a parallel run, and times it. An exception fails the call without stopping the run.
+
+    :return: (result of the function or 'failed', error message or None, seconds)
+    """
+    start = time.perf_counter()
+    try:
+        return function(*args), None, time.perf_counter() - start
+    except Exception as e:
+        return 'failed', str(e), time.perf_counter() - start
+
+
+class RunMetrics:
+    """
+    Collects the stage timings of one batch run.
+
+    :param run_name: name of the batch, e.g. the Cloud Function name
+    :param sample_interval: seconds between RSS samples while a stage is open
+    """
+    def __init__(self, run_name: str, sample_interval: float = 0.05):
+        self.run_name = run_name
+        self.run_id = uuid.uuid4().hex[:12]
+        self.sample_interval = sample_interval
+        self.stages = []
+        self.counters = {}
+        self._start = time.perf_counter()
+        self._start_rss = current_rss_mb()
+        self._open_stages = {}
+        self._lock = threading.Lock()
+        self._stop_sampler = None
+
+    def _sample(self, stop_event: threading.Event):
+        while not stop_event.wait(self.sample_interval):
+            with self._lock:
+                if not self._open_stages:
+                    continue
+                rss = current_rss_mb()
+                for record in self._open_stages.values():
+                    record['peak_rss_mb'] = max(record['peak_rss_mb'], rss)
+
+    def _ensure_sampler(self):
+        with self._lock:
+            if self._stop_sampler is None:
+                self._stop_sampler = threading.Event()
+                threading.Thread(target=self._sample, args=(self._stop_sampler,), name=f"rss-sampler-{self.run_id}", daemon=True).start()
+
+    def close(self):
+        """
+        Stops the background RSS sampler. Called by log_summary at the end of the run.
+        """
+        with self._lock:
+            if self._stop_sampler is not None:
+                self._stop_sampler.set()
+                self._stop_sampler = None
+
+    @contextmanager
+    def stage(self, stage_name: str, **labels):
+        """
+        Times a stage of the run. Labels (e.g. screen or table name) are added to the stage record.
+        The yielded dict can be used to add further fields, e.g. the number of rows processed.
+        """
+        rss = current_rss_mb()
+        record = {
+            'run_name': self.run_name,
+            'run_id': self.run_id,
+            'stage': stage_name,
+            **labels,
+            'status': 'ok',
+            'start_rss_mb': round(rss, 1),
+            'peak_rss_mb': rss,
+        }
+        key = object()
+        with self._lock:
+            self._open_stages[key] = record
+        self._ensure_sampler()
+
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record['status'] = 'error'
+            record['error'] = str(e)
+            raise
+        finally:
+            record['duration_s'] = round(time.perf_counter() - start, 4)
+            end_rss = current_rss_mb()
+            with self._lock:
+                del self._open_stages[key]
+            record['peak_rss_mb'] = round(max(record['peak_rss_mb'], end_rss), 1)
+            record['rss_delta_mb'] = round(end_rss - rss, 1)
+            record['severity'] = 'ERROR' if record['status'] == 'error' else 'INFO'
+            record['message'] = f"{self.run_name} {stage_name} {record['status']} in {record['duration_s']}s"
+            self.stages.append(record)
+            log_record(record)
+
+    def timed(self, stage_name: str = None, **labels):
+        """
+        Decorator version of stage(). The function name is used if no stage name is given.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(stage_name or func.__name__, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, counter_name: str, value: int = 1):
+        """
+        Adds to a run-level counter, e.g. cache hits or files loaded. Thread safe.
+        """
+        with self._lock:
+            self.counters[counter_name] = self.counters.get(counter_name, 0) + value
+
+    def summary(self) -> dict:
+        """
+        Returns the per-stage breakdown of the run: count, total and max duration and peak RSS per stage name.
+        """
+        per_stage = {}
+        for record in self.stages:
+            entry = per_stage.setdefault(record['stage'], {'count': 0, 'total_s': 0.0, 'max_s': 0.0, 'peak_rss_mb': 0.0, 'errors': 0})
+            entry['count'] += 1
+            entry['total_s'] = round(entry['total_s'] + record['duration_s'], 4)
+            entry['max_s'] = max(entry['max_s'], record['duration_s'])
+            entry['peak_rss_mb'] = max(entry['peak_rss_mb'], record['peak_rss_mb'])
+            entry['errors'] += record['status'] == 'error'
+
+        return {
+            'run_name': self.run_name,
+            'run_id': self.run_id,
+            'total_s': round(time.perf_counter() - self._start, 4),
+            'start_rss_mb': round(self._start_rss, 1),
+            'process_peak_rss_mb': round(peak_rss_mb(), 1),
+            'stages': per_stage,
+            'counters': dict(self.counters),
+        }
+
+    def log_summary(self) -> dict:
+        """
+        Prints the run summary as a structured log record and returns it.
+        """
+        self.close()
+        summary = self.summary()
+        log_record({**summary, 'severity': 'INFO', 'message': f"{self.run_name} run summary"})
+        return summary
+
+
+def optional_stage(metrics, stage_name: str, **labels):
+    """
+    Returns metrics.stage(...) if metrics are collected, otherwise a no-op context manager.
+    Used by helper functions that are also called without instrumentation.
+    """
+    if metrics is None:
+        return nullcontext({})
+    return metrics.stage(stage_name, **labels)
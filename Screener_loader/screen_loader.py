@@ -1,9 +1,14 @@
 import requests
 import pandas as pd
 import json
-from google.cloud import bigquery
-from google.oauth2 import service_account
 import logging
+import asyncio
+from run_metrics import RunMetrics
+from snapshot_store import write_snapshot
+from compact_dtypes import compact_dtypes
+from load_jobs import LoadJobTracker
+from table_spec import table_spec_from_row
+from warehouse_sink import get_sink, load_credentials
 
 def run_screen(screen_name : str, environment :str, config ,**kwargs)-> pd.DataFrame:
     """
@@ -68,7 +73,6 @@ def run_screen(screen_name : str, environment :str, config ,**kwargs)-> pd.DataF
         df_results = pd.DataFrame()  # Return an empty DataFrame as fallback
     return  df_results   
 import pandas as pd
-from google.cloud import bigquery
 
 def convert_dataframe_types(df, dataset_id, table_id, credentials):
     """
@@ -80,15 +84,8 @@ def convert_dataframe_types(df, dataset_id, table_id, credentials):
     :param credentials: GCP service account credentials
     :return: Converted DataFrame
     """
-    # Initialize BigQuery client
-    client = bigquery.Client(credentials=credentials, project=credentials.project_id)
-
-    # Fetch BigQuery table schema
-    table_ref = client.dataset(dataset_id).table(table_id)
-    table = client.get_table(table_ref)  # Get table details
-
-    # Create a dictionary of column data types from BigQuery schema
-    schema_dict = {field.name: field.field_type for field in table.schema}
+    # Create a dictionary of column data types from BigQuery schema (empty if the table does not exist yet)
+    schema_dict = get_sink(credentials).get_schema(dataset_id, table_id)
 
     # Iterate through columns and convert dynamically
     for col in df.columns:
@@ -109,7 +106,7 @@ def convert_dataframe_types(df, dataset_id, table_id, credentials):
     return df  # Return the converted DataFrame
 
 
-def load_to_bigquery(df :pd,dataset_id, table_id, history, credentials):
+def load_to_bigquery(df :pd,dataset_id, table_id, history, credentials, wait=True, table_spec=None):
     """
     Inserts the provided dataframe into the selected BigQuery table
 
@@ -117,89 +114,259 @@ def load_to_bigquery(df :pd,dataset_id, table_id, history, credentials):
     :param table_id: destination table name
     :param history: determines if a snapshot is created or current data is overwritten
     :param credentials: credentials of GCP service account
-    :return: None
+    :param wait: if False, the job is only submitted and the caller waits for it (see LoadJobTracker)
+    :param table_spec: partitioning and clustering of the table, see table_spec_from_row
+    :return: load job
     """
-    # Initialize the BigQuery client with the credentials
-    client = bigquery.Client(credentials=credentials, project=credentials.project_id)
-
-    #Check if history is required
-    insert_method = bigquery.WriteDisposition.WRITE_APPEND if history == 1 else bigquery.WriteDisposition.WRITE_TRUNCATE
-
-    # Define the table reference
-    table_ref = client.dataset(dataset_id).table(table_id) 
-    job_config = bigquery.LoadJobConfig(
-        create_disposition=bigquery.CreateDisposition.CREATE_IF_NEEDED, #Adds column names from DF if doesn't exist already
-        write_disposition = insert_method,  # Options: WRITE_TRUNCATE, WRITE_APPEND, WRITE_EMPTY
-        source_format=bigquery.SourceFormat.CSV,
-        #schema_update_options=[bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION],  # Allow new fields
-        autodetect=True,  # Automatically detect the schema
-    )
-    # Load the DataFrame into BigQuery
-    load_job = client.load_table_from_dataframe(df, table_ref, job_config=job_config)
-    load_job.result()  # Wait for the job to complete
+    #Check if history is required (values of bigquery.WriteDisposition, the BigQuery client is only imported by the sink)
+    insert_method = 'WRITE_APPEND' if history == 1 else 'WRITE_TRUNCATE'
+
+    # Load the DataFrame into the warehouse (BigQuery, or DuckDB for local runs), the table is created if it doesn't exist already
+    load_job = get_sink(credentials).load(df, dataset_id, table_id, write_disposition=insert_method, autodetect=True, table_spec=table_spec, wait=wait)
 
     #print(f'Successfully loaded {load_job.output_rows} rows into {dataset_id}.{table_id}')
+    return load_job
     
-def run_batch_process():
-    try:
+def fetch_screen(row, config, metrics) -> pd.DataFrame:
+    """
+    Retrieves the screen of a screener_config.csv row.
+
+    :param row: row of screener_config.csv
+    :param config: configuration file for API access
+    :param metrics: RunMetrics of the run
+    :return: screen extract
+    """
+    screen = row['Screen_name']
+    with metrics.stage('fetch', screen=screen) as stage:
+        df_temp = run_screen(screen, row['environment'], config)
+        stage['rows'] = len(df_temp)
+    return df_temp
+
+
+def transform_screen(row, df_temp, credentials, metrics) -> pd.DataFrame:
+    """
+    Prepares an extract for BigQuery: column names, metadata, type conversion, optional dtype compaction and snapshot.
+
+    :param row: row of screener_config.csv
+    :param df_temp: screen extract, see fetch_screen
+    :param credentials: credentials of GCP service account
+    :param metrics: RunMetrics of the run
+    :return: extract ready to be loaded
+    """
+    screen = row['Screen_name']
+    env = row['environment']
+    dataset_id = row['Dataset_id']
+    table_id = row['Bigquery_table']
+
+    with metrics.stage('transform', screen=screen):
+        #Replace spaces in column names as BigQuery doesn't support it
+        df_temp.columns = df_temp.columns.str.strip().str.replace(' ', '_')
+        df_temp.columns = df_temp.columns.str.strip().str.replace('%', 'Pct')
+
+        df_temp['SourceEnv'] = env
+
+        df_temp.dropna(how='all', inplace=True)
+
+        #For reporting purposes, adding extraction timestamp
+        df_temp['repDate']  = pd.to_datetime('today')
 
-        #Get screener authentication parameters
-        with open('Screener_loader/config.json', 'r') as f:
-            data = f.read()
-        config = json.loads(data)
+        df_temp.columns = df_temp.columns.astype(str)
 
-        #Get Screener list for ingestion
-        screen_list_df = pd.read_csv('Screener_loader/screener_config.csv')
-        #Define BigQuery parameters
-        # Path to your service account key file
-        key_path = 'Screener_loader/dj-ds-marketdata-nonprod-5b2c59fc4bff.json'
-        # Load the credentials from the key file
-        service_account_credentials = service_account.Credentials.from_service_account_file(key_path)
-        df_temp = pd.DataFrame()
+    with metrics.stage('type_conversion', screen=screen, table=table_id):
+        #Aligning data types with bigquery
+        df_temp = convert_dataframe_types(df_temp, dataset_id, table_id, credentials)
 
-        for index, row in screen_list_df.iterrows():
-            if(row['Active']==1):
-                #Retrieve screener data
-                screen= row['Screen_name']
-                env = row['environment']
-                dataset_id = row['Dataset_id']
-                table_id = row['Bigquery_table']
-                history = row['History']
+    if row.get('Compact_dtypes', 0) == 1:
+        with metrics.stage('compact_dtypes', screen=screen, table=table_id) as stage:
+            #Smaller types loading into the same BigQuery column types, the memory of every column is logged
+            df_temp, dtype_report = compact_dtypes(df_temp, get_sink(credentials).get_schema(dataset_id, table_id))
+            stage['bytes_before'] = int(dtype_report['bytes_before'].sum())
+            stage['bytes_after'] = int(dtype_report['bytes_after'].sum())
+            stage['columns'] = dtype_report.to_dict('records')
 
-                df_temp = run_screen(screen,env,config)
+    with metrics.stage('snapshot', screen=screen) as stage:
+        #Local copy of the extract, validation and reloads can read it without calling Screener again
+        stage['path'] = write_snapshot(df_temp, screen, env)
 
-                #Replace spaces in column names as BigQuery doesn't support it
-                df_temp.columns = df_temp.columns.str.strip().str.replace(' ', '_')
-                df_temp.columns = df_temp.columns.str.strip().str.replace('%', 'Pct')
+    return df_temp
 
-                df_temp['SourceEnv'] = env
 
-                df_temp.dropna(how='all', inplace=True)
+def load_screen(row, df_temp, credentials, metrics, tracker : LoadJobTracker = None):
+    """
+    Loads a prepared extract into the BigQuery table of its screener_config.csv row.
+
+    :param row: row of screener_config.csv
+    :param df_temp: extract prepared by transform_screen
+    :param credentials: credentials of GCP service account
+    :param metrics: RunMetrics of the run
+    :param tracker: if provided, the load job is only submitted and registered in the tracker
+    :return: None
+    """
+    with metrics.stage('bigquery_load', screen=row['Screen_name'], table=row['Bigquery_table']) as stage:
+        #Calling bigquery function and inserting to table
+        load_job = load_to_bigquery(df_temp, row['Dataset_id'], row['Bigquery_table'], row['History'], credentials, wait=tracker is None,
+                                     table_spec=table_spec_from_row(row))
+        stage['rows'] = len(df_temp)
+        if tracker is not None:
+            stage['job_id'] = tracker.submit(load_job, screen=row['Screen_name'], table=row['Bigquery_table'])
+    metrics.count('tables_loaded')
 
-                #For reporting purposes, adding extraction timestamp
-                df_temp['repDate']  = pd.to_datetime('today')
 
-                df_temp.columns = df_temp.columns.astype(str)
+#Pipelined mode: maximum number of extracts waiting between two steps.
+#Bounds the memory held by extracts that are fetched but not loaded yet.
+PIPELINE_QUEUE_SIZE = 2
 
-                #Aligning data types with bigquery
-                df_temp = convert_dataframe_types(df_temp, dataset_id, table_id, service_account_credentials)
+async def _pipeline_worker(step_name : str, step, in_queue : asyncio.Queue, out_queue : asyncio.Queue, results : list):
+    """
+    Runs one step of the pipeline (in a worker thread) for every screen of its input queue.
+    A failing screen is recorded in results and not passed on, the other screens continue.
+    None marks the end of the input and is passed on to the next step.
+    """
+    while True:
+        item = await in_queue.get()
+        if item is None:
+            if out_queue is not None:
+                await out_queue.put(None)
+            break
+
+        position, row, df_temp = item
+        result = results[position]
+        try:
+            df_temp = await asyncio.to_thread(step, row, df_temp)
+        except Exception as e:
+            result['status'] = 'failed'
+            result['failed_step'] = step_name
+            result['error'] = str(e)
+            logging.error(f"{row['Screen_name']} failed in {step_name}: {e}")
+            continue
+
+        if out_queue is not None:
+            await out_queue.put((position, row, df_temp))
+        else:
+            result['status'] = 'loaded'
+
+async def run_pipeline(rows : list, steps : list, queue_size : int = PIPELINE_QUEUE_SIZE) -> list:
+    """
+    Processes the screens through the steps concurrently: while screen N is transformed or loaded,
+    screen N+1 is already fetched. Steps are connected by bounded queues.
 
-                #Calling bigquery function and inserting to table
-                load_to_bigquery(df_temp,dataset_id, table_id, history ,service_account_credentials)
-                
+    :param rows: active rows of screener_config.csv
+    :param steps: list of (step name, function(row, df) -> df), e.g. fetch, transform and load
+    :param queue_size: maximum number of extracts waiting between two steps
+    :return: one result per screen with its status, and the failed step and error if any
+    """
+    #A screen may be loaded into several tables, so results are kept by position
+    results = [{'screen': row['Screen_name'], 'table': row['Bigquery_table'], 'status': 'pending'} for row in rows]
+
+    #The screens to fetch are all known, only the queues after the first step are bounded
+    queues = [asyncio.Queue()] + [asyncio.Queue(maxsize=queue_size) for _ in steps[1:]]
+    for position, row in enumerate(rows):
+        queues[0].put_nowait((position, row, None))
+    queues[0].put_nowait(None)
+
+    await asyncio.gather(*[
+        _pipeline_worker(step_name, step, queues[index], queues[index + 1] if index + 1 < len(queues) else None, results)
+        for index, (step_name, step) in enumerate(steps)
+    ])
+    return results
+
+def wait_for_loads(tracker : LoadJobTracker, metrics) -> list:
+    """
+    Waits for the load jobs submitted during the run, see LoadJobTracker.wait_all.
+
+    :return: one record per load job, empty if the loads were not submitted asynchronously
+    """
+    if tracker is None:
+        return []
+    with metrics.stage('bigquery_load_wait') as stage:
+        load_results = tracker.wait_all()
+        stage['jobs'] = len(load_results)
+        stage['failed_jobs'] = sum(load_result['error'] is not None for load_result in load_results)
+        stage['output_rows'] = sum(load_result['output_rows'] or 0 for load_result in load_results)
+    for load_result in load_results:
+        logging.info(f"Load job {load_result['job_id']} into {load_result['table']}: {load_result['state']}, {load_result['output_rows']} rows in {load_result['duration_s']}s")
+    return load_results
+
+def run_batch_process(pipelined : bool = False, async_loads : bool = False):
+    """
+    Loads the active screens of screener_config.csv into BigQuery.
+
+    :param pipelined: if False, the screens are processed one after the other and the first error stops the run.
+        If True, the fetch of the next screen overlaps with the transform and load of the previous one,
+        and a failing screen does not stop the others (see run_pipeline).
+    :param async_loads: if True, load jobs are only submitted and all of them are waited for at the end of the run
+    :return: response message, per screen results in pipelined mode, load jobs in async mode and the run summary
+    """
+    #Stage timings and memory of the run, returned in the response
+    metrics = RunMetrics('Screener_loader')
+    try:
+
+        with metrics.stage('read_config'):
+            #Get screener authentication parameters
+            with open('Screener_loader/config.json', 'r') as f:
+                data = f.read()
+            config = json.loads(data)
+
+            #Get Screener list for ingestion
+            screen_list_df = pd.read_csv('Screener_loader/screener_config.csv')
+            #Define BigQuery parameters
+            # Path to your service account key file
+            key_path = 'Screener_loader/dj-ds-marketdata-nonprod-5b2c59fc4bff.json'
+            # Load the credentials from the key file
+            service_account_credentials = load_credentials(key_path)
+
+        active_rows = [row for index, row in screen_list_df.iterrows() if row['Active']==1]
+        tracker = LoadJobTracker() if async_loads else None
+
+        if pipelined:
+            steps = [
+                ('fetch', lambda row, df_temp: fetch_screen(row, config, metrics)),
+                ('transform', lambda row, df_temp: transform_screen(row, df_temp, service_account_credentials, metrics)),
+                ('bigquery_load', lambda row, df_temp: load_screen(row, df_temp, service_account_credentials, metrics, tracker)),
+            ]
+            screen_results = asyncio.run(run_pipeline(active_rows, steps))
+            load_results = wait_for_loads(tracker, metrics)
+
+            #Screens whose submitted load job failed
+            for screen_result in screen_results:
+                for load_result in load_results:
+                    if load_result['error'] and (load_result['screen'], load_result['table']) == (screen_result['screen'], screen_result['table']):
+                        screen_result.update({'status': 'failed', 'failed_step': 'bigquery_load', 'error': load_result['error']})
+
+            failed = [result['screen'] for result in screen_results if result['status'] != 'loaded']
+            if failed:
+                result = f"Job finished with errors. {len(failed)} of {len(screen_results)} screens failed: {', '.join(failed)}"
+                logging.error(result)
+            else:
+                result = "Job executed successfully"
+                logging.info(result)
+            print(result)
+            return {'response': result, 'screens': screen_results, 'load_jobs': load_results, 'run_summary': metrics.log_summary()}
+
+        for row in active_rows:
+            #Retrieve screener data, transform and load
+            df_temp = fetch_screen(row, config, metrics)
+            df_temp = transform_screen(row, df_temp, service_account_credentials, metrics)
+            load_screen(row, df_temp, service_account_credentials, metrics, tracker)
+
+        load_results = wait_for_loads(tracker, metrics)
+        failed_loads = [f"{load_result['table']}: {load_result['error']}" for load_result in load_results if load_result['error']]
+        if failed_loads:
+            raise RuntimeError(f"{len(failed_loads)} load jobs failed. {'; '.join(failed_loads)}")
 
         result = "Job executed successfully"  # TODO: Add more details and email alerts
         logging.info(result)
         print(result)
-        return {'response': result}
+        return {'response': result, 'load_jobs': load_results, 'run_summary': metrics.log_summary()}
     except Exception as e:
         # Handle any exception that occurs
         error_message = str(e)  # Convert the exception to a string message
         logging.error(error_message)
         print(error_message)
-        return {'response': error_message}    
+        return {'response': error_message, 'run_summary': metrics.log_summary()}    
 
-run_batch_process()             
+if __name__ == "__main__":
+    run_batch_process()             
             
 '''
 def execute_batch(request):
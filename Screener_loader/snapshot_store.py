@@ -0,0 +1,218 @@
+"""
+Local snapshot store of Screener extracts.
+
+Every extract is written as an uncompressed Feather (Arrow IPC) file, keyed by screen, environment,
+screen parameters and repDate. Uncompressed files can be memory-mapped, so validation, diffs and
+reloads read the columns zero-copy instead of calling Screener again.
+Layout: <SNAPSHOT_DIR>/<screen>/<environment>/<parameter hash>/<repDate>.feather
+
+A retention policy runs after every write: per screen/environment/parameters only the newest
+SNAPSHOT_KEEP_PER_SCREEN snapshots are kept, snapshots older than SNAPSHOT_MAX_AGE_DAYS are removed,
+and the oldest snapshots are removed while the store is larger than SNAPSHOT_MAX_MB.
+
+Snapshots are opt-in: SNAPSHOT_MAX_MB is 0 by default and nothing is written. On Cloud Functions /tmp is held
+in memory (shared with the feed cache), so enable them with SCREENER_SNAPSHOT_MAX_MB together with a
+SCREENER_SNAPSHOT_DIR on persistent storage, e.g. a mounted bucket.
+
+NOTE: every Cloud Function folder is deployed on its own, so this file is copied into each folder
+that uses it. Keep the copies identical.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import pandas as pd
+from lazy_imports import lazy_import
+
+#Imported on first use, see lazy_imports.py
+pa = lazy_import('pyarrow')
+feather = lazy_import('pyarrow.feather')
+
+SNAPSHOT_DIR = os.environ.get('SCREENER_SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), 'screener_snapshots'))
+#0 disables the snapshots, see the module docstring
+SNAPSHOT_MAX_MB = float(os.environ.get('SCREENER_SNAPSHOT_MAX_MB', 0))
+SNAPSHOT_MAX_AGE_DAYS = float(os.environ.get('SCREENER_SNAPSHOT_MAX_AGE_DAYS', 30))
+SNAPSHOT_KEEP_PER_SCREEN = int(os.environ.get('SCREENER_SNAPSHOT_KEEP_PER_SCREEN', 10))
+
+# Schema metadata key holding the snapshot key, so a file describes itself
+_METADATA_KEY = b'screener_snapshot'
+_REP_DATE_FORMAT = '%Y%m%dT%H%M%S%f'
+
+
+def parameter_hash(params: dict = None) -> str:
+    """
+    Returns a short stable hash of the screen parameters. Screens called without parameters share 'noparams'.
+    """
+    if not params:
+        return 'noparams'
+    source = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()[:16]
+
+
+def to_arrow(df: pd.DataFrame) -> 'pa.Table':
+    """
+    Converts the extract to an Arrow table. Screener returns JSON values, so object columns
+    with mixed types (e.g. numbers and text) are stored as text.
+    """
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        df = df.copy()
+        for col in df.columns:
+            if df[col].dtype == object:
+                df[col] = df[col].map(lambda value: value if value is None or isinstance(value, str) else str(value))
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+class SnapshotStore:
+    """
+    Writes, lists and reads Screener snapshots.
+
+    :param root: directory of the store
+    :param max_mb: maximum total size of the store in MB
+    :param max_age_days: snapshots older than this are removed
+    :param keep_per_screen: number of snapshots kept per screen, environment and parameters
+    """
+    def __init__(self, root: str = None, max_mb: float = None, max_age_days: float = None, keep_per_screen: int = None):
+        self.root = root or SNAPSHOT_DIR
+        self.max_bytes = int((SNAPSHOT_MAX_MB if max_mb is None else max_mb) * 1024 * 1024)
+        self.max_age_days = SNAPSHOT_MAX_AGE_DAYS if max_age_days is None else max_age_days
+        self.keep_per_screen = SNAPSHOT_KEEP_PER_SCREEN if keep_per_screen is None else keep_per_screen
+
+    def _folder(self, screen_name: str, environment: str, params: dict = None) -> str:
+        return os.path.join(self.root, screen_name, environment, parameter_hash(params))
+
+    def write(self, df: pd.DataFrame, screen_name: str, environment: str, params: dict = None, rep_date=None) -> str:
+        """
+        Writes the extract as a snapshot and applies the retention policy.
+
+        :param df: Screener extract
+        :param screen_name: Screener name
+        :param environment: STG or PROD
+        :param params: screen parameters of the extract, None if the screen was called without parameters
+        :param rep_date: extraction timestamp, by default the repDate column of the extract or now
+        :return: path of the snapshot file
+        """
+        if rep_date is None:
+            rep_date = df['repDate'].iloc[0] if 'repDate' in df.columns and len(df) else pd.Timestamp.now()
+        rep_date = pd.Timestamp(rep_date)
+
+        table = to_arrow(df)
+        snapshot_key = {
+            'screen_name': screen_name,
+            'environment': environment,
+            'params': params,
+            'repDate': rep_date.isoformat(),
+            'rows': table.num_rows,
+        }
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), _METADATA_KEY: json.dumps(snapshot_key, default=str).encode('utf-8')})
+
+        folder = self._folder(screen_name, environment, params)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{rep_date.strftime(_REP_DATE_FORMAT)}.feather")
+
+        # Written to a temporary file first, so readers never map a half written snapshot
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        feather.write_feather(table, temp_path, compression='uncompressed')
+        os.replace(temp_path, path)
+
+        self.apply_retention()
+        return path
+
+    def list_snapshots(self, screen_name: str = None, environment: str = None) -> pd.DataFrame:
+        """
+        Lists the snapshots of the store, newest first. Only the file footers are read.
+
+        :return: DataFrame with screen_name, environment, params, repDate, rows, bytes and path columns
+        """
+        records = []
+        for folder, _, files in os.walk(self.root):
+            for file_name in files:
+                if not file_name.endswith('.feather'):
+                    continue
+                path = os.path.join(folder, file_name)
+                try:
+                    with pa.memory_map(path, 'r') as source:
+                        schema = pa.ipc.open_file(source).schema
+                    snapshot_key = json.loads(schema.metadata[_METADATA_KEY])
+                except (OSError, KeyError, TypeError, ValueError, pa.ArrowInvalid):
+                    continue
+                if screen_name is not None and snapshot_key['screen_name'] != screen_name:
+                    continue
+                if environment is not None and snapshot_key['environment'] != environment:
+                    continue
+                records.append({**snapshot_key, 'bytes': os.path.getsize(path), 'path': path})
+
+        columns = ['screen_name', 'environment', 'params', 'repDate', 'rows', 'bytes', 'path']
+        snapshots_df = pd.DataFrame(records, columns=columns)
+        snapshots_df['repDate'] = pd.to_datetime(snapshots_df['repDate'])
+        return snapshots_df.sort_values(by='repDate', ascending=False, kind='stable').reset_index(drop=True)
+
+    def latest(self, screen_name: str, environment: str, params: dict = None):
+        """
+        Returns the path of the newest snapshot of the screen, or None if there is none.
+        """
+        folder = self._folder(screen_name, environment, params)
+        if not os.path.isdir(folder):
+            return None
+        # File names are fixed width timestamps, so the newest sorts last
+        files = sorted(file_name for file_name in os.listdir(folder) if file_name.endswith('.feather'))
+        return os.path.join(folder, files[-1]) if files else None
+
+    @staticmethod
+    def read_table(path: str, columns: list = None) -> 'pa.Table':
+        """
+        Reads a snapshot as an Arrow table backed by the memory-mapped file (zero-copy).
+        """
+        return feather.read_table(path, columns=columns, memory_map=True)
+
+    def read(self, path: str, columns: list = None) -> pd.DataFrame:
+        """
+        Reads a snapshot as a DataFrame. Columns are converted from the memory-mapped table,
+        only the requested columns are read.
+        """
+        return self.read_table(path, columns=columns).to_pandas()
+
+    def apply_retention(self) -> list:
+        """
+        Removes the snapshots not kept by the retention policy.
+
+        :return: paths of the removed snapshots
+        """
+        snapshots_df = self.list_snapshots()
+        if snapshots_df.empty:
+            return []
+
+        snapshots_df['key'] = snapshots_df['path'].map(os.path.dirname)
+        snapshots_df['rank'] = snapshots_df.groupby('key').cumcount()
+        age_days = (pd.Timestamp.now() - snapshots_df['repDate']).dt.total_seconds() / 86400
+        remove = (snapshots_df['rank'] >= self.keep_per_screen) | (age_days > self.max_age_days)
+
+        # Newest snapshots are kept while they fit the size limit, older ones are removed
+        kept_bytes = snapshots_df.loc[~remove, 'bytes'].cumsum()
+        remove |= (kept_bytes > self.max_bytes).reindex(snapshots_df.index, fill_value=False)
+
+        removed = []
+        for path in snapshots_df.loc[remove, 'path']:
+            try:
+                os.remove(path)
+                removed.append(path)
+            except OSError as e:
+                print(f"Snapshot {path} could not be removed: {e}")
+        return removed
+
+
+def write_snapshot(df: pd.DataFrame, screen_name: str, environment: str, params: dict = None):
+    """
+    Writes the extract to the default store. Failures are printed, a snapshot never stops the load.
+    Snapshots are disabled unless SCREENER_SNAPSHOT_MAX_MB is set (0 by default).
+
+    :return: path of the snapshot or None
+    """
+    if SNAPSHOT_MAX_MB <= 0 or df is None or df.empty:
+        return None
+    try:
+        return SnapshotStore().write(df, screen_name, environment, params)
+    except Exception as e:
+        print(f"Snapshot of {screen_name} could not be written: {e}")
+        return None
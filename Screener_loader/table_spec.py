@@ -0,0 +1,149 @@
+"""
+Partitioning and clustering of the BigQuery target tables.
+
+The tables are created by the first load (CREATE_IF_NEEDED). Without a spec they are neither partitioned nor
+clustered, so every dedupe or freshness query scans the full history. The spec of a table is declared in
+the config CSV of the loader:
+- Partition_field: DATE, DATETIME or TIMESTAMP column the table is partitioned on (e.g. repDate), empty for none
+- Partition_type: DAY, HOUR, MONTH or YEAR, DAY by default
+- Cluster_fields: up to 4 columns separated by ';' (e.g. FileName;SourceEnv), empty for none
+
+A new table is created by its first load with the spec. The clustering of an existing table is updated to the
+spec, BigQuery applies it to the newly loaded data. Partitioning cannot be added to an existing table, such
+tables are reported with the statement that copies them into a partitioned table.
+
+Queries filter on the partition field with a constant, so BigQuery only scans the matching partitions.
+The bytes processed and billed of every query are reported.
+
+NOTE: every Cloud Function folder is deployed on its own, so this file is copied into each folder
+that uses it. Keep the copies identical.
+"""
+import pandas as pd
+from lazy_imports import lazy_import
+
+#Imported on first use, see lazy_imports.py
+bigquery = lazy_import('google.cloud.bigquery')
+api_exceptions = lazy_import('google.api_core.exceptions')
+
+# BigQuery accepts at most 4 clustering columns
+MAX_CLUSTER_FIELDS = 4
+
+
+def table_spec_from_row(row) -> dict:
+    """
+    Reads the table spec of a config CSV row.
+
+    :param row: row of the config CSV
+    :return: dict with partition_field, partition_type and cluster_fields, or None if the row declares no spec
+    """
+    def _value(column):
+        value = row.get(column)
+        if value is None or pd.isna(value) or str(value).strip() == '':
+            return None
+        return str(value).strip()
+
+    partition_field = _value('Partition_field')
+    cluster_fields = _value('Cluster_fields')
+    cluster_fields = [field.strip() for field in cluster_fields.split(';') if field.strip()] if cluster_fields else []
+    if partition_field is None and not cluster_fields:
+        return None
+    if len(cluster_fields) > MAX_CLUSTER_FIELDS:
+        raise ValueError(f"At most {MAX_CLUSTER_FIELDS} cluster fields are supported, got {cluster_fields}")
+
+    return {
+        'partition_field': partition_field,
+        'partition_type': (_value('Partition_type') or 'DAY').upper(),
+        'cluster_fields': cluster_fields,
+    }
+
+
+def _migration_statement(project_id: str, dataset_id: str, table_id: str, spec: dict, field_type: str) -> str:
+    field, partition_type = spec['partition_field'], spec['partition_type']
+    if field_type == 'DATE':
+        partition_by = field if partition_type == 'DAY' else f"DATE_TRUNC({field}, {partition_type})"
+    else:
+        #TIMESTAMP_TRUNC or DATETIME_TRUNC
+        partition_by = f"{field_type or 'TIMESTAMP'}_TRUNC({field}, {partition_type})"
+    statement = f"CREATE TABLE `{project_id}.{dataset_id}.{table_id}_partitioned` PARTITION BY {partition_by}"
+    if spec['cluster_fields']:
+        statement += f" CLUSTER BY {', '.join(spec['cluster_fields'])}"
+    return statement + f" AS SELECT * FROM `{project_id}.{dataset_id}.{table_id}`"
+
+
+def table_load_options(client, dataset_id: str, table_id: str, spec: dict) -> dict:
+    """
+    Applies the spec to the destination table before a load.
+
+    :param client: BigQuery client
+    :param spec: table spec, see table_spec_from_row. Nothing is done if None.
+    :return: LoadJobConfig arguments creating a new table with the spec (time_partitioning, clustering_fields),
+        empty if the table already exists
+    """
+    if spec is None:
+        return {}
+
+    table_ref = client.dataset(dataset_id).table(table_id)
+    try:
+        table = client.get_table(table_ref)
+    except api_exceptions.NotFound:
+        #The first load creates the table with the spec
+        options = {}
+        if spec['partition_field']:
+            options['time_partitioning'] = bigquery.TimePartitioning(type_=spec['partition_type'], field=spec['partition_field'])
+        if spec['cluster_fields']:
+            options['clustering_fields'] = spec['cluster_fields']
+        print(f"{dataset_id}.{table_id} is created partitioned by {spec['partition_field']} and clustered by {spec['cluster_fields']}")
+        return options
+
+    if spec['cluster_fields'] and list(table.clustering_fields or []) != spec['cluster_fields']:
+        #Only newly loaded data is clustered by the new columns, BigQuery reclusters the table in the background
+        table.clustering_fields = spec['cluster_fields']
+        client.update_table(table, ['clustering_fields'])
+        print(f"Clustering of {dataset_id}.{table_id} updated to {spec['cluster_fields']}")
+
+    partitioning = table.time_partitioning
+    field_types = {field.name: field.field_type for field in table.schema}
+    if spec['partition_field'] and (partitioning is None or partitioning.field != spec['partition_field']):
+        print(f"{dataset_id}.{table_id} is not partitioned by {spec['partition_field']} and cannot be changed in place. "
+              f"Copy it with: {_migration_statement(client.project, dataset_id, table_id, spec, field_types.get(spec['partition_field']))}")
+
+    #Loads into an existing table keep its partitioning and clustering
+    return {}
+
+
+def partition_filter(client, dataset_id: str, table_id: str, since) -> str:
+    """
+    Returns a filter on the partition field keeping the partitions from the given date on.
+    The bound is a constant of the type of the partition field, so BigQuery prunes the other partitions.
+
+    :param client: BigQuery client
+    :param since: first date to keep
+    :return: SQL condition, or None if the table does not exist or is not partitioned by a column
+    """
+    try:
+        table = client.get_table(client.dataset(dataset_id).table(table_id))
+    except api_exceptions.NotFound:
+        return None
+    partitioning = table.time_partitioning
+    if partitioning is None or partitioning.field is None:
+        return None
+
+    field_types = {field.name: field.field_type for field in table.schema}
+    field_type = field_types.get(partitioning.field)
+    since = pd.Timestamp(since)
+    if field_type == 'DATE':
+        return f"{partitioning.field} >= DATE '{since:%Y-%m-%d}'"
+    if field_type in ('DATETIME', 'TIMESTAMP'):
+        return f"{partitioning.field} >= {field_type} '{since:%Y-%m-%d %H:%M:%S}'"
+    return None
+
+
+def query_stats(query_job) -> dict:
+    """
+    Returns the bytes processed and billed of a finished query job.
+    """
+    return {
+        'bytes_processed': query_job.total_bytes_processed,
+        'bytes_billed': query_job.total_bytes_billed,
+        'cache_hit': query_job.cache_hit,
+    }
@@ -0,0 +1,263 @@
+"""
+Warehouse sinks of the loaders.
+
+load_to_bigquery, the dedupe and freshness queries and the schema lookups go through a sink instead of calling
+the BigQuery client directly. Two sinks are available, selected by the WAREHOUSE_SINK environment variable:
+- bigquery (default): loads and queries the BigQuery tables, as before
+- duckdb: loads into and queries an embedded DuckDB database (WAREHOUSE_DUCKDB_PATH). Datasets are schemas of
+  the database. A full run can be executed and profiled locally, without GCP credentials and load jobs.
+  duckdb is only imported when this sink is selected, it is not needed on Cloud Functions.
+
+Queries refer to tables with sink.table_name(dataset_id, table_id) and to values with @name parameters,
+so the same query runs on both sinks.
+
+NOTE: every Cloud Function folder is deployed on its own, so this file is copied into each folder
+that uses it. Keep the copies identical.
+"""
+import os
+import re
+import uuid
+import datetime
+import tempfile
+import threading
+import pandas as pd
+from lazy_imports import lazy_import
+from table_spec import table_load_options, partition_filter, query_stats
+
+#Imported on first use, a DuckDB sink run never imports the BigQuery client (see lazy_imports.py)
+bigquery = lazy_import('google.cloud.bigquery')
+service_account = lazy_import('google.oauth2.service_account')
+api_exceptions = lazy_import('google.api_core.exceptions')
+
+WAREHOUSE_SINK = os.environ.get('WAREHOUSE_SINK', 'bigquery').lower()
+WAREHOUSE_DUCKDB_PATH = os.environ.get('WAREHOUSE_DUCKDB_PATH', os.path.join(tempfile.gettempdir(), 'warehouse.duckdb'))
+
+# Quoted string literals and identifiers, matched as a whole so an @ inside them is kept, or an @name parameter
+_QUERY_TOKEN = re.compile(r"""'(?:\\.|[^'\\])*'|"(?:\\.|[^"\\])*"|`[^`]*`|@(\w+)""")
+
+_duckdb_sinks = {}
+_duckdb_sinks_lock = threading.Lock()
+
+
+def _parameter_type(value) -> str:
+    if isinstance(value, bool):
+        return 'BOOL'
+    if isinstance(value, int):
+        return 'INT64'
+    if isinstance(value, float):
+        return 'FLOAT64'
+    if isinstance(value, (pd.Timestamp, datetime.datetime)):
+        return 'TIMESTAMP'
+    return 'STRING'
+
+
+class BigQuerySink:
+    """
+    Loads into and queries BigQuery.
+
+    :param credentials: credentials of GCP service account
+    """
+    name = 'bigquery'
+
+    def __init__(self, credentials):
+        self.project_id = credentials.project_id
+        self.client = bigquery.Client(credentials=credentials, project=credentials.project_id)
+
+    def table_name(self, dataset_id: str, table_id: str) -> str:
+        return f"`{self.project_id}.{dataset_id}.{table_id}`"
+
+    def load(self, df: pd.DataFrame, dataset_id: str, table_id: str, write_disposition: str = 'WRITE_APPEND',
+             autodetect: bool = True, table_spec: dict = None, wait: bool = True):
+        """
+        Loads the frame into the table with a load job.
+
+        :param write_disposition: WRITE_APPEND or WRITE_TRUNCATE
+        :param autodetect: if True, the schema of a new table is detected from the frame
+        :param table_spec: partitioning and clustering of a new table, see table_spec_from_row
+        :param wait: if False, the job is only submitted and the caller waits for it (see LoadJobTracker)
+        :return: load job
+        """
+        table_ref = self.client.dataset(dataset_id).table(table_id)
+        job_config = bigquery.LoadJobConfig(
+            create_disposition=bigquery.CreateDisposition.CREATE_IF_NEEDED,
+            write_disposition=write_disposition,
+            source_format=bigquery.SourceFormat.CSV,
+            autodetect=autodetect,
+            #Partitioning and clustering of a new table
+            **table_load_options(self.client, dataset_id, table_id, table_spec),
+        )
+        load_job = self.client.load_table_from_dataframe(df, table_ref, job_config=job_config)
+        if wait:
+            load_job.result()
+        return load_job
+
+    def query(self, query: str, parameters: dict = None, stats: dict = None) -> pd.DataFrame:
+        """
+        Runs the query and returns its result.
+
+        :param parameters: values of the @name parameters of the query
+        :param stats: optional dict, bytes processed and billed of the query are added to it
+        """
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter(name, _parameter_type(value), value) for name, value in (parameters or {}).items()
+        ])
+        query_job = self.client.query(query, job_config=job_config)
+        results = query_job.result().to_dataframe()
+        if stats is not None:
+            stats.update(query_stats(query_job))
+        return results
+
+    def get_schema(self, dataset_id: str, table_id: str) -> dict:
+        """
+        Returns the column types of the table, or an empty dict if the table does not exist yet.
+        """
+        try:
+            table = self.client.get_table(self.client.dataset(dataset_id).table(table_id))
+        except api_exceptions.NotFound:
+            return {}
+        return {field.name: field.field_type for field in table.schema}
+
+    def partition_filter(self, dataset_id: str, table_id: str, since) -> str:
+        """
+        Returns a filter scanning only the partitions from the given date on, see table_spec.partition_filter.
+        """
+        return partition_filter(self.client, dataset_id, table_id, since)
+
+
+class LocalLoadJob:
+    """
+    Finished load job of the DuckDB sink, with the attributes of a BigQuery load job used by the loaders.
+    """
+    def __init__(self, output_rows: int, output_bytes: int, created, ended):
+        self.job_id = f"duckdb_{uuid.uuid4().hex}"
+        self.state = 'DONE'
+        self.output_rows = output_rows
+        self.output_bytes = output_bytes
+        self.created = created
+        self.started = created
+        self.ended = ended
+
+    def done(self):
+        return True
+
+    def result(self, timeout=None):
+        return self
+
+
+class DuckDBSink:
+    """
+    Loads into and queries an embedded DuckDB database. Use get_sink, one sink is shared per database file.
+
+    :param path: database file, ':memory:' for an in-memory database
+    """
+    name = 'duckdb'
+
+    # DuckDB column types and the BigQuery types they load into
+    _BIGQUERY_TYPES = {
+        'TINYINT': 'INTEGER', 'SMALLINT': 'INTEGER', 'INTEGER': 'INTEGER', 'BIGINT': 'INTEGER', 'HUGEINT': 'INTEGER',
+        'UTINYINT': 'INTEGER', 'USMALLINT': 'INTEGER', 'UINTEGER': 'INTEGER', 'UBIGINT': 'INTEGER',
+        'FLOAT': 'FLOAT', 'DOUBLE': 'FLOAT', 'BOOLEAN': 'BOOLEAN', 'VARCHAR': 'STRING', 'DATE': 'DATE',
+        'TIMESTAMP': 'TIMESTAMP', 'TIMESTAMP WITH TIME ZONE': 'TIMESTAMP', 'TIMESTAMP_NS': 'TIMESTAMP',
+        'TIMESTAMP_MS': 'TIMESTAMP', 'TIMESTAMP_S': 'TIMESTAMP',
+    }
+
+    def __init__(self, path: str = WAREHOUSE_DUCKDB_PATH):
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError("The duckdb warehouse sink needs the duckdb package (pip install duckdb)") from e
+        self.path = path
+        self.connection = duckdb.connect(path)
+        # One connection is shared by the threads of a run (e.g. pipelined mode), its calls are serialised
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _quote(identifier: str) -> str:
+        return '"' + str(identifier).replace('"', '""') + '"'
+
+    def table_name(self, dataset_id: str, table_id: str) -> str:
+        return f"{self._quote(dataset_id)}.{self._quote(table_id)}"
+
+    def _table_exists(self, dataset_id: str, table_id: str) -> bool:
+        return self.connection.execute(
+            "SELECT count(*) FROM information_schema.tables WHERE table_schema = ? AND table_name = ?", [dataset_id, table_id]
+        ).fetchone()[0] > 0
+
+    def load(self, df: pd.DataFrame, dataset_id: str, table_id: str, write_disposition: str = 'WRITE_APPEND',
+             autodetect: bool = True, table_spec: dict = None, wait: bool = True):
+        """
+        Loads the frame into the table, see BigQuerySink.load. The load is finished when it returns.
+        DuckDB tables are not partitioned, the table spec is ignored.
+        """
+        created = datetime.datetime.now(datetime.timezone.utc)
+        # Categorical columns would become DuckDB ENUM columns, which other categories cannot be appended to
+        frame = df.astype({col: df[col].cat.categories.dtype for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)})
+        table_name = self.table_name(dataset_id, table_id)
+        view_name = f"load_{uuid.uuid4().hex}"
+
+        with self._lock:
+            self.connection.register(view_name, frame)
+            try:
+                self.connection.execute(f"CREATE SCHEMA IF NOT EXISTS {self._quote(dataset_id)}")
+                if write_disposition == 'WRITE_TRUNCATE' or not self._table_exists(dataset_id, table_id):
+                    self.connection.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM {view_name}")
+                else:
+                    #Columns are matched by name, like a BigQuery load
+                    self.connection.execute(f"INSERT INTO {table_name} BY NAME SELECT * FROM {view_name}")
+            finally:
+                self.connection.unregister(view_name)
+
+        return LocalLoadJob(len(frame), int(frame.memory_usage(deep=True).sum()), created, datetime.datetime.now(datetime.timezone.utc))
+
+    def query(self, query: str, parameters: dict = None, stats: dict = None) -> pd.DataFrame:
+        """
+        Runs the query and returns its result, see BigQuerySink.query. Nothing is billed locally.
+        """
+        # BigQuery @name parameters are DuckDB $name parameters, only outside quoted literals and identifiers
+        parameters = parameters or {}
+        query = _QUERY_TOKEN.sub(lambda match: f"${match.group(1)}" if match.group(1) in parameters else match.group(0), query)
+        with self._lock:
+            results = self.connection.execute(query, parameters).df()
+        if stats is not None:
+            stats.update({'bytes_processed': None, 'bytes_billed': 0, 'cache_hit': False})
+        return results
+
+    def get_schema(self, dataset_id: str, table_id: str) -> dict:
+        """
+        Returns the column types of the table as BigQuery types, or an empty dict if the table does not exist yet.
+        """
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT column_name, data_type FROM information_schema.columns WHERE table_schema = ? AND table_name = ? ORDER BY ordinal_position",
+                [dataset_id, table_id]
+            ).fetchall()
+        return {column: self._BIGQUERY_TYPES.get(data_type.split('(')[0], 'STRING') for column, data_type in rows}
+
+    def partition_filter(self, dataset_id: str, table_id: str, since) -> str:
+        # DuckDB tables are not partitioned
+        return None
+
+
+def load_credentials(key_path: str):
+    """
+    Returns the credentials of the service account key file. The DuckDB sink needs no credentials, None is returned.
+    """
+    if WAREHOUSE_SINK == 'duckdb':
+        return None
+    return service_account.Credentials.from_service_account_file(key_path)
+
+
+def get_sink(credentials=None):
+    """
+    Returns the sink selected by WAREHOUSE_SINK.
+
+    :param credentials: credentials of GCP service account, only used by the BigQuery sink
+    """
+    if WAREHOUSE_SINK == 'duckdb':
+        with _duckdb_sinks_lock:
+            if WAREHOUSE_DUCKDB_PATH not in _duckdb_sinks:
+                _duckdb_sinks[WAREHOUSE_DUCKDB_PATH] = DuckDBSink(WAREHOUSE_DUCKDB_PATH)
+            return _duckdb_sinks[WAREHOUSE_DUCKDB_PATH]
+    if WAREHOUSE_SINK != 'bigquery':
+        raise ValueError(f"Unknown warehouse sink: {WAREHOUSE_SINK}. Use bigquery or duckdb.")
+    return BigQuerySink(credentials)
@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import requests
+import pandas as pd
+from id_tokens import get_id_token
+
+# Set Google Application Credentials, unless they are already provided by the environment
+os.environ.setdefault('GOOGLE_APPLICATION_CREDENTIALS', 'Utilities/dj-ds-marketdata-nonprod-5b2c59fc4bff.json')
+
+# List of Cloud Functions to call. Targets of the same stage run concurrently, stages run one after the other.
+TARGETS_FILE = 'Utilities/invoke_targets.csv'
+
+def read_targets(targets_file: str) -> pd.DataFrame:
+    """
+    Reads the active invocation targets from the target configuration file.
+
+    :param targets_file: path of the CSV with Target_name, Audience_url, Method, Payload, Stage, Success_text and Active columns
+    :return: active targets ordered by stage
+    """
+    targets_df = pd.read_csv(targets_file, dtype=str, keep_default_na=False)
+    targets_df['Active'] = pd.to_numeric(targets_df['Active'])
+    targets_df['Stage'] = pd.to_numeric(targets_df['Stage'])
+
+    #Keeping only targets that are selected to be active by the user
+    targets_df = targets_df.loc[targets_df['Active'] == 1]
+
+    return targets_df.sort_values(by='Stage', kind='stable')
+
+async def get_id_token_async(audience_url: str, token_locks: dict) -> str:
+    """
+    Returns the identity token of the audience. Concurrent calls for the same audience wait for a single fetch.
+    """
+    lock = token_locks.setdefault(audience_url, asyncio.Lock())
+    async with lock:
+        return await asyncio.to_thread(get_id_token, audience_url)
+
+async def invoke_target(target: dict, semaphore: asyncio.Semaphore, token_locks: dict, timeout: float) -> dict:
+    """
+    Calls one Cloud Function and measures the call.
+
+    :param target: row of the target configuration file
+    :param semaphore: limits the number of calls in flight
+    :param token_locks: per audience locks of the token cache
+    :param timeout: request timeout in seconds
+    :return: target name, status code, success flag, latency, response size and error message
+    """
+    result = {
+        'Target_name': target['Target_name'],
+        'Stage': target['Stage'],
+        'status_code': None,
+        'success': False,
+        'latency_s': None,
+        'response_bytes': None,
+        'message': '',
+    }
+
+    #A malformed payload only fails its own target, the other targets of the stage are still called
+    try:
+        payload = json.loads(target['Payload']) if target['Payload'] else None
+    except ValueError as e:
+        result['message'] = f"Invalid JSON payload: {e}"
+        return result
+
+    async with semaphore:
+        try:
+            token = await get_id_token_async(target['Audience_url'], token_locks)
+        except Exception as e:
+            result['message'] = f"Error fetching ID token: {e}"
+            return result
+
+        start = time.perf_counter()
+        try:
+            response = await asyncio.to_thread(
+                requests.request,
+                target['Method'] or 'GET',
+                target['Audience_url'],
+                headers={
+                    'Authorization': f"Bearer {token}",
+                    'Content-Type': 'application/json'
+                },
+                json=payload,
+                timeout=timeout
+            )
+        except Exception as e:
+            result['latency_s'] = round(time.perf_counter() - start, 3)
+            result['message'] = f"Error making the API call: {e}"
+            return result
+
+    result['latency_s'] = round(time.perf_counter() - start, 3)
+    result['status_code'] = response.status_code
+    result['response_bytes'] = len(response.content)
+
+    #The batch functions report errors with status 200, so the response text is checked as well
+    success_text = target['Success_text']
+    result['success'] = response.status_code == 200 and (not success_text or success_text in response.text)
+    result['message'] = response.text[:200].replace('\n', ' ')
+
+    return result
+
+async def invoke_targets(targets_df: pd.DataFrame, max_concurrency: int, timeout: float, stop_on_failure: bool) -> pd.DataFrame:
+    """
+    Calls the targets stage by stage. Targets within a stage are called concurrently, at most max_concurrency at a time.
+
+    :param targets_df: active targets, see read_targets
+    :param max_concurrency: maximum number of calls in flight
+    :param timeout: request timeout in seconds
+    :param stop_on_failure: if True, later stages are skipped when a target of the current stage failed
+    :return: one row per target with status, latency and response size
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    token_locks = {}
+    results = []
+
+    for stage, stage_df in targets_df.groupby('Stage', sort=True):
+        print(f"Starting stage {stage}: {', '.join(stage_df['Target_name'])}")
+        stage_results = await asyncio.gather(*[
+            invoke_target(target, semaphore, token_locks, timeout) for target in stage_df.to_dict('records')
+        ])
+        results.extend(stage_results)
+
+        if stop_on_failure and not all(result['success'] for result in stage_results):
+            print(f"Stage {stage} failed, later stages are skipped")
+            break
+
+    return pd.DataFrame(results)
+
+def main():
+    parser = argparse.ArgumentParser(description='Invokes the configured Cloud Functions concurrently and reports the results.')
+    parser.add_argument('--targets', default=TARGETS_FILE, help='target configuration CSV')
+    parser.add_argument('--max-concurrency', type=int, default=4, help='maximum number of calls in flight')
+    parser.add_argument('--timeout', type=float, default=540, help='request timeout in seconds')
+    parser.add_argument('--stop-on-failure', action='store_true', help='skip later stages if a stage failed')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    targets_df = read_targets(args.targets)
+    if targets_df.empty:
+        print("No active targets found.")
+        return 0
+
+    start = time.perf_counter()
+    results_df = asyncio.run(invoke_targets(targets_df, args.max_concurrency, args.timeout, args.stop_on_failure))
+    total_s = round(time.perf_counter() - start, 3)
+
+    if args.json:
+        print(json.dumps({'total_s': total_s, 'targets': results_df.to_dict('records')}, indent=2))
+    else:
+        pd.set_option('display.max_columns', None)
+        pd.set_option('display.width', 200)
+        print(results_df.drop(columns=['message']).to_string(index=False))
+        for result in results_df.loc[~results_df['success']].to_dict('records'):
+            print(f"{result['Target_name']} failed: {result['message']}")
+        print(f"Total wall time: {total_s}s")
+
+    return 0 if len(results_df) == len(targets_df) and results_df['success'].all() else 1
+
+# Execute the function
+if __name__ == "__main__":
+    sys.exit(main())
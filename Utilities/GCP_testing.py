@@ -1,71 +1,360 @@
-from google.cloud import bigquery
 import pandas as pd
 import os
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+import re
+import datetime
+from functools import lru_cache
+from lazy_imports import lazy_import
+
+#Imported on first use, the BigQuery and the Sheets helpers need different clients (see lazy_imports.py)
+bigquery = lazy_import('google.cloud.bigquery')
+pa = lazy_import('pyarrow')
+service_account = lazy_import('google.oauth2.service_account')
+discovery = lazy_import('googleapiclient.discovery')
 
 
 # 1. Set the environment variable for credentials in Python
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "Utilities/dj-ds-marketdata-nonprod-5b2c59fc4bff.json"
 
 
+#Operators accepted in the filters of the chunked reader. Values are always passed as query parameters.
+FILTER_OPERATORS = {'=', '!=', '<', '<=', '>', '>=', 'IN', 'NOT IN'}
+
+#Mapping of Python types to BigQuery query parameter types
+PARAMETER_TYPES = [
+    (bool, 'BOOL'),
+    (int, 'INT64'),
+    (float, 'FLOAT64'),
+    (datetime.datetime, 'TIMESTAMP'),
+    (datetime.date, 'DATE'),
+    (str, 'STRING'),
+]
+
+def _quote_identifier(name: str) -> str:
+    """
+    Validates a column name and wraps it in backticks, so it can be safely embedded in the query text.
+    """
+    if not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', name):
+        raise ValueError(f"Invalid column name: '{name}'")
+    return f"`{name}`"
+
+def _parameter_type(value) -> str:
+    """
+    Returns the BigQuery type of a filter value.
+    """
+    for python_type, bq_type in PARAMETER_TYPES:
+        if isinstance(value, python_type):
+            return bq_type
+    raise TypeError(f"Unsupported filter value type: {type(value).__name__}")
+
+def build_filtered_query(
+    project_id: str,
+    dataset_id: str,
+    table_id: str,
+    columns: list = None,
+    filters: list = None
+):
+    """
+    Builds a SELECT statement with column projection and a parameterised WHERE clause.
+
+    Args:
+        project_id (str): GCP project ID.
+        dataset_id (str): BigQuery dataset ID.
+        table_id (str): BigQuery table ID.
+        columns (list, optional): Columns to select. If None, all columns are selected.
+        filters (list, optional): List of (column, operator, value) tuples combined with AND,
+            e.g. [('status', '=', 'Done'), ('priority', 'IN', ['P1', 'P2'])].
+
+    Returns:
+        tuple: query text and the list of query parameters.
+    """
+    select_list = ', '.join(_quote_identifier(col) for col in columns) if columns else '*'
+    query = f"SELECT {select_list} FROM `{project_id}.{dataset_id}.{table_id}`"
+
+    conditions = []
+    query_parameters = []
+    for index, (column, operator, value) in enumerate(filters or []):
+        operator = operator.upper().strip()
+        if operator not in FILTER_OPERATORS:
+            raise ValueError(f"Unsupported filter operator: '{operator}'")
+
+        param_name = f"p{index}"
+        if operator in ('IN', 'NOT IN'):
+            values = list(value)
+            if not values:
+                raise ValueError(f"Empty value list for filter on '{column}'")
+            query_parameters.append(bigquery.ArrayQueryParameter(param_name, _parameter_type(values[0]), values))
+            conditions.append(f"{_quote_identifier(column)} {operator} UNNEST(@{param_name})")
+        else:
+            query_parameters.append(bigquery.ScalarQueryParameter(param_name, _parameter_type(value), value))
+            conditions.append(f"{_quote_identifier(column)} {operator} @{param_name}")
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    return query, query_parameters
+
+def read_bq_record_batches(
+    project_id: str,
+    dataset_id: str,
+    table_id: str,
+    columns: list = None,
+    filters: list = None,
+    page_size: int = 50000,
+    client=None
+):
+    """
+    Runs the projected and filtered query and yields the result pages as Arrow record batches.
+
+    Args:
+        project_id (str): GCP project ID.
+        dataset_id (str): BigQuery dataset ID.
+        table_id (str): BigQuery table ID.
+        columns (list, optional): Columns to select. If None, all columns are selected.
+        filters (list, optional): List of (column, operator, value) tuples, see build_filtered_query.
+        page_size (int): Number of rows requested per result page.
+        client (bigquery.Client, optional): Existing client, e.g. a local stand-in. A new client is created if None.
+
+    Yields:
+        pyarrow.RecordBatch: One record batch per result page.
+    """
+    if client is None:
+        client = bigquery.Client(project=project_id)
+
+    query, query_parameters = build_filtered_query(project_id, dataset_id, table_id, columns, filters)
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+
+    query_job = client.query(query, job_config=job_config)
+    rows = query_job.result(page_size=page_size)
+
+    yield from rows.to_arrow_iterable()
+
+def read_bq_table_in_chunks(
+    project_id: str,
+    dataset_id: str,
+    table_id: str,
+    columns: list = None,
+    filters: list = None,
+    page_size: int = 50000,
+    client=None
+):
+    """
+    Reads a BigQuery (external) table page by page and yields every page as a typed DataFrame.
+    Only the selected columns and the rows matching the filters are returned by BigQuery,
+    and only one page is held in memory at a time.
+
+    Args:
+        See read_bq_record_batches.
+
+    Yields:
+        pd.DataFrame: One DataFrame per result page, with Arrow-backed column types.
+    """
+    # Each page is converted from Arrow directly, keeping the BigQuery types instead of Python objects
+    for record_batch in read_bq_record_batches(project_id, dataset_id, table_id, columns, filters, page_size, client):
+        yield record_batch.to_pandas(types_mapper=pd.ArrowDtype)
+
 def read_bq_external_table_to_df(
     project_id: str, 
     dataset_id: str, 
-    table_id: str
+    table_id: str,
+    columns: list = None,
+    filters: list = None,
+    page_size: int = 50000,
+    client=None,
+    arrow_dtypes: bool = False
 ) -> pd.DataFrame:
     """
-    Reads all rows from a BigQuery EXTERNAL table into a pandas DataFrame
-    by running a SELECT * query.
-    """
-    client = bigquery.Client(project=project_id)
-    
-    # Construct fully-qualified table name
-    table_full_name = f"`{project_id}.{dataset_id}.{table_id}`"
-    
-    # Build a simple query against the external table
-    query = f"SELECT * FROM {table_full_name}"
-    
-    # Run the query, then convert to DataFrame
-    query_job = client.query(query)
-    df = query_job.to_dataframe()
-    
+    Reads the rows of a BigQuery EXTERNAL table into a pandas DataFrame.
+    Column projection and filters are pushed down to BigQuery, see read_bq_record_batches.
+    The whole result is held in memory, use read_bq_table_in_chunks to process large tables page by page.
+
+    Args:
+        See read_bq_record_batches.
+        arrow_dtypes (bool): If True, the columns keep the BigQuery types as pd.ArrowDtype.
+            By default the columns have the numpy dtypes of query_job.to_dataframe().
+
+    Returns:
+        pd.DataFrame: All rows of the result.
+    """
+    record_batches = list(read_bq_record_batches(project_id, dataset_id, table_id, columns, filters, page_size, client))
+
+    if not record_batches:
+        return pd.DataFrame(columns=columns)
+
+    # The pages are only stitched together in Arrow, so the data is converted to pandas once
+    table = pa.Table.from_batches(record_batches)
+    df = table.to_pandas(types_mapper=pd.ArrowDtype) if arrow_dtypes else table.to_pandas()
+
     return df
 
-def read_sheet_to_dataframe(credentials_file, spreadsheet_id, range_name):
+# Define the required OAuth scope for read-only Sheets access
+SHEETS_SCOPES = ('https://www.googleapis.com/auth/spreadsheets.readonly',)
+
+#Cell values treated as booleans when a whole column consists of them
+BOOLEAN_VALUES = {'TRUE': True, 'FALSE': False}
+
+#Number of cells parsed before a whole column is tried as datetime
+DATETIME_PROBE_SIZE = 50
+
+#Numbers with a leading zero (e.g. '007'), such columns are identifiers and stay text
+ZERO_PADDED_PATTERN = r'[+-]?0[0-9][0-9,]*(\.[0-9]*)?'
+
+@lru_cache(maxsize=None)
+def get_sheets_service(credentials_file: str):
     """
-    Reads data from a Google Sheet (via the Sheets API) into a pandas DataFrame.
+    Returns a Google Sheets API client for the given service account.
+    The client is built once per credentials file and reused by later calls.
 
     Args:
         credentials_file (str): Path to your service account JSON key file.
-        spreadsheet_id (str): The Google Spreadsheet ID (the part of the URL after 'spreadsheets/d/').
-        range_name (str): The sheet range to read (e.g. "Sheet1!A1:C100").
 
     Returns:
-        pd.DataFrame: A DataFrame containing the sheet data.
+        googleapiclient.discovery.Resource: Sheets API client.
     """
-    # Define the required OAuth scope for read-only Sheets access
-    SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
-
     # 1. Create Credentials from the service account JSON key
-    creds = service_account.Credentials.from_service_account_file(credentials_file, scopes=SCOPES)
+    creds = service_account.Credentials.from_service_account_file(credentials_file, scopes=list(SHEETS_SCOPES))
 
     # 2. Build the Google Sheets API client
-    service = build('sheets', 'v4', credentials=creds)
+    return discovery.build('sheets', 'v4', credentials=creds, cache_discovery=False)
+
+def coerce_column_types(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Infers the type of every string column of a sheet extract and converts it.
+    Each column is checked with one vectorised conversion per candidate type, in the order
+    boolean, integer, float, datetime. A column only changes type if every non-empty cell converts.
+    Columns of numbers with a leading zero (e.g. '007') stay text, so zero-padded identifiers keep their zeros.
 
-    # 3. Call the Sheets API to fetch values
-    sheet = service.spreadsheets()
-    result = sheet.values().get(spreadsheetId=spreadsheet_id, range=range_name).execute()
-    values = result.get('values', [])  # List of lists
+    Args:
+        df (pd.DataFrame): DataFrame of cell values as returned by the Sheets API.
 
-    if not values:
-        print("No data found in the specified range.")
-        return pd.DataFrame()
+    Returns:
+        pd.DataFrame: DataFrame with nullable typed columns. Empty cells become missing values.
 
-    # 4. Convert the 2D list to a DataFrame
-    #    Assuming the first row is the header
-    df = pd.DataFrame(values[1:], columns=values[0])
-    return df
+    Raises:
+        ValueError: If column names are repeated, see _values_to_dataframe.
+    """
+    duplicated = df.columns[df.columns.duplicated()].unique()
+    if len(duplicated):
+        raise ValueError(f"Repeated column names: {', '.join(map(str, duplicated))}")
+
+    converted = {}
+    for col in df.columns:
+        values = df[col].astype('string').str.strip().replace('', pd.NA)
+        non_empty = values.notna()
+
+        if not non_empty.any():
+            converted[col] = values
+            continue
+
+        upper_values = values.str.upper()
+        if upper_values[non_empty].isin(BOOLEAN_VALUES.keys()).all():
+            converted[col] = upper_values.map(BOOLEAN_VALUES).astype('boolean')
+            continue
+
+        numeric_values = pd.to_numeric(values.str.replace(',', '', regex=False), errors='coerce')
+        if numeric_values[non_empty].notna().all():
+            # Zero-padded numbers would lose their leading zeros, pandas would also read them as dates
+            if values[non_empty].str.fullmatch(ZERO_PADDED_PATTERN).any():
+                converted[col] = values
+                continue
+            if (numeric_values[non_empty] % 1 == 0).all():
+                converted[col] = numeric_values.astype('Int64')
+            else:
+                converted[col] = numeric_values.astype('Float64')
+            continue
+
+        # Mixed-format date parsing is slow on non-date text, so a small sample is checked first
+        sample = values[non_empty].head(DATETIME_PROBE_SIZE)
+        if pd.to_datetime(sample, errors='coerce', format='mixed').notna().all():
+            datetime_values = pd.to_datetime(values, errors='coerce', format='mixed')
+            if datetime_values[non_empty].notna().all():
+                converted[col] = datetime_values
+                continue
+
+        converted[col] = values
+
+    return pd.DataFrame(converted, index=df.index)
+
+def _values_to_dataframe(values: list) -> pd.DataFrame:
+    """
+    Converts the 2D list of a Sheets range into a DataFrame, assuming the first row is the header.
+    The Sheets API omits trailing empty cells, so short rows are padded to the header width.
+    Repeated header names get a suffix as in pandas.read_csv ('Name', 'Name.1', ...).
+    """
+    header = []
+    seen = {}
+    for name in values[0]:
+        name = str(name)
+        candidate = name
+        while candidate in seen:
+            seen[name] += 1
+            candidate = f"{name}.{seen[name]}"
+        seen[candidate] = 0
+        header.append(candidate)
+    width = len(header)
+    rows = [row[:width] + [''] * (width - len(row)) for row in values[1:]]
+    return pd.DataFrame(rows, columns=header)
+
+def read_sheet_ranges_to_dataframes(
+    credentials_file: str,
+    spreadsheet_id: str,
+    range_names: list,
+    coerce_types: bool = True,
+    service=None
+) -> dict:
+    """
+    Reads several ranges of a Google Sheet with a single batchGet call.
+
+    Args:
+        credentials_file (str): Path to your service account JSON key file.
+        spreadsheet_id (str): The Google Spreadsheet ID (the part of the URL after 'spreadsheets/d/').
+        range_names (list): The sheet ranges to read (e.g. ["Data!A1:M", "Config!A1:B20"]).
+        coerce_types (bool): If True, column types are inferred and converted, see coerce_column_types.
+        service (optional): Sheets API client, e.g. a local fake. The cached client is used if None.
+
+    Returns:
+        dict: range name -> DataFrame. Ranges without data are returned as empty DataFrames.
+    """
+    if service is None:
+        service = get_sheets_service(credentials_file)
+
+    # Call the Sheets API to fetch all ranges in one round-trip
+    result = service.spreadsheets().values().batchGet(
+        spreadsheetId=spreadsheet_id,
+        ranges=list(range_names),
+        majorDimension='ROWS'
+    ).execute()
+
+    # The API normalises the returned range names, but keeps the requested order
+    value_ranges = result.get('valueRanges', [])
+
+    output = {}
+    for range_name, value_range in zip(range_names, value_ranges):
+        values = value_range.get('values', [])  # List of lists
+        if not values:
+            print(f"No data found in the range {range_name}.")
+            output[range_name] = pd.DataFrame()
+            continue
+
+        df = _values_to_dataframe(values)
+        output[range_name] = coerce_column_types(df) if coerce_types else df
+
+    return output
+
+def read_sheet_to_dataframe(credentials_file, spreadsheet_id, range_name, coerce_types=True, service=None):
+    """
+    Reads data from a Google Sheet (via the Sheets API) into a pandas DataFrame.
+
+    Args:
+        credentials_file (str): Path to your service account JSON key file.
+        spreadsheet_id (str): The Google Spreadsheet ID (the part of the URL after 'spreadsheets/d/').
+        range_name (str): The sheet range to read (e.g. "Sheet1!A1:C100").
+        coerce_types (bool): If True, column types are inferred and converted, see coerce_column_types.
+        service (optional): Sheets API client, e.g. a local fake. The cached client is used if None.
+
+    Returns:
+        pd.DataFrame: A DataFrame containing the sheet data.
+    """
+    return read_sheet_ranges_to_dataframes(credentials_file, spreadsheet_id, [range_name], coerce_types, service)[range_name]
 
 if __name__ == "__main__":
     # Example usage
@@ -77,6 +366,10 @@ if __name__ == "__main__":
     #print("DataFrame shape:", df.shape)
     #print(df.head())
 
+    #Reading only the required columns and rows, one page at a time
+    #for chunk_df in read_bq_table_in_chunks(PROJECT_ID, DATASET_ID, TABLE_ID, columns=['key', 'status'], filters=[('status', '!=', 'Done')]):
+    #    print("Chunk shape:", chunk_df.shape)
+
     SPREADSHEET_ID = "13DHio9dWwO4YyrqdX7YF9UvoW4uZc-Db6TT_qn-ykIg"
 
     # 2. The range, e.g., "Sheet1!A1:D" for columns A-D with dynamic row length
@@ -88,3 +381,8 @@ if __name__ == "__main__":
     # Fetch the data into a DataFrame
     df = read_sheet_to_dataframe(SERVICE_ACCOUNT_FILE, SPREADSHEET_ID, RANGE_NAME)
     print(df.head())
+
+    # Fetch several ranges in one call, reusing the same Sheets client
+    #sheet_dfs = read_sheet_ranges_to_dataframes(SERVICE_ACCOUNT_FILE, SPREADSHEET_ID, [RANGE_NAME, "Config!A1:B20"])
+    #for range_name, range_df in sheet_dfs.items():
+    #    print(range_name, range_df.dtypes)